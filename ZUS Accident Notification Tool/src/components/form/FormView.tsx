@@ -1,9 +1,9 @@
-import { useState } from "react";
+import { useRef, useState } from "react";
 import FormSection from "@/components/form/FormSection";
 import { formConfig } from "@/config/formConfig";
 import { useFormSync } from "@/hooks/useFormSync";
 import { useChat } from "@/context/ChatContext";
-import type { ActionStep } from "@/types";
+import type { ActionPlanStatus, ActionStep } from "@/types";
 
 const formatActionsForChat = (actions: ActionStep[]): string => {
   if (!actions.length) {
@@ -39,26 +39,39 @@ const formatActionsForChat = (actions: ActionStep[]): string => {
   return `Plan działania po zgłoszeniu:\n\n${items}`;
 };
 
-const decodeActionsHeader = (header: string): ActionStep[] => {
-  try {
-    const binary = atob(header);
-    const bytes = Uint8Array.from(binary, (char) => char.charCodeAt(0));
-    const text = new TextDecoder("utf-8").decode(bytes);
-    const parsed = JSON.parse(text);
-    return Array.isArray(parsed) ? (parsed as ActionStep[]) : [];
-  } catch (error) {
-    console.error("Nie udało się zdekodować nagłówka X-ZANT-Actions:", error);
-    return [];
+const ACTION_PLAN_POLL_INTERVAL_MS = 1500;
+const ACTION_PLAN_MAX_POLLS = 40;
+
+// Plan działań jest liczony w tle – odpytujemy backend, aż będzie gotowy.
+const fetchActionPlan = async (key: string): Promise<ActionStep[]> => {
+  for (let attempt = 0; attempt < ACTION_PLAN_MAX_POLLS; attempt++) {
+    const response = await fetch(
+      `http://localhost:8000/api/case/action-plan/${key}`
+    );
+    if (response.status === 200) {
+      const plan: ActionPlanStatus = await response.json();
+      return plan.status === "ready" ? plan.actions : [];
+    }
+    if (response.status !== 202) {
+      console.error("Nie udało się pobrać planu działań:", response.status);
+      return [];
+    }
+    await new Promise((resolve) =>
+      setTimeout(resolve, ACTION_PLAN_POLL_INTERVAL_MS)
+    );
   }
+  return [];
 };
 
 function FormView() {
   const { localState, handleFieldChange, handleFieldBlur } =
     useFormSync(formConfig);
-  const { appendAssistantMessage } = useChat();
+  const { appendAssistantMessage, caseId } = useChat();
 
   // Stan do obsługi blokady przycisku podczas generowania
   const [isDownloading, setIsDownloading] = useState(false);
+  // Ostatnio pobrana paczka – przy niezmienionych danych backend odpowie 304.
+  const lastBundle = useRef<{ etag: string; blob: Blob } | null>(null);
 
   const handleDownload = async () => {
     try {
@@ -99,24 +112,32 @@ function FormView() {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
+            "X-ZANT-Case-Id": caseId,
+            ...(lastBundle.current
+              ? { "If-None-Match": lastBundle.current.etag }
+              : {}),
           },
           body: JSON.stringify(payload),
         }
       );
 
-      if (!response.ok) {
+      if (!response.ok && response.status !== 304) {
         // Logowanie błędu, jeśli nadal występuje
         const errorData = await response.json().catch(() => ({}));
         console.error("Backend error details:", errorData);
         throw new Error("Błąd walidacji danych (422)");
       }
 
-      const actionsHeader = response.headers.get("X-ZANT-Actions");
-      const stepsFromBackend = actionsHeader
-        ? decodeActionsHeader(actionsHeader)
-        : [];
+      const actionPlanKey = response.headers.get("X-ZANT-Actions-Key");
 
-      const blob = await response.blob();
+      let blob: Blob;
+      if (response.status === 304 && lastBundle.current) {
+        blob = lastBundle.current.blob;
+      } else {
+        blob = await response.blob();
+        const etag = response.headers.get("ETag");
+        lastBundle.current = etag ? { etag, blob } : null;
+      }
       const url = window.URL.createObjectURL(blob);
       const link = document.createElement("a");
       link.href = url;
@@ -127,8 +148,13 @@ function FormView() {
       link.remove();
       window.URL.revokeObjectURL(url);
 
-      if (stepsFromBackend.length) {
-        appendAssistantMessage(formatActionsForChat(stepsFromBackend));
+      if (actionPlanKey) {
+        // Nie blokujemy przycisku na czas liczenia planu.
+        fetchActionPlan(actionPlanKey).then((steps) => {
+          if (steps.length) {
+            appendAssistantMessage(formatActionsForChat(steps));
+          }
+        });
       }
     } catch (error) {
       console.error("Download error:", error);
@@ -6,7 +6,12 @@ import React, {
   useMemo,
 } from "react";
 import type { ReactNode } from "react";
-import type { CaseState, ChatTurn, AssistantResponse } from "../types";
+import type {
+  CaseState,
+  ChatTurn,
+  AssistantResponse,
+  ConversationMemory,
+} from "../types";
 import { v4 as uuidv4 } from "uuid";
 
 import pkdList from "@/../data/pkd.json";
@@ -16,9 +21,15 @@ const STORAGE_KEYS = {
   MESSAGES: "zant_chat_history",
   CASE_STATE: "zant_case_state",
   CASE_ID: "zant_case_id",
+  MEMORY: "zant_chat_memory",
 };
 
+// Gdy backend zwrócił pamięć rozmowy (streszczenie + pominięte pola),
+// wystarczy mu końcówka historii – starsze wiadomości są w streszczeniu.
+const HISTORY_WINDOW = 10;
+
 interface ChatContextType {
+  caseId: string;
   messages: ChatTurn[];
   caseState: CaseState;
   setCaseState: React.Dispatch<React.SetStateAction<CaseState>>;
@@ -72,6 +83,17 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
     }
   });
 
+  // 4. Pamięć rozmowy zwracana przez backend (odsyłamy ją z kolejną wiadomością)
+  const [memory, setMemory] = useState<ConversationMemory | null>(() => {
+    try {
+      const savedMemory = localStorage.getItem(STORAGE_KEYS.MEMORY);
+      return savedMemory ? JSON.parse(savedMemory) : null;
+    } catch (e) {
+      console.error("Błąd parsowania pamięci rozmowy:", e);
+      return null;
+    }
+  });
+
   const [isLoading, setIsLoading] = useState(false);
   const [missingFields, setMissingFields] = useState<string[]>([]);
 
@@ -87,6 +109,13 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
     localStorage.setItem(STORAGE_KEYS.CASE_STATE, JSON.stringify(caseState));
   }, [caseState]);
 
+  // Zapisz pamięć rozmowy
+  useEffect(() => {
+    if (memory) {
+      localStorage.setItem(STORAGE_KEYS.MEMORY, JSON.stringify(memory));
+    }
+  }, [memory]);
+
   // --- PKD ---
   const pkdMap = useMemo(() => {
     const map = new Map<string, string>();
@@ -128,8 +157,10 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
         case_id: caseId, // Używamy stałego ID z pamięci!
         message: text,
         mode: "notification",
-        conversation_history: messages, // Wysyłamy historię sprzed dodania userMessage (lub dodaj userMessage tutaj jeśli backend tego wymaga)
+        // Historia sprzed dodania userMessage; z pamięcią wystarczy jej końcówka.
+        conversation_history: memory ? messages.slice(-HISTORY_WINDOW) : messages,
         case_state: caseState,
+        memory,
       };
 
       const response = await fetch(
@@ -150,6 +181,7 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
         { role: "assistant", content: data.assistant_reply },
       ]);
       setCaseState(data.case_state_preview);
+      if (data.memory) setMemory(data.memory);
       setMissingFields(data.missing_fields.map((m) => m.field));
     } catch (error) {
       console.error(error);
@@ -170,6 +202,7 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
     localStorage.removeItem(STORAGE_KEYS.MESSAGES);
     localStorage.removeItem(STORAGE_KEYS.CASE_STATE);
     localStorage.removeItem(STORAGE_KEYS.CASE_ID);
+    localStorage.removeItem(STORAGE_KEYS.MEMORY);
     window.location.reload(); // Najprostszy sposób na reset stanu
   };
 
@@ -180,6 +213,7 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
   return (
     <ChatContext.Provider
       value={{
+        caseId,
         messages,
         caseState,
         setCaseState,
@@ -72,12 +72,40 @@ export interface ActionStep {
   required_documents: string[];
 }
 
+// Metadane tury rozmowy (o co pytał asystent, jak sklasyfikowano odpowiedź)
+export interface TurnMeta {
+  turn: number;
+  asked?: string | null;
+  asked_fields: string[];
+  kind: "data" | "text" | "navigation" | "refusal";
+  filled: string[];
+  skipped: string[];
+}
+
+// Pamięć rozmowy utrzymywana przez backend (odsyłana z kolejną wiadomością)
+export interface ConversationMemory {
+  history_length: number;
+  summarized: number;
+  summary: string;
+  skipped_fields: string[];
+  turns: TurnMeta[];
+}
+
 // Odpowiedź z Twojego API
 export interface AssistantResponse {
   assistant_reply: string;
   missing_fields: MissingField[];
   case_state_preview: CaseState;
   recommended_actions?: ActionStep[];
+  action_plan_key?: string | null;
+  memory?: ConversationMemory | null;
+}
+
+// Plan działań liczony w tle (GET /api/case/action-plan/{key})
+export interface ActionPlanStatus {
+  key: string;
+  status: "pending" | "ready" | "failed";
+  actions: ActionStep[];
 }
 
 export interface FormFieldOption {
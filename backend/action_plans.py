@@ -0,0 +1,166 @@
+"""
+Plany działań po zgłoszeniu liczone w tle i trzymane w pamięci podręcznej.
+
+Plan jest kluczowany skrótem (SHA-256) kanonicznego JSON-a `CaseState`, więc ten
+sam stan sprawy nie uruchamia LLM drugi raz. Obliczenie startuje, gdy sprawa
+jest kompletna (ostatnia odpowiedź asystenta) albo przy pobieraniu dokumentów;
+klient odpytuje `GET /api/case/action-plan/{key}` zamiast czekać na ZIP.
+
+Przy kilku procesach roboczych (`serve.py`) plany trafiają też do pamięci
+współdzielonej (`shared_cache.py`): odpytanie może trafić do innego workera niż
+zlecenie, a worker, który zaczął liczyć plan, zostawia znacznik "pending",
+więc pozostałe nie wywołują LLM drugi raz. Publikujemy tylko plany gotowe
+i niepuste – po błędzie LLM (albo pustym planie) znacznik jest usuwany, żeby
+chwilowa awaria nie zostawiła pustego planu w pamięci na cały ZANT_CACHE_TTL.
+Metody dotykające pliku SQLite (`get`, `submit`) wywołujemy z wątku, nie
+z pętli zdarzeń.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+from metrics import QUEUE_DEPTH
+from shared_cache import shared_cache
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+# Ile planów trzymamy w pamięci (najdawniej używane wypadają pierwsze).
+MAX_PLANS = int(os.getenv("ZANT_ACTION_PLAN_CACHE_SIZE", "1024"))
+PLAN_WORKERS = int(os.getenv("ZANT_ACTION_PLAN_WORKERS", "4"))
+# Po tylu sekundach znacznik "pending" wygasa (np. worker liczący plan padł).
+PENDING_TTL_S = 300.0
+SHARED_NAMESPACE = "action_plan"
+
+
+def case_state_key(state: BaseModel) -> str:
+    """Skrót kanonicznej postaci stanu sprawy (posortowane klucze, bez spacji)."""
+    canonical = json.dumps(
+        state.model_dump(mode="json"), ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PlanEntry:
+    key: str
+    status: str = STATUS_PENDING
+    actions: list[Any] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "key": self.key,
+            "status": self.status,
+            "actions": [a.model_dump(mode="json") if isinstance(a, BaseModel) else a for a in self.actions],
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ActionPlanStore:
+    def __init__(self, max_plans: int = MAX_PLANS, workers: int = PLAN_WORKERS) -> None:
+        self._entries: OrderedDict[str, PlanEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_plans = max_plans
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zant-plans")
+
+    def get(self, key: str) -> Optional[PlanEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        return self._shared_get(key)
+
+    @staticmethod
+    def _shared_get(key: str) -> Optional[PlanEntry]:
+        """Plan policzony (albo liczony) przez inny proces roboczy."""
+        shared = shared_cache()
+        record = shared.get_json(SHARED_NAMESPACE, key) if shared is not None else None
+        return PlanEntry(**record) if record else None
+
+    def _claim(self, key: str) -> Optional[PlanEntry]:
+        """
+        Zajmuje klucz w pamięci współdzielonej (znacznik "pending"). Zwraca wpis innego
+        procesu, jeśli ten ma już plan albo go liczy – wtedy nie liczymy drugi raz.
+        """
+        shared = shared_cache()
+        if shared is None:
+            return None
+        pending = json.dumps(PlanEntry(key=key).as_dict())
+        if shared.add(SHARED_NAMESPACE, key, pending, ttl=PENDING_TTL_S):
+            return None
+        other = self._shared_get(key)
+        if other is not None and other.status != STATUS_FAILED:
+            return other
+        shared.set(SHARED_NAMESPACE, key, pending, ttl=PENDING_TTL_S)
+        return None
+
+    @staticmethod
+    def _publish(entry: PlanEntry) -> None:
+        shared = shared_cache()
+        if shared is None:
+            return
+        if entry.status == STATUS_READY and entry.actions:
+            shared.set_json(SHARED_NAMESPACE, entry.key, entry.as_dict())
+        else:
+            # Zwalniamy znacznik "pending" – kolejne zlecenie (w dowolnym workerze) policzy plan od nowa.
+            shared.delete(SHARED_NAMESPACE, entry.key)
+
+    def submit(self, key: str, compute: Callable[[], list[Any]]) -> PlanEntry:
+        """
+        Zleca obliczenie planu w tle, jeśli nie ma go jeszcze w pamięci
+        (albo poprzednia próba się nie udała). Zwraca wpis od razu.
+        `compute` zgłasza wyjątek przy błędzie – wpis dostaje wtedy STATUS_FAILED.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.status != STATUS_FAILED:
+                self._entries.move_to_end(key)
+                return entry
+        # Zapytania do SQLite poza blokadą – nie wstrzymują innych wątków.
+        other = self._claim(key)
+        if other is not None:
+            return other
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.status != STATUS_FAILED:
+                return entry  # inny wątek tego procesu zlecił plan w międzyczasie
+            entry = self._entries[key] = PlanEntry(key=key)
+            while len(self._entries) > self._max_plans:
+                self._entries.popitem(last=False)
+
+        QUEUE_DEPTH.inc(queue="action_plans")
+        # Kopia kontekstu – ewidencja tokenów przypisze wywołanie do sprawy.
+        self._pool.submit(contextvars.copy_context().run, self._run, entry, compute)
+        return entry
+
+    def _run(self, entry: PlanEntry, compute: Callable[[], list[Any]]) -> None:
+        try:
+            entry.actions = compute()
+            entry.status = STATUS_READY
+        except Exception as e:
+            print(f"Błąd obliczania planu działań: {e}")
+            entry.status = STATUS_FAILED
+        finally:
+            entry.finished_at = time.time()
+            QUEUE_DEPTH.dec(queue="action_plans")
+            self._publish(entry)
+
+
+store = ActionPlanStore()
@@ -0,0 +1,203 @@
+"""
+Parsowanie polskich adresów i lokalny indeks kodów pocztowych.
+
+`parse_address` rozbija adres na ulicę, numer domu i lokalu, kod i miejscowość
+(formaty "5/10", "5 m. 10", "5 lok. 10", kod przed lub po miejscowości). Wyniki
+są niezmienne i zapamiętywane w ograniczonej pamięci LRU – ten sam adres jest
+parsowany w czacie, przy walidacji i przy wypełnianiu EWYP, ale tylko raz.
+
+Indeks kodów pocztowych (CSV: `kod_od,kod_do,miejscowosc` albo `kod,miejscowosc`,
+separator `,` lub `;`) trzymamy jako posortowane tablice liczb + bisekcję.
+Domyślny plik `data/postal_codes.csv` obejmuje tylko zakresy kodów większych
+miast; pełny spis (np. eksport PNA) można wskazać w ZANT_POSTAL_CODES. Zakresy
+nie mogą na siebie zachodzić (identyczne zakresy są łączone). Zakresy z pliku
+domyślnego są zgrubne (obejmują też okoliczne miejscowości), więc służą tylko
+do uzupełnienia brakującej miejscowości – niezgodność kodu z miejscowością
+zgłaszamy dopiero przy pełnym spisie. Bez ZANT_POSTAL_CODES alertu nie ma wcale.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import os
+import re
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Optional
+
+from pkd import fold
+
+POSTAL_CODES_PATH = os.getenv(
+    "ZANT_POSTAL_CODES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "postal_codes.csv")
+)
+# Jawnie wskazany spis traktujemy jako pełny – tylko on rozstrzyga o niezgodności kodu.
+POSTAL_CODES_COMPLETE = bool(os.getenv("ZANT_POSTAL_CODES"))
+ADDRESS_CACHE_SIZE = int(os.getenv("ZANT_ADDRESS_CACHE_SIZE", "4096"))
+
+_POSTAL = re.compile(r"(?<!\d)(\d{2})\s?[-–]\s?(\d{3})(?!\d)")
+# Numer na końcu części ulicznej: "5", "5a", "5/10", "5 m. 10", "5 m 10", "5 lok. 10", "5, m. 10"
+_NUMBER = re.compile(
+    r"(?:^|[\s,])(?:nr\.?\s*)?(?P<house>\d+\s?[A-Za-z]?)"
+    r"(?:[\s,]*(?:/\s*|(?:m|lok|mieszk)(?:\.\s*|\s+))(?P<flat>\d+\s?[A-Za-z]?))?$",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class ParsedAddress:
+    street: str = ""
+    house: str = ""
+    flat: str = ""
+    postal_code: str = ""
+    city: str = ""
+    # True, jeśli miejscowość uzupełniliśmy z indeksu kodów pocztowych.
+    city_from_index: bool = False
+
+    def as_dict(self) -> dict[str, str]:
+        """Klucze jak w polach EWYP (ulica, nr_domu, nr_lokalu, kod, poczta)."""
+        return {
+            "ulica": self.street,
+            "nr_domu": self.house,
+            "nr_lokalu": self.flat,
+            "kod": self.postal_code,
+            "poczta": self.city,
+        }
+
+    def format(self) -> str:
+        """Postać 'Ulica 1/2, 00-000 Miasto'."""
+        number = f"{self.house}/{self.flat}" if self.house and self.flat else self.house
+        street_block = f"{self.street} {number}".strip()
+        locality = " ".join(item for item in (self.postal_code, self.city) if item)
+        return ", ".join(item for item in (street_block, locality) if item)
+
+
+class PostalIndex:
+    def __init__(self, rows: list[tuple[int, int, str]]) -> None:
+        merged: dict[tuple[int, int], list[str]] = {}
+        for start, end, name in rows:
+            names = merged.setdefault((start, end), [])
+            if name not in names:
+                names.append(name)
+        ordered = sorted(merged.items())
+        self._starts = array("l", (start for (start, _), _ in ordered))
+        self._ends = array("l", (end for (_, end), _ in ordered))
+        self._names: list[tuple[str, ...]] = [tuple(names) for _, names in ordered]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def lookup(self, postal_code: str) -> tuple[str, ...]:
+        """Miejscowości dla kodu "00-000" (pusta krotka, jeśli kodu nie znamy)."""
+        code = _code_number(postal_code)
+        if code is None:
+            return ()
+        i = bisect_right(self._starts, code) - 1
+        if i >= 0 and code <= self._ends[i]:
+            return self._names[i]
+        return ()
+
+    @classmethod
+    def from_csv(cls, text: str) -> "PostalIndex":
+        delimiter = ";" if ";" in text.split("\n", 1)[0] else ","
+        rows: list[tuple[int, int, str]] = []
+        for record in csv.reader(io.StringIO(text), delimiter=delimiter):
+            values = [value.strip() for value in record]
+            start = _code_number(values[0]) if values else None
+            if start is None or len(values) < 2:
+                continue  # nagłówek albo uszkodzony wiersz
+            # Zakres "kod_od,kod_do,miejscowość" albo kod z miejscowością w drugiej kolumnie
+            # (kolejne kolumny, np. ulice z eksportu PNA, pomijamy).
+            end = _code_number(values[1])
+            name = values[2] if end is not None and len(values) > 2 else values[1]
+            if name:
+                rows.append((start, end if end is not None else start, name))
+        return cls(rows)
+
+
+def _code_number(postal_code: str) -> Optional[int]:
+    match = _POSTAL.fullmatch(postal_code.strip())
+    return int(match.group(1) + match.group(2)) if match else None
+
+
+@lru_cache(maxsize=None)
+def postal_index() -> PostalIndex:
+    """Indeks wczytywany raz na proces; brak pliku = pusty indeks."""
+    try:
+        with open(POSTAL_CODES_PATH, "r", encoding="utf-8-sig") as f:
+            return PostalIndex.from_csv(f.read())
+    except OSError:
+        return PostalIndex([])
+
+
+def _split_locality(text: str) -> tuple[str, str]:
+    """Bez kodu pocztowego: "ul. Długa 5, Warszawa" -> ("ul. Długa 5", "Warszawa")."""
+    street_part, sep, last = text.rpartition(",")
+    if sep and last.strip() and not any(c.isdigit() for c in last):
+        return street_part.strip(" ,."), last.strip(" ,.")
+    return text.strip(" ,."), ""
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def parse_address(address: str) -> ParsedAddress:
+    """
+    Rozbija adres na części (best-effort). Brakującą miejscowość uzupełnia
+    z indeksu kodów pocztowych, jeśli kod wskazuje dokładnie jedną.
+    """
+    text = " ".join(address.split())
+    postal_code = city = ""
+
+    match = _POSTAL.search(text)
+    if match:
+        postal_code = f"{match.group(1)}-{match.group(2)}"
+        before = text[:match.start()].strip(" ,.")
+        after = text[match.end():].strip(" ,.")
+        if after:
+            # "Długa 5, 00-123 Warszawa" albo "00-123 Warszawa, ul. Długa 5"
+            city, _, rest = after.partition(",")
+            city = city.strip(" ,.")
+            street_part = before or rest.strip(" ,.")
+        else:
+            # "ul. Długa 5, Warszawa 00-123", "Długa 5 00-123", "Warszawa 00-123"
+            if "," in before:
+                street_part, city = _split_locality(before)
+            elif any(c.isdigit() for c in before):
+                street_part = before
+            else:
+                street_part, city = "", before
+    else:
+        street_part, city = _split_locality(text)
+
+    street, house, flat = street_part, "", ""
+    number = _NUMBER.search(street_part)
+    if number:
+        street = street_part[:number.start()].strip(" ,")
+        house = number.group("house").replace(" ", "")
+        flat = (number.group("flat") or "").replace(" ", "")
+
+    parsed = ParsedAddress(street, house, flat, postal_code, city)
+    if postal_code and not city:
+        localities = postal_index().lookup(postal_code)
+        if len(localities) == 1:
+            parsed = replace(parsed, city=localities[0], city_from_index=True)
+    return parsed
+
+
+def expected_localities(parsed: ParsedAddress) -> tuple[str, ...]:
+    """
+    Miejscowości zgodne z kodem, jeśli podana miejscowość do nich nie pasuje
+    (pusta krotka: zgodne, kodu nie ma w indeksie albo indeks to tylko plik domyślny).
+    Porównanie bez wielkości liter i polskich znaków ("Krakow" = "Kraków").
+    """
+    if not POSTAL_CODES_COMPLETE:
+        return ()
+    if not parsed.postal_code or not parsed.city or parsed.city_from_index:
+        return ()
+    localities = postal_index().lookup(parsed.postal_code)
+    city = fold(parsed.city)
+    # "Warszawa-Mokotów", "Warszawa Wola" – dzielnica po nazwie miejscowości jest w porządku.
+    if not localities or any(city.startswith(fold(name)) for name in localities):
+        return ()
+    return localities
@@ -0,0 +1,235 @@
+# batch_render.py
+"""
+Wsadowe generowanie paczek dokumentów dla zapisanych spraw (np. po zmianie szablonów).
+
+Wejście to plik JSONL: w każdym wierszu `CaseState` (opcjonalnie z polem
+`case_id`) albo obiekt `{"case_id": ..., "case_state": {...}}`. Dla każdej sprawy
+powstaje `<out>/<case_id>.zip` z tymi samymi dokumentami co w
+`/api/case/download-documents` oraz edytowalnym zawiadomieniem (DOCX).
+Sprawy są renderowane w puli procesów.
+
+Postęp jest zapisywany w `<out>/_checkpoint.jsonl`; ponowne uruchomienie pomija
+sprawy już wyrenderowane bez błędów dla tych samych danych i wersji szablonów
+(klucz jak w pamięci podręcznej paczek). Sprawy z błędami są ponawiane.
+
+    python batch_render.py sprawy.jsonl --out paczki -j 8
+
+Uruchamiać z katalogu backend (szablon EWYP.pdf).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Iterator, Optional
+
+os.environ.setdefault("ZANT_LLM_PROVIDER", "fake")
+os.environ.setdefault("ZANT_WARMUP", "0")
+
+CHECKPOINT_NAME = "_checkpoint.jsonl"
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+
+def read_cases(path: str) -> Iterator[tuple[str, Optional[dict], Optional[str]]]:
+    """Zwraca (case_id, surowy CaseState, błąd odczytu) dla kolejnych wierszy pliku."""
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            fallback_id = f"line-{lineno:06d}"
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield fallback_id, None, f"Niepoprawny JSON: {e}"
+                continue
+            if "case_state" in record:
+                case_id, state = record.get("case_id"), record["case_state"]
+            else:
+                state = dict(record)
+                case_id = state.pop("case_id", None)
+            yield str(case_id or fallback_id), state, None
+
+
+def safe_filename(case_id: str) -> str:
+    return re.sub(r"[^\w.-]", "_", case_id)[:120] or "case"
+
+
+def load_checkpoint(path: str) -> dict[str, str]:
+    """case_id -> klucz paczki dla spraw wyrenderowanych bez błędów."""
+    done: dict[str, str] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # urwany ostatni wiersz po przerwaniu
+            if entry.get("status") == STATUS_OK:
+                done[entry["case_id"]] = entry["bundle_key"]
+            else:
+                done.pop(entry.get("case_id"), None)
+    return done
+
+
+def init_worker() -> None:
+    from ewyp import load_ewyp_template
+    from pdf_render import warm_up_fonts
+
+    # Szablon i czcionki wczytujemy raz na proces, nie przy pierwszej sprawie.
+    load_ewyp_template("EWYP.pdf")
+    warm_up_fonts()
+
+
+def render_case(case_id: str, state_data: dict, out_path: str) -> dict[str, Any]:
+    """Buduje wszystkie dokumenty sprawy i zapisuje ZIP (atomowo, przez plik tymczasowy)."""
+    from main import CaseState, build_document_jobs
+    from zipstream import compression_for
+
+    start = time.perf_counter()
+    state = CaseState.model_validate(state_data)
+    failures: list[dict[str, str]] = []
+    documents = 0
+
+    tmp_path = f"{out_path}.part"
+    with zipfile.ZipFile(tmp_path, "w") as archive:
+        for filename, _component, build in build_document_jobs(state, include_notification_docx=True):
+            try:
+                content = build()
+            except Exception as e:
+                failures.append({"file": filename, "error": f"{type(e).__name__}: {e}"})
+                continue
+            archive.writestr(filename, content.getvalue(), compress_type=compression_for(filename))
+            documents += 1
+    os.replace(tmp_path, out_path)
+
+    return {
+        "case_id": case_id,
+        "status": STATUS_FAILED if failures else STATUS_OK,
+        "documents": documents,
+        "failures": failures,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+class Report:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.cases = 0
+        self.skipped = 0
+        self.documents = 0
+        self.failures: list[tuple[str, Optional[str], str]] = []
+        self._last_progress = self.start
+
+    def add(self, entry: dict[str, Any]) -> None:
+        self.cases += 1
+        self.documents += entry.get("documents", 0)
+        for failure in entry.get("failures", []):
+            self.failures.append((entry["case_id"], failure.get("file"), failure["error"]))
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.documents / elapsed if elapsed > 0 else 0.0
+
+    def progress(self, every: float = 5.0) -> None:
+        now = time.perf_counter()
+        if now - self._last_progress >= every:
+            self._last_progress = now
+            print(
+                f"[{now - self.start:7.1f}s] sprawy: {self.cases}, dokumenty: {self.documents}, "
+                f"{self.rate():.1f} dok./s, błędy: {len(self.failures)}",
+                file=sys.stderr,
+            )
+
+    def print_summary(self) -> None:
+        elapsed = time.perf_counter() - self.start
+        print(f"Sprawy wyrenderowane: {self.cases} (pominięte z checkpointu: {self.skipped})")
+        print(f"Dokumenty:            {self.documents} w {elapsed:.1f}s ({self.rate():.1f} dok./s)")
+        print(f"Błędy dokumentów:     {len(self.failures)}")
+        for case_id, filename, error in self.failures:
+            print(f"  {case_id} / {filename or '-'}: {error}")
+
+
+def run(args: argparse.Namespace) -> int:
+    from action_plans import case_state_key
+    from bundle_cache import bundle_key
+    from main import CaseState, document_versions
+    from pydantic import ValidationError
+
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = os.path.join(args.out, CHECKPOINT_NAME)
+    done = {} if args.no_resume else load_checkpoint(checkpoint_path)
+    versions = document_versions()
+    report = Report()
+    window = args.workers * 4  # ograniczamy liczbę spraw w locie (pamięć)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, ProcessPoolExecutor(
+        max_workers=args.workers, initializer=init_worker
+    ) as pool:
+
+        def record(entry: dict[str, Any]) -> None:
+            checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            report.add(entry)
+            report.progress()
+
+        def collect(pending: dict[Future, tuple[str, str]], return_when: str) -> None:
+            finished, _ = wait(pending, return_when=return_when)
+            for future in finished:
+                case_id, key = pending.pop(future)
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    entry = {"case_id": case_id, "status": STATUS_FAILED, "documents": 0,
+                             "failures": [{"file": None, "error": f"{type(e).__name__}: {e}"}]}
+                entry["bundle_key"] = key
+                record(entry)
+
+        pending: dict[Future, tuple[str, str]] = {}
+        for case_id, raw_state, error in read_cases(args.input):
+            if error is None:
+                try:
+                    state = CaseState.model_validate(raw_state)
+                except ValidationError as e:
+                    error = f"Niepoprawny CaseState: {e.error_count()} błędów walidacji"
+            if error is not None:
+                record({"case_id": case_id, "bundle_key": None, "status": STATUS_FAILED,
+                        "documents": 0, "failures": [{"file": None, "error": error}]})
+                continue
+
+            key = bundle_key(case_state_key(state), versions)
+            out_path = os.path.join(args.out, f"{safe_filename(case_id)}.zip")
+            if done.get(case_id) == key and os.path.exists(out_path):
+                report.skipped += 1
+                continue
+
+            future = pool.submit(render_case, case_id, state.model_dump(mode="json"), out_path)
+            pending[future] = (case_id, key)
+            if len(pending) >= window:
+                collect(pending, FIRST_COMPLETED)
+        while pending:
+            collect(pending, FIRST_COMPLETED)
+
+    report.print_summary()
+    return 1 if report.failures else 0
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description="Wsadowe generowanie paczek dokumentów ZANT")
+    parser.add_argument("input", help="plik JSONL ze stanami spraw (CaseState)")
+    parser.add_argument("--out", default="paczki", help="katalog wynikowy (domyślnie: paczki)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 2, help="liczba procesów")
+    parser.add_argument("--no-resume", action="store_true", help="ignoruj checkpoint i renderuj wszystko")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,481 @@
+# bench.py
+"""
+Mikrobenchmarki backendu ZANT (bez sieci i bez LLM).
+
+    python bench.py pdf -n 50      # create_simple_pdf: DejaVu (cache) vs add_font w każdym wywołaniu vs Arial
+    python bench.py markdown       # karta wypadku Markdown -> PDF dla 1..100 stron: bloki vs jedna komórka
+    python bench.py docx -n 50     # DOCX: szablon (podmiana w XML) vs budowanie przez python-docx
+    python bench.py validation     # masowa walidacja CaseState (rekordy/s): silnik, JSONL, tablica JSON
+    python bench.py extraction     # reguły lokalne zamiast LLM: odsetek pominiętych wywołań i czas
+    python bench.py memory         # pamięć rozmowy: rozmiar historii w prompcie i czas vs długość rozmowy
+    python bench.py pkd            # PKD: podpowiedzi (kod, prefiksy słów, trigramy) i propozycje z opisu (BM25)
+    python bench.py coldstart -n 3 # zimny start: import main (profil -X importtime), pierwsza odpowiedź i /ready
+    python bench.py cache          # pamięć współdzielona (SQLite): odczyt/zapis, także z kilku procesów naraz
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import socket
+import tempfile
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import tracemalloc
+from typing import Callable
+
+os.environ.setdefault("ZANT_LLM_PROVIDER", "fake")
+os.environ.setdefault("ZANT_WARMUP", "0")
+
+
+def measure(func: Callable[[], object], repeat: int) -> tuple[list[float], object]:
+    result = func()  # rozgrzewka (cache czcionek, importy)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def report_row(name: str, samples: list[float], size: int | None = None) -> None:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, round(0.95 * (len(ms) - 1)))]
+    size_col = f"{size / 1024:>10.1f}" if size is not None else f"{'-':>10}"
+    print(f"{name:<32}{statistics.median(ms):>10.2f}{p95:>10.2f}{statistics.fmean(ms):>10.2f}{size_col}")
+
+
+def report_header() -> None:
+    header = f"{'wariant':<32}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'KiB':>10}"
+    print(header)
+    print("-" * len(header))
+
+
+def sample_case_state():
+    from main import CaseState, Witness
+
+    return CaseState(
+        first_name="Łukasz", last_name="Żółkiewski", pesel="80010112340", date_of_birth="1980-01-01",
+        address_home="ul. Źródlana 5/10, 90-123 Łódź", nip="1234563218", regon="123456785",
+        accident_date="2025-11-20", accident_time="10:30", accident_place="Gdańsk, ul. Świętojańska 3",
+        injury_type="złamanie przedramienia",
+        accident_description="Podczas montażu instalacji poślizgnąłem się na drabinie i spadłem. " * 8,
+        first_aid_info="Pogotowie ratunkowe udzieliło pierwszej pomocy.",
+        witnesses=[Witness(first_name="Anna", last_name="Nowak", address="ul. Lipowa 2, 00-950 Warszawa")],
+    )
+
+
+def bench_pdf(args: argparse.Namespace) -> None:
+    import main
+    import pdf_render
+    from pdf_render import FONT_DIR, FONT_FILES, PDF
+
+    data = main.build_notification_data(sample_case_state())
+
+    class AddFontPerCallPDF(PDF):
+        """Naiwny wariant: parsowanie plików TTF przy każdym dokumencie."""
+
+        def __init__(self, *a, **kw) -> None:
+            super().__init__(*a, unicode=False, **kw)
+            self.unicode = True
+            self.font_family_name = "DejaVuNaive"
+            for style, name in FONT_FILES.items():
+                self.add_font("DejaVuNaive", style, os.path.join(FONT_DIR, name))
+
+    variants = {
+        "dejavu (cache)": PDF,
+        "dejavu (add_font co wywołanie)": AddFontPerCallPDF,
+        "arial + transliteracja": lambda: PDF(unicode=False),
+    }
+    if not pdf_render.unicode_fonts_available():
+        print(f"Brak czcionek DejaVu w {FONT_DIR} – mierzę tylko wariant Arial.")
+        variants = {"arial + transliteracja": variants["arial + transliteracja"]}
+
+    report_header()
+    # create_simple_pdf importuje PDF z pdf_render przy każdym wywołaniu – podmieniamy tam.
+    original = pdf_render.PDF
+    try:
+        for name, factory in variants.items():
+            pdf_render.PDF = factory
+            samples, out = measure(lambda: main.create_simple_pdf("Zawiadomienie", data), args.repeat)
+            report_row(name, samples, len(out.getvalue()))
+    finally:
+        pdf_render.PDF = original
+
+
+def synthetic_card(pages: int) -> str:
+    """Karta wypadku „wypełniona przez LLM” o długości ok. `pages` stron (wzór ma ok. 2 strony)."""
+    from ocr import load_card_template
+
+    template = load_card_template()
+    if pages < 3:
+        return "\n".join(template.splitlines()[: 45 * pages])
+    prose = (
+        "Poszkodowany w trakcie wykonywania czynności związanych z prowadzoną działalnością "
+        "poślizgnął się na mokrej powierzchni i upadł, doznając urazu prawej ręki. "
+    ) * 6
+    section = f"{template}\n\n## Dodatkowe ustalenia\n\n{prose}\n\n- {prose}\n- {prose}\n"
+    return "\n\n".join(section for _ in range(max(1, round(pages / 2.9))))
+
+
+def bench_markdown(args: argparse.Namespace) -> None:
+    import main
+    from pypdf import PdfReader
+
+    variants = {
+        "bloki": lambda text: main.create_pdf_from_markdown(text),
+        # Dawna implementacja: cała karta w jednym multi_cell.
+        "jedna komórka": lambda text: main.create_simple_pdf(
+            "Karta wypadku", {"Treść karty (Markdown)": {"value": text, "lines": 10}}
+        ),
+    }
+
+    report_header()
+    for target in args.pages:
+        text = synthetic_card(target)
+        for name, render in variants.items():
+            samples, out = measure(lambda: render(text), args.repeat)
+            pages = len(PdfReader(out).pages)
+            report_row(f"{name} ({pages} str.)", samples, len(out.getvalue()))
+            print(f"{'':<32}{statistics.median(samples) * 1000 / pages:>10.2f} ms/str.")
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_docx(args: argparse.Namespace) -> None:
+    import main
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+    import build_templates
+
+    state = sample_case_state()
+
+    def python_docx(build: Callable[[], object]) -> Callable[[], object]:
+        # Dawny sposób: cały dokument budowany akapit po akapicie i zapisywany przez python-docx.
+        def run():
+            out = io.BytesIO()
+            build().save(out)
+            return out
+        return run
+
+    variants = {
+        "zawiadomienie: szablon": lambda: main.create_notification_docx(state),
+        "zawiadomienie: python-docx": python_docx(build_templates.notification_template),
+        "wyjaśnienia: szablon": lambda: main.create_explanation_docx(state),
+        "wyjaśnienia: python-docx": python_docx(build_templates.explanation_template),
+    }
+
+    report_header()
+    for name, func in variants.items():
+        samples, out = measure(func, args.repeat)
+        report_row(name, samples, len(out.getvalue()))
+        print(f"{'':<32}{peak_memory(func) / 1024:>10.1f} KiB szczytowo (tracemalloc)")
+
+
+def sample_records(count: int) -> list[dict]:
+    """Rekordy do walidacji: co trzeci z błędną cyfrą kontrolną lub datą."""
+    base = sample_case_state().model_dump(mode="json")
+    records = []
+    for i in range(count):
+        record = dict(base, case_id=f"case-{i}")
+        if i % 3 == 1:
+            record["pesel"] = "80010112345"
+        elif i % 3 == 2:
+            record.update(nip="1234563219", accident_date="1970-01-01")
+        records.append(record)
+    return records
+
+
+def bench_validation(args: argparse.Namespace) -> None:
+    import json
+
+    import main
+    from validation import validate_case
+
+    records = sample_records(args.records)
+    states = [main.CaseState.model_validate(r) for r in records]
+    jsonl = "\n".join(json.dumps(r, ensure_ascii=False) for r in records).encode("utf-8")
+    array = json.dumps(records, ensure_ascii=False).encode("utf-8")
+
+    variants = {
+        "validate_case (gotowe CaseState)": lambda: [validate_case(s) for s in states],
+        "validate_bulk (JSONL)": lambda: main.validate_bulk(jsonl),
+        "validate_bulk (tablica JSON)": lambda: main.validate_bulk(array),
+    }
+
+    report_header()
+    for name, func in variants.items():
+        samples, _ = measure(func, args.repeat)
+        report_row(name, samples)
+        print(f"{'':<32}{args.records / statistics.median(samples):>10.0f} rekordów/s")
+
+
+PKD_QUERIES = {
+    "prefiks kodu": "62.0",
+    "kod bez kropek": "4322z",
+    "prefiksy słów": "instalacj elektr",
+    "bez polskich znaków": "dzialalnosc zwiazana z oprogramowaniem",
+    "literówka (trigramy)": "oprogramowanei",
+}
+PKD_DESCRIPTION = "Prowadzę jednoosobową firmę, wykonuję instalacje elektryczne w domach i biurach."
+
+
+def bench_pkd(args: argparse.Namespace) -> None:
+    from pkd import pkd_index
+
+    start = time.perf_counter()
+    pkd_index.cache_clear()
+    index = pkd_index()
+    print(f"Indeks PKD: {len(index)} kodów, budowa {1000 * (time.perf_counter() - start):.1f} ms\n")
+
+    report_header()
+    for name, query in PKD_QUERIES.items():
+        samples, _ = measure(lambda: index.search(query), args.repeat)
+        report_row(name, samples)
+    samples, suggestions = measure(lambda: index.suggest(PKD_DESCRIPTION), args.repeat)
+    report_row("propozycja z opisu (BM25)", samples)
+    print(f"\n{PKD_DESCRIPTION}\n  -> " + ", ".join(f"{e.code} ({score})" for e, score in suggestions))
+
+
+PERSON_FIELDS = ["pesel", "date_of_birth", "address_home", "address_correspondence"]
+BUSINESS_FIELDS = ["nip", "regon", "business_address", "pkd", "business_description"]
+ACCIDENT_FIELDS = ["accident_date", "accident_time", "accident_place", "planned_work_start", "planned_work_end"]
+# (pola, o które pytał asystent; odpowiedź użytkownika) – typowe tury rozmowy.
+EXTRACTION_TURNS = [
+    (["reporter_type"], "osobiście"),
+    (["reporter_type"], "Zgłaszam jako pełnomocnik żony"),
+    (PERSON_FIELDS, "80010112340"),
+    (PERSON_FIELDS, "Mój PESEL to 80010112340"),
+    (PERSON_FIELDS, "urodziłem się 1 stycznia 1980"),
+    (PERSON_FIELDS, "ul. Źródlana 5/10, 90-123 Łódź"),
+    (PERSON_FIELDS, "Mieszkam z rodziną w Łodzi od 10 lat"),
+    (BUSINESS_FIELDS, "NIP 123-456-32-18"),
+    (BUSINESS_FIELDS, "123456785"),
+    (BUSINESS_FIELDS, "Wykonuję instalacje elektryczne w domach"),
+    (ACCIDENT_FIELDS, "12 marca 2024 o 10:30"),
+    (ACCIDENT_FIELDS, "od 8:00 do 16:00"),
+    (ACCIDENT_FIELDS, "Na budowie przy ul. Lipowej, spadłem z rusztowania"),
+    (ACCIDENT_FIELDS, "nie pamiętam dokładnie godziny"),
+]
+
+
+def bench_extraction(args: argparse.Namespace) -> None:
+    from local_extraction import extract_answer
+
+    def run() -> list:
+        return [extract_answer(message, expected) for expected, message in EXTRACTION_TURNS]
+
+    report_header()
+    samples, results = measure(run, args.repeat)
+    report_row(f"{len(EXTRACTION_TURNS)} tur rozmowy", samples)
+    print()
+    for (_, message), updates in zip(EXTRACTION_TURNS, results):
+        print(f"  {'reguły' if updates else 'LLM':<7}{message[:48]:<50}{updates or ''}")
+    bypassed = sum(1 for updates in results if updates)
+    print(f"\nBez wywołania LLM: {bypassed}/{len(results)} ({100 * bypassed / len(results):.0f}%)")
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    from conversation_memory import ConversationMemory, TurnMeta, compact_history, history_prompt, record_turn
+    from main import ChatTurn
+
+    print(f"{'tury':>6}{'pełna historia znaki':>22}{'pamięć znaki':>14}{'pamięć µs/turę':>16}")
+    for turns in args.turns:
+        history: list = []
+        memory = ConversationMemory()
+        elapsed = 0.0
+        for i in range(turns):
+            start = time.perf_counter()
+            window = compact_history(memory, history)
+            prompt = history_prompt(window.summary, window.recent)
+            memory = record_turn(memory, window, TurnMeta(turn=i + 1, kind="text"))
+            elapsed += time.perf_counter() - start
+            history += [
+                ChatTurn(role="user", content=f"Odpowiedź {i}: pracowałem na budowie przy ul. Lipowej {i}."),
+                ChatTurn(role="assistant", content="Teraz kategoria: informacje o wypadku. Napisz, co uważasz za ważne."),
+            ]
+        full = "\n".join(f"{t.role}: {t.content}" for t in history)
+        print(f"{turns:>6}{len(full):>22}{len(prompt):>14}{1e6 * elapsed / turns:>16.1f}")
+
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_profile() -> tuple[float, list[tuple[int, str]]]:
+    """`import main` w świeżym interpreterze: łączny czas (s) i moduły importowane wprost przez main (µs)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    )
+    total = 0.0
+    direct: list[tuple[int, str]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # nagłówek
+        if name.strip() == "main":
+            total = int(cumulative) / 1e6
+        elif name.startswith("   ") and not name.startswith("    "):
+            direct.append((int(cumulative), name.strip()))
+    return total, sorted(direct, reverse=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def server_cold_start(warmup: str, timeout: float = 60.0) -> tuple[float, float]:
+    """Uruchamia uvicorn; zwraca czas (s) od startu procesu do pierwszej odpowiedzi `/` i do 200 z `/ready`."""
+    port = _free_port()
+    env = {**os.environ, "ZANT_WARMUP": warmup}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + timeout
+        first = _wait_for(f"http://127.0.0.1:{port}/", deadline)
+        ready = _wait_for(f"http://127.0.0.1:{port}/ready", deadline)
+        return first - start, ready - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bench_coldstart(args: argparse.Namespace) -> None:
+    profiles = [import_profile() for _ in range(args.repeat)]
+    print(f"import main: {statistics.median(t for t, _ in profiles) * 1000:.0f} ms (mediana z {args.repeat})")
+    print("najdroższe importy bezpośrednie (ms, łącznie z zależnościami):")
+    for cumulative, name in profiles[-1][1][:args.top]:
+        print(f"  {cumulative / 1000:>8.1f}  {name}")
+
+    print()
+    report_header()
+    for warmup in args.warmup:
+        runs = [server_cold_start(warmup) for _ in range(args.repeat)]
+        report_row(f"WARMUP={warmup} pierwsza odp.", [first for first, _ in runs])
+        report_row(f"WARMUP={warmup} /ready", [ready for _, ready in runs])
+
+
+def _cache_worker(path: str, ops: int, seed: int) -> None:
+    from shared_cache import SharedCache
+
+    cache = SharedCache(path)
+    for i in range(ops):
+        key = f"k{(seed * 7919 + i) % 1000}"
+        if cache.get("bench", key) is None:
+            cache.set("bench", key, "x" * 2000)
+
+
+def bench_cache(args: argparse.Namespace) -> None:
+    from multiprocessing import get_context
+
+    from shared_cache import SharedCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite3")
+        cache = SharedCache(path)
+        value = "x" * 2000  # ~ odpowiedź LLM z CaseState
+        counter = iter(range(10**9))
+        report_header()
+        samples, _ = measure(lambda: cache.set("bench", f"k{next(counter)}", value), args.repeat)
+        report_row("zapis", samples)
+        samples, _ = measure(lambda: cache.get("bench", "k1"), args.repeat)
+        report_row("odczyt (trafienie)", samples)
+        samples, _ = measure(lambda: cache.get("bench", "brak"), args.repeat)
+        report_row("odczyt (brak)", samples)
+
+        print()
+        context = get_context("fork")
+        for processes in args.processes:
+            start = time.perf_counter()
+            workers = [context.Process(target=_cache_worker, args=(path, args.repeat, p)) for p in range(processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            ops = processes * args.repeat
+            print(f"{processes} proc.: {ops / elapsed:>10.0f} operacji/s (odczyt, przy braku zapis)")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarki backendu ZANT")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pdf = sub.add_parser("pdf", help="renderowanie create_simple_pdf")
+    pdf.add_argument("-n", "--repeat", type=int, default=30)
+    pdf.set_defaults(func=bench_pdf)
+
+    markdown = sub.add_parser("markdown", help="renderowanie karty wypadku Markdown -> PDF")
+    markdown.add_argument("-n", "--repeat", type=int, default=5)
+    markdown.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50, 100])
+    markdown.set_defaults(func=bench_markdown)
+
+    docx = sub.add_parser("docx", help="generowanie DOCX: szablon vs python-docx")
+    docx.add_argument("-n", "--repeat", type=int, default=30)
+    docx.set_defaults(func=bench_docx)
+
+    validation = sub.add_parser("validation", help="masowa walidacja rekordów CaseState")
+    validation.add_argument("-n", "--repeat", type=int, default=5)
+    validation.add_argument("--records", type=int, default=20000)
+    validation.set_defaults(func=bench_validation)
+
+    extraction = sub.add_parser("extraction", help="regułowa ekstrakcja odpowiedzi (bez LLM)")
+    extraction.add_argument("-n", "--repeat", type=int, default=200)
+    extraction.set_defaults(func=bench_extraction)
+
+    memory = sub.add_parser("memory", help="pamięć rozmowy o stałym koszcie na turę")
+    memory.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    memory.set_defaults(func=bench_memory)
+
+    pkd = sub.add_parser("pkd", help="wyszukiwanie kodów PKD (autouzupełnianie)")
+    pkd.add_argument("-n", "--repeat", type=int, default=1000)
+    pkd.set_defaults(func=bench_pkd)
+
+    coldstart = sub.add_parser("coldstart", help="zimny start procesu: import, pierwsza odpowiedź, gotowość")
+    coldstart.add_argument("-n", "--repeat", type=int, default=3)
+    coldstart.add_argument("--top", type=int, default=10)
+    coldstart.add_argument("--warmup", nargs="+", default=["0", "1", "background"])
+    coldstart.set_defaults(func=bench_coldstart)
+
+    cache = sub.add_parser("cache", help="pamięć współdzielona procesów (SQLite)")
+    cache.add_argument("-n", "--repeat", type=int, default=2000)
+    cache.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    cache.set_defaults(func=bench_cache)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main_cli()
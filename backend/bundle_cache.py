@@ -0,0 +1,93 @@
+"""
+Pamięć podręczna wygenerowanych paczek dokumentów (ZIP).
+
+Paczka jest kluczowana skrótem kanonicznego `CaseState` razem z wersjami
+szablonów i rendererów, więc ponowne pobranie niezmienionej sprawy nie
+wypełnia EWYP ani nie buduje DOCX/PDF od nowa. Ten sam klucz służy jako ETag
+(odpowiedź 304 na `If-None-Match`). Pamięć jest ograniczona liczbą wpisów
+i łącznym rozmiarem; najdawniej używane paczki wypadają pierwsze.
+
+Przy pamięci współdzielonej (`shared_cache.py`, tryb wieloprocesowy) paczka
+trafia też do niej (przestrzeń "bundle"): worker bez paczki w swojej pamięci
+bierze ją stamtąd zamiast generować dokumenty od nowa. Tam trzymamy
+ZANT_BUNDLE_CACHE_SIZE najnowszych paczek przez ZANT_BUNDLE_CACHE_TTL sekund.
+Metody `get`/`put` czytają plik SQLite – wywołujemy je z wątku.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from shared_cache import shared_cache
+
+MAX_BUNDLES = int(os.getenv("ZANT_BUNDLE_CACHE_SIZE", "256"))
+MAX_BYTES = int(float(os.getenv("ZANT_BUNDLE_CACHE_MB", "64")) * 1024 * 1024)
+SHARED_TTL_S = float(os.getenv("ZANT_BUNDLE_CACHE_TTL", str(24 * 3600)))
+SHARED_NAMESPACE = "bundle"
+
+
+def bundle_key(state_key: str, versions: Iterable[str]) -> str:
+    """Klucz paczki: skrót stanu sprawy + wersje szablonów/rendererów."""
+    digest = hashlib.sha256(state_key.encode("ascii"))
+    for version in versions:
+        digest.update(b"\0" + version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def etag_for(key: str) -> str:
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class BundleCache:
+    def __init__(self, max_bundles: int = MAX_BUNDLES, max_bytes: int = MAX_BYTES) -> None:
+        self._bundles: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._max_bundles = max_bundles
+        self._max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._bundles.get(key)
+            if data is not None:
+                self._bundles.move_to_end(key)
+                return data
+        shared = shared_cache()
+        data = shared.get(SHARED_NAMESPACE, key) if shared is not None else None
+        if data is not None:
+            self._store(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self._max_bytes:
+            return
+        self._store(key, data)
+        shared = shared_cache()
+        if shared is not None:
+            shared.set(SHARED_NAMESPACE, key, data, ttl=SHARED_TTL_S)
+            shared.trim(SHARED_NAMESPACE, self._max_bundles)
+
+    def _store(self, key: str, data: bytes) -> None:
+        with self._lock:
+            old = self._bundles.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._bundles[key] = data
+            self._size += len(data)
+            while len(self._bundles) > self._max_bundles or self._size > self._max_bytes:
+                _, evicted = self._bundles.popitem(last=False)
+                self._size -= len(evicted)
+
+
+bundles = BundleCache()
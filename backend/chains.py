@@ -0,0 +1,196 @@
+"""
+Rejestr łańcuchów LangChain (prompt | LLM | parser) budowanych raz na proces.
+
+Każdy łańcuch jest opisany przez `ChainSpec`: nazwę, wersję promptu, treść
+wiadomości, parser oraz statyczne sekcje (np. ACTION_PLAN_GUIDE, DEFINICJA_WYPADKU,
+szablon karty, instrukcje formatu parsera). Statyczne sekcje są wklejane
+w szablon już przy kompilacji, więc przy każdym wywołaniu formatujemy tylko
+zmienne części promptu. `warm_up()` kompiluje wszystkie łańcuchy przy starcie
+aplikacji i renderuje ich prompty na przykładowych danych.
+
+LangChain importujemy dopiero przy kompilacji łańcucha (parsery przez
+`str_parser` / `pydantic_parser`), więc rejestracja specyfikacji przy imporcie
+modułów nie ładuje langchain_core.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from metrics import LLM_CHAIN_DURATION, LLM_IN_FLIGHT, PARSE_FAILURES
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.output_parsers import BaseOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+
+
+def escape_braces(text: str) -> str:
+    """Zabezpiecza klamry, żeby tekst statyczny nie był traktowany jako zmienna promptu."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def str_parser() -> BaseOutputParser:
+    from langchain_core.output_parsers import StrOutputParser
+
+    return StrOutputParser()
+
+
+def pydantic_parser(model: type) -> Callable[[], BaseOutputParser]:
+    """Fabryka PydanticOutputParser dla `parser_factory`."""
+    def factory() -> BaseOutputParser:
+        from langchain_core.output_parsers import PydanticOutputParser
+
+        return PydanticOutputParser(pydantic_object=model)
+
+    return factory
+
+
+@dataclass
+class ChainSpec:
+    name: str
+    version: str
+    messages: list[tuple[str, str]]
+    parser_factory: Callable[[], BaseOutputParser]
+    llm_factory: Callable[[], Optional[BaseChatModel]]
+    # Sekcje statyczne: nazwa zmiennej -> tekst albo funkcja zwracająca tekst
+    # (wywoływana przy kompilacji, np. wczytanie szablonu z dysku).
+    static: dict[str, str | Callable[[], str]] = field(default_factory=dict)
+    # Czy wkleić `parser.get_format_instructions()` w miejsce {format_instructions}.
+    format_instructions: bool = False
+    # Przykładowe dane do rozgrzewki (renderowanie promptu bez wywołania LLM).
+    sample_inputs: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class CompiledChain:
+    spec: ChainSpec
+    prompt: ChatPromptTemplate
+    llm: BaseChatModel
+    parser: BaseOutputParser
+    runnable: Any
+
+    @property
+    def name(self) -> str:
+        return self.spec.name
+
+    def invoke(self, inputs: dict[str, Any]) -> Any:
+        from langchain_core.exceptions import OutputParserException
+
+        from usage import UsageCallbackHandler
+
+        with LLM_IN_FLIGHT.track_in_progress(), LLM_CHAIN_DURATION.time(chain=self.name):
+            try:
+                return self.runnable.invoke(
+                    inputs, config={"callbacks": [UsageCallbackHandler(self.name)]}
+                )
+            except OutputParserException:
+                PARSE_FAILURES.inc(chain=self.name)
+                raise
+
+
+class ChainRegistry:
+    def __init__(self) -> None:
+        self._specs: dict[str, ChainSpec] = {}
+        self._compiled: dict[str, CompiledChain] = {}
+        # Parser i prompt bez modelu (`prepare_prompts`) – współdzielone po fork().
+        self._prompts: dict[str, tuple[BaseOutputParser, ChatPromptTemplate]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, spec: ChainSpec) -> None:
+        with self._lock:
+            self._specs[spec.name] = spec
+            self._compiled.pop(spec.name, None)
+            self._prompts.pop(spec.name, None)
+
+    def versions(self) -> dict[str, str]:
+        return {name: spec.version for name, spec in sorted(self._specs.items())}
+
+    def _build_prompt(self, spec: ChainSpec, parser: BaseOutputParser) -> ChatPromptTemplate:
+        from langchain_core.prompts import ChatPromptTemplate
+
+        static = {
+            key: value() if callable(value) else value
+            for key, value in spec.static.items()
+        }
+        if spec.format_instructions:
+            static["format_instructions"] = parser.get_format_instructions()
+
+        messages = []
+        for role, template in spec.messages:
+            for key, value in static.items():
+                template = template.replace("{" + key + "}", escape_braces(value))
+            messages.append((role, template))
+        return ChatPromptTemplate.from_messages(messages)
+
+    def _prompt(self, spec: ChainSpec) -> tuple[BaseOutputParser, ChatPromptTemplate]:
+        prepared = self._prompts.get(spec.name)
+        if prepared is None:
+            parser = spec.parser_factory()
+            prepared = self._prompts[spec.name] = (parser, self._build_prompt(spec, parser))
+        return prepared
+
+    def _compile(self, spec: ChainSpec) -> Optional[CompiledChain]:
+        llm = spec.llm_factory()
+        if llm is None:
+            return None
+        parser, prompt = self._prompt(spec)
+        return CompiledChain(
+            spec=spec,
+            prompt=prompt,
+            llm=llm,
+            parser=parser,
+            runnable=prompt | llm | parser,
+        )
+
+    def get(self, name: str) -> Optional[CompiledChain]:
+        """
+        Zwraca skompilowany łańcuch albo None, jeśli LLM nie jest dostępny
+        (wywołujący przechodzi wtedy na fallback). Niepowodzeń nie zapamiętujemy,
+        żeby kolejne wywołanie mogło spróbować ponownie.
+        """
+        compiled = self._compiled.get(name)
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            compiled = self._compiled.get(name)
+            if compiled is None:
+                compiled = self._compile(self._specs[name])
+                if compiled is not None:
+                    self._compiled[name] = compiled
+        return compiled
+
+    def prepare_prompts(self) -> None:
+        """
+        Buduje parsery i prompty wszystkich łańcuchów bez tworzenia klientów LLM –
+        w trybie wieloprocesowym robi to proces główny przed fork() (`serve.py`),
+        a klienci modelu powstają już w workerach.
+        """
+        with self._lock:
+            for spec in self._specs.values():
+                self._prompt(spec)
+
+    def warm_up(self) -> dict[str, Optional[float]]:
+        """
+        Kompiluje wszystkie łańcuchy i renderuje ich prompty na przykładowych danych.
+        Zwraca czas rozgrzewki (w sekundach) per łańcuch; None oznacza, że się nie udało
+        (np. brak klucza API) – łańcuch zostanie skompilowany przy pierwszym użyciu.
+        """
+        timings: dict[str, Optional[float]] = {}
+        for name in list(self._specs):
+            start = time.perf_counter()
+            try:
+                compiled = self.get(name)
+                if compiled is not None:
+                    compiled.prompt.format_messages(**compiled.spec.sample_inputs)
+                timings[name] = time.perf_counter() - start
+            except Exception as e:
+                print(f"Rozgrzewka łańcucha {name} nieudana: {e}")
+                timings[name] = None
+        return timings
+
+
+registry = ChainRegistry()
@@ -0,0 +1,126 @@
+"""
+Pamięć rozmowy o stałym koszcie na turę.
+
+Zamiast przeglądać w każdej turze całą `conversation_history`, backend trzyma
+`ConversationMemory`, którą klient odsyła z kolejną wiadomością:
+
+- `summary` – zwięzłe, narastające streszczenie wiadomości użytkownika, które
+  wypadły z okna ostatnich MEMORY_WINDOW wiadomości (ograniczone do
+  MEMORY_SUMMARY_MAX_CHARS, najstarsze linie odpadają),
+- `skipped_fields` – pola pominięte przez użytkownika (do tej pory wyliczane
+  w każdej turze z całej historii),
+- `turns` – metadane ostatnich tur: o co pytał asystent, jak sklasyfikowano
+  odpowiedź i które pola uzupełniła/pominęła.
+
+Do promptu trafia streszczenie + okno ostatnich wiadomości, więc rozmiar promptu
+i praca CPU na turę nie rosną z długością rozmowy. Klient może wysyłać całą
+historię albo tylko jej końcówkę – `history_length` pozwala ustalić, które
+wiadomości są już w streszczeniu.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from pydantic import BaseModel, Field
+
+MEMORY_WINDOW = int(os.getenv("ZANT_MEMORY_WINDOW", "10"))
+MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("ZANT_MEMORY_SUMMARY_CHARS", "1500"))
+MEMORY_MAX_TURNS = 20
+SUMMARY_LINE_MAX_CHARS = 200
+
+# Klasyfikacja odpowiedzi użytkownika w metadanych tury.
+TURN_DATA = "data"  # same dane, rozpoznane regułami
+TURN_TEXT = "text"  # wolny tekst, ekstrakcja przez LLM
+TURN_NAVIGATION = "navigation"
+TURN_REFUSAL = "refusal"
+
+
+class TurnMeta(BaseModel):
+    turn: int = Field(..., description="Numer tury (od 1)")
+    asked: Optional[str] = Field(None, description="Kategoria lub pole z ostatniego pytania asystenta")
+    asked_fields: List[str] = Field(default_factory=list, description="Pola, o które pytał asystent")
+    kind: str = Field(..., description="Klasyfikacja odpowiedzi: data / text / navigation / refusal")
+    filled: List[str] = Field(default_factory=list, description="Pola uzupełnione w tej turze")
+    skipped: List[str] = Field(default_factory=list, description="Pola pominięte w tej turze")
+
+
+class ConversationMemory(BaseModel):
+    history_length: int = Field(0, description="Długość historii (wiadomości) po ostatniej turze")
+    summarized: int = Field(0, description="Liczba początkowych wiadomości historii ujętych w streszczeniu")
+    summary: str = ""
+    skipped_fields: List[str] = Field(default_factory=list)
+    turns: List[TurnMeta] = Field(default_factory=list)
+
+    @property
+    def turn_count(self) -> int:
+        return self.turns[-1].turn if self.turns else 0
+
+
+def _summary_line(content: str) -> str:
+    text = " ".join(content.split())
+    if len(text) > SUMMARY_LINE_MAX_CHARS:
+        text = text[:SUMMARY_LINE_MAX_CHARS - 1].rstrip() + "…"
+    return f"- {text}"
+
+
+def _trim_summary(lines: list[str]) -> str:
+    total = sum(len(line) + 1 for line in lines)
+    start = 0
+    while total > MEMORY_SUMMARY_MAX_CHARS and start < len(lines) - 1:
+        total -= len(lines[start]) + 1
+        start += 1
+    return "\n".join(lines[start:])
+
+
+@dataclass
+class HistoryWindow:
+    summary: str  # streszczenie wiadomości sprzed okna
+    summarized: int  # ile początkowych wiadomości historii ujęto w streszczeniu
+    recent: list[Any]  # ostatnie wiadomości (najwyżej MEMORY_WINDOW)
+    length: int  # bezwzględna długość historii przed bieżącą wiadomością
+
+
+def compact_history(memory: ConversationMemory, history: Sequence[Any]) -> HistoryWindow:
+    """
+    Dopisuje do streszczenia wiadomości użytkownika, które właśnie wypadły z okna.
+    Przegląda tylko nowe wiadomości i okno – nie całą historię.
+    """
+    # Bezwzględny indeks history[0] (klient mógł przyciąć historię).
+    offset = max(0, memory.history_length - len(history))
+    length = offset + len(history)
+    cut = max(0, length - MEMORY_WINDOW)
+
+    lines = memory.summary.splitlines() if memory.summary else []
+    for index in range(max(memory.summarized, offset), cut):
+        turn = history[index - offset]
+        if turn.role == "user" and turn.content.strip():
+            lines.append(_summary_line(turn.content))
+    return HistoryWindow(
+        summary=_trim_summary(lines) if lines else "",
+        summarized=max(memory.summarized, cut),
+        recent=list(history[max(0, cut - offset):]),
+        length=length,
+    )
+
+
+def history_prompt(summary: str, recent: Sequence[Any]) -> str:
+    """Tekst historii do promptu: streszczenie starszej części + ostatnie wiadomości."""
+    parts = []
+    if summary:
+        parts.append("Wcześniej w rozmowie użytkownik napisał (streszczenie):\n" + summary)
+    parts.extend(f"{turn.role}: {turn.content}" for turn in recent)
+    return "\n".join(parts)
+
+
+def record_turn(memory: ConversationMemory, window: HistoryWindow, meta: TurnMeta) -> ConversationMemory:
+    """Nowa pamięć po turze: wiadomość użytkownika i odpowiedź asystenta dochodzą do historii."""
+    return ConversationMemory(
+        history_length=window.length + 2,
+        summarized=window.summarized,
+        summary=window.summary,
+        skipped_fields=list(dict.fromkeys([*memory.skipped_fields, *meta.skipped])),
+        turns=[*memory.turns, meta][-MEMORY_MAX_TURNS:],
+    )
@@ -0,0 +1,261 @@
+"""
+Deterministyczny (regułowy) pre-pass wykrywania rozbieżności między dokumentami sprawy.
+
+Z każdego dokumentu wyciągamy wyrażeniami regularnymi daty, godziny, numery
+PESEL/NIP/REGON, kody pocztowe i nazwiska, przypisując je – tam, gdzie pozwala
+kontekst – do konkretnego pola (np. data wypadku vs data urodzenia).
+Następnie porównujemy te indeksy między dokumentami. Całość działa w milisekundach
+i nie wymaga LLM; wyniki trafiają do promptu oceny jako podpowiedzi albo
+(w trybie "rules_only") są zwracane bezpośrednio.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Iterable, Optional, Protocol
+
+
+class _Document(Protocol):
+    name: str
+    text: str
+
+
+MONTHS: dict[str, int] = {
+    "stycznia": 1, "lutego": 2, "marca": 3, "kwietnia": 4, "maja": 5, "czerwca": 6,
+    "lipca": 7, "sierpnia": 8, "września": 9, "wrzesnia": 9, "października": 10,
+    "pazdziernika": 10, "listopada": 11, "grudnia": 12,
+}
+
+_NAME = r"[A-ZĄĆĘŁŃÓŚŹŻ][a-ząćęłńóśźż]+(?:-[A-ZĄĆĘŁŃÓŚŹŻ][a-ząćęłńóśźż]+)?"
+
+NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[./-](\d{1,2})[./-](\d{4}|\d{2})\b")
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+VERBAL_DATE_RE = re.compile(
+    r"\b(\d{1,2})\s+(" + "|".join(MONTHS) + r")\s+(\d{4})", re.IGNORECASE
+)
+TIME_RE = re.compile(r"(?:\bgodz(?:\.|ina|inie)?\s*)?\b([01]?\d|2[0-3]):([0-5]\d)\b", re.IGNORECASE)
+TIME_DOT_RE = re.compile(r"\bgodz(?:\.|ina|inie)?\s*([01]?\d|2[0-3])\.([0-5]\d)\b", re.IGNORECASE)
+PESEL_RE = re.compile(r"\b\d{11}\b")
+NIP_RE = re.compile(r"\bNIP\W{0,3}((?:\d[\s-]?){9}\d)\b", re.IGNORECASE)
+REGON_RE = re.compile(r"\bREGON\W{0,3}(\d{14}|\d{9})\b", re.IGNORECASE)
+POSTAL_RE = re.compile(r"\b\d{2}-\d{3}\b")
+VICTIM_NAME_RE = re.compile(
+    r"(?i:imię i nazwisko|poszkodowan[yaej]+)\W{0,3}(" + _NAME + r")\s+(" + _NAME + r")"
+)
+WITNESS_NAME_RE = re.compile(
+    r"(?i:świadek|świadkowie|świadka|świadkiem)\W{0,3}(?:\d+[.)]\s*)?(" + _NAME + r")\s+(" + _NAME + r")"
+)
+
+# Słowa kluczowe, po których rozpoznajemy kontekst wartości (okno kilkudziesięciu znaków).
+ACCIDENT_CONTEXT_RE = re.compile(r"wypad|zdarzen", re.IGNORECASE)
+BIRTH_CONTEXT_RE = re.compile(r"urodz", re.IGNORECASE)
+PLACE_CONTEXT_RE = re.compile(r"miejsc", re.IGNORECASE)
+
+CONTEXT_WINDOW = 60
+CONTEXT_AFTER = 40
+
+# Pola, dla których w całej sprawie powinna być jedna wartość.
+FIELD_DESCRIPTIONS: dict[str, str] = {
+    "accident_date": "Różne daty wypadku w dokumentach",
+    "accident_time": "Różne godziny wypadku w dokumentach",
+    "date_of_birth": "Różne daty urodzenia poszkodowanego w dokumentach",
+    "pesel": "Różne numery PESEL w dokumentach",
+    "nip": "Różne numery NIP w dokumentach",
+    "regon": "Różne numery REGON w dokumentach",
+    "accident_place_postal_code": "Różne kody pocztowe miejsca wypadku w dokumentach",
+    "victim_name": "Różne imiona i nazwiska poszkodowanego w dokumentach",
+}
+
+FIELD_TARGETS: dict[str, str] = {
+    "accident_place_postal_code": "accident_place",
+    "victim_name": "last_name",
+}
+
+
+@dataclass
+class DocumentFacts:
+    """Wartości wyciągnięte z jednego dokumentu, pogrupowane po polach."""
+
+    name: str
+    values: dict[str, set[str]] = field(default_factory=lambda: defaultdict(set))
+
+
+@dataclass
+class RuleFinding:
+    """Rozbieżność wykryta regułowo; pola odpowiadają modelowi `Discrepancy`."""
+
+    description: str
+    fields_affected: list[str]
+    documents_involved: list[str]
+
+
+@dataclass
+class RuleReport:
+    documents: list[DocumentFacts]
+    findings: list[RuleFinding]
+
+    @property
+    def consistent(self) -> bool:
+        return not self.findings
+
+    def agreed_values(self) -> dict[str, str]:
+        """Pola, dla których wszystkie dokumenty wskazują tę samą jedną wartość."""
+        merged: dict[str, set[str]] = defaultdict(set)
+        for doc in self.documents:
+            for name, values in doc.values.items():
+                merged[name] |= values
+        return {name: next(iter(v)) for name, v in merged.items() if len(v) == 1}
+
+    def as_hints(self) -> str:
+        if not self.findings:
+            return "Reguły nie wykryły rozbieżności w datach, godzinach, identyfikatorach ani nazwiskach."
+        return "\n".join(
+            f"- {f.description} (dokumenty: {', '.join(f.documents_involved)})"
+            for f in self.findings
+        )
+
+
+def _iso(year: int, month: int, day: int) -> Optional[str]:
+    if year < 100:
+        year += 2000 if year <= date.today().year % 100 else 1900
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _iter_dates(text: str) -> Iterable[tuple[int, str]]:
+    for m in ISO_DATE_RE.finditer(text):
+        value = _iso(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        if value:
+            yield m.start(), value
+    for m in NUMERIC_DATE_RE.finditer(text):
+        value = _iso(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+        if value:
+            yield m.start(), value
+    for m in VERBAL_DATE_RE.finditer(text):
+        value = _iso(int(m.group(3)), MONTHS[m.group(2).lower()], int(m.group(1)))
+        if value:
+            yield m.start(), value
+
+
+def _distance(pattern: re.Pattern, text: str, pos: int) -> Optional[int]:
+    """Odległość (w znakach) od pozycji do najbliższego słowa kluczowego w oknie kontekstu."""
+    best: Optional[int] = None
+    for m in pattern.finditer(text, max(0, pos - CONTEXT_WINDOW), pos + CONTEXT_AFTER):
+        dist = pos - m.end() if m.end() <= pos else m.start() - pos
+        if best is None or dist < best:
+            best = dist
+    return best
+
+
+def _near(pattern: re.Pattern, text: str, pos: int) -> bool:
+    return _distance(pattern, text, pos) is not None
+
+
+def _digits(value: str) -> str:
+    return re.sub(r"\D", "", value)
+
+
+def extract_document_facts(name: str, text: str) -> DocumentFacts:
+    """Indeksuje wartości z jednego dokumentu."""
+    facts = DocumentFacts(name=name)
+    values = facts.values
+
+    for pos, value in _iter_dates(text):
+        # Datę przypisujemy do bliższego kontekstu: urodzenia albo wypadku.
+        birth = _distance(BIRTH_CONTEXT_RE, text, pos)
+        accident = _distance(ACCIDENT_CONTEXT_RE, text, pos)
+        if birth is not None and (accident is None or birth < accident):
+            values["date_of_birth"].add(value)
+        elif accident is not None:
+            values["accident_date"].add(value)
+
+    for regex in (TIME_RE, TIME_DOT_RE):
+        for m in regex.finditer(text):
+            if _near(ACCIDENT_CONTEXT_RE, text, m.start()):
+                values["accident_time"].add(f"{int(m.group(1)):02d}:{m.group(2)}")
+
+    for m in PESEL_RE.finditer(text):
+        values["pesel"].add(m.group(0))
+    for m in NIP_RE.finditer(text):
+        values["nip"].add(_digits(m.group(1)))
+    for m in REGON_RE.finditer(text):
+        values["regon"].add(m.group(1))
+
+    for m in POSTAL_RE.finditer(text):
+        if _near(PLACE_CONTEXT_RE, text, m.start()) and _near(ACCIDENT_CONTEXT_RE, text, m.start()):
+            values["accident_place_postal_code"].add(m.group(0))
+
+    for m in VICTIM_NAME_RE.finditer(text):
+        values["victim_name"].add(f"{m.group(1)} {m.group(2)}")
+    for m in WITNESS_NAME_RE.finditer(text):
+        values["witness_name"].add(f"{m.group(1)} {m.group(2)}")
+
+    # Nie zostawiamy pustych zbiorów po defaultdict.
+    facts.values = {k: v for k, v in values.items() if v}
+    return facts
+
+
+def _single_value_conflicts(documents: list[DocumentFacts]) -> list[RuleFinding]:
+    findings: list[RuleFinding] = []
+    for field_name, description in FIELD_DESCRIPTIONS.items():
+        with_values = [d for d in documents if field_name in d.values]
+        conflicting: list[DocumentFacts] = []
+        # Konflikt = dwa dokumenty bez żadnej wspólnej wartości danego pola.
+        for i, a in enumerate(with_values):
+            for b in with_values[i + 1:]:
+                if not (a.values[field_name] & b.values[field_name]):
+                    for doc in (a, b):
+                        if doc not in conflicting:
+                            conflicting.append(doc)
+        if conflicting:
+            details = "; ".join(
+                f"{d.name}: {', '.join(sorted(d.values[field_name]))}" for d in conflicting
+            )
+            findings.append(
+                RuleFinding(
+                    description=f"{description} ({details})",
+                    fields_affected=[FIELD_TARGETS.get(field_name, field_name)],
+                    documents_involved=[d.name for d in conflicting],
+                )
+            )
+    return findings
+
+
+def _witness_conflicts(documents: list[DocumentFacts]) -> list[RuleFinding]:
+    """Ten sam świadek (nazwisko) zapisany z różnymi imionami w różnych dokumentach."""
+    first_names: dict[str, dict[str, set[str]]] = defaultdict(lambda: defaultdict(set))
+    for doc in documents:
+        for full_name in doc.values.get("witness_name", ()):
+            first, last = full_name.split(" ", 1)
+            first_names[last][first].add(doc.name)
+
+    findings: list[RuleFinding] = []
+    for last, variants in first_names.items():
+        if len(variants) < 2:
+            continue
+        details = "; ".join(
+            f"{first} {last} ({', '.join(sorted(docs))})" for first, docs in sorted(variants.items())
+        )
+        involved = sorted({d for docs in variants.values() for d in docs})
+        findings.append(
+            RuleFinding(
+                description=f"Niespójne dane świadka: {details}",
+                fields_affected=["witnesses"],
+                documents_involved=involved,
+            )
+        )
+    return findings
+
+
+def check_documents(documents: Iterable[_Document]) -> RuleReport:
+    """
+    Buduje indeks wartości dla wszystkich dokumentów i zwraca wykryte konflikty.
+    """
+    facts = [extract_document_facts(doc.name, doc.text) for doc in documents]
+    findings = _single_value_conflicts(facts) + _witness_conflicts(facts)
+    return RuleReport(documents=facts, findings=findings)
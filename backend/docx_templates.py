@@ -0,0 +1,216 @@
+"""
+Generowanie DOCX z gotowych szablonów (bez modelu obiektowego python-docx).
+
+Szablon to zwykły plik .docx (zob. `templates/build_templates.py`) z polami
+`{{nazwa}}` w tekście oraz sekcjami w osobnych akapitach:
+
+    {{#nazwa}}  ...akapity...  {{/nazwa}}
+
+Sekcja z listą jest powtarzana dla każdego elementu (pola elementu przesłaniają
+pola nadrzędne), z wartością niepustą – wstawiana raz, z pustą – pomijana.
+Akapity ze znacznikami sekcji znikają z wyniku.
+
+`word/document.xml` jest kompilowany raz na proces do listy fragmentów, a pozostałe
+wpisy archiwum (style, numeracja, motyw...) są kopiowane bajt w bajt – razem
+z gotowymi nagłówkami ZIP i wpisami katalogu centralnego. Przy renderowaniu
+składamy tylko tekst dokumentu, kompresujemy go i dopisujemy na końcu archiwum.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from typing import Any, Mapping, Optional
+
+TEMPLATE_DIR = os.getenv("ZANT_DOCX_TEMPLATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+DOCUMENT_PART = "word/document.xml"
+
+_SECTION = re.compile(r"\{\{([#/])(\w+)\}\}")
+_FIELD = re.compile(r"\{\{(\w+)\}\}")
+# Znaki sterujące niedozwolone w XML 1.0 (poza \t, \n, \r).
+_INVALID_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Węzły skompilowanego szablonu: ("text", xml) | ("field", nazwa) | ("section", nazwa, węzły)
+Node = tuple
+
+
+def _escape(value: Any) -> str:
+    """Wartość pola jako treść <w:t>: encje XML, złamania wiersza i tabulatory jak w python-docx."""
+    if value is None:
+        return ""
+    text = _INVALID_XML.sub("", str(value))
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if "\n" in text or "\t" in text:
+        text = text.replace("\r\n", "\n")
+        text = text.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+        text = text.replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    return text
+
+
+def _paragraph_bounds(xml: str, start: int, end: int) -> tuple[int, int]:
+    """Granice akapitu <w:p> zawierającego fragment xml[start:end]."""
+    p_start = max(xml.rfind("<w:p>", 0, start), xml.rfind("<w:p ", 0, start))
+    p_end = xml.find("</w:p>", end)
+    if p_start < 0 or p_end < 0:
+        raise ValueError("Znacznik sekcji poza akapitem")
+    return p_start, p_end + len("</w:p>")
+
+
+def compile_template(xml: str) -> list[Node]:
+    root: list[Node] = []
+    stack: list[list[Node]] = [root]
+    open_sections: list[str] = []
+
+    def add_text(fragment: str) -> None:
+        pos = 0
+        for match in _FIELD.finditer(fragment):
+            if match.start() > pos:
+                stack[-1].append(("text", fragment[pos:match.start()]))
+            stack[-1].append(("field", match.group(1)))
+            pos = match.end()
+        if pos < len(fragment):
+            stack[-1].append(("text", fragment[pos:]))
+
+    pos = 0
+    for match in _SECTION.finditer(xml):
+        p_start, p_end = _paragraph_bounds(xml, match.start(), match.end())
+        add_text(xml[pos:p_start])
+        pos = p_end
+        kind, name = match.groups()
+        if kind == "#":
+            section: list[Node] = []
+            stack[-1].append(("section", name, section))
+            stack.append(section)
+            open_sections.append(name)
+        else:
+            if not open_sections or open_sections.pop() != name:
+                raise ValueError(f"Niesparowany znacznik sekcji: {{{{/{name}}}}}")
+            stack.pop()
+    if open_sections:
+        raise ValueError(f"Niedomknięta sekcja: {{{{#{open_sections[-1]}}}}}")
+    add_text(xml[pos:])
+    return root
+
+
+def _render_nodes(nodes: list[Node], context: Mapping[str, Any], out: list[str]) -> None:
+    for node in nodes:
+        kind = node[0]
+        if kind == "text":
+            out.append(node[1])
+        elif kind == "field":
+            out.append(_escape(context.get(node[1])))
+        else:
+            value = context.get(node[1])
+            if isinstance(value, (list, tuple)):
+                for item in value:
+                    _render_nodes(node[2], {**context, **item}, out)
+            elif value:
+                _render_nodes(node[2], context, out)
+
+
+def _dos_datetime(date_time: tuple[int, ...]) -> tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def _local_header(name: bytes, method: int, dos: tuple[int, int], crc: int, csize: int, size: int) -> bytes:
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, 20, 0, method, dos[0], dos[1], crc, csize, size, len(name), 0
+    ) + name
+
+
+def _central_header(
+    name: bytes, method: int, dos: tuple[int, int], crc: int, csize: int, size: int, offset: int
+) -> bytes:
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50, 20, 20, 0, method, dos[0], dos[1], crc, csize, size, len(name), 0, 0, 0, 0, 0, offset,
+    ) + name
+
+
+class DocxTemplate:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read()
+        self.version = hashlib.sha256(data).hexdigest()[:16]
+
+        prefix = io.BytesIO()
+        central = io.BytesIO()
+        count = 0
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                if info.filename == DOCUMENT_PART:
+                    self.nodes = compile_template(archive.read(info).decode("utf-8"))
+                    self._document_dos = _dos_datetime(info.date_time)
+                    continue
+                # Surowe (skompresowane) bajty wpisu, bez ponownej kompresji.
+                fixed = data[info.header_offset:info.header_offset + 30]
+                name_len, extra_len = struct.unpack("<HH", fixed[26:30])
+                start = info.header_offset + 30 + name_len + extra_len
+                raw = data[start:start + info.compress_size]
+
+                name = info.filename.encode("utf-8")
+                dos = _dos_datetime(info.date_time)
+                offset = prefix.tell()
+                prefix.write(_local_header(name, info.compress_type, dos, info.CRC, info.compress_size, info.file_size))
+                prefix.write(raw)
+                central.write(_central_header(
+                    name, info.compress_type, dos, info.CRC, info.compress_size, info.file_size, offset
+                ))
+                count += 1
+        if not hasattr(self, "nodes"):
+            raise ValueError(f"{path}: brak {DOCUMENT_PART}")
+
+        # Niezmienne części archiwum: wpisy przed dokumentem i ich katalog centralny.
+        self._prefix = prefix.getvalue()
+        self._central = central.getvalue()
+        self._count = count + 1
+
+    def render_xml(self, context: Mapping[str, Any]) -> str:
+        out: list[str] = []
+        _render_nodes(self.nodes, context, out)
+        return "".join(out)
+
+    def render(self, context: Mapping[str, Any]) -> io.BytesIO:
+        xml = self.render_xml(context).encode("utf-8")
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(xml) + compressor.flush()
+        crc = zlib.crc32(xml)
+
+        name = DOCUMENT_PART.encode("utf-8")
+        offset = len(self._prefix)
+        local = _local_header(name, zipfile.ZIP_DEFLATED, self._document_dos, crc, len(compressed), len(xml))
+        central = self._central + _central_header(
+            name, zipfile.ZIP_DEFLATED, self._document_dos, crc, len(compressed), len(xml), offset
+        )
+        central_offset = offset + len(local) + len(compressed)
+        end = struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, self._count, self._count, len(central), central_offset, 0)
+
+        out = io.BytesIO()
+        for part in (self._prefix, local, compressed, central, end):
+            out.write(part)
+        out.seek(0)
+        return out
+
+
+_templates: dict[str, DocxTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def load_docx_template(name: str, template_dir: Optional[str] = None) -> DocxTemplate:
+    """Zwraca szablon (np. "zawiadomienie.docx") wczytany i skompilowany raz na proces."""
+    path = os.path.join(template_dir or TEMPLATE_DIR, name)
+    template = _templates.get(path)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(path)
+            if template is None:
+                template = _templates[path] = DocxTemplate(path)
+    return template
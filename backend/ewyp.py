@@ -0,0 +1,252 @@
+"""
+Szablon formularza ZUS EWYP wczytywany raz na proces.
+
+Przy wczytaniu strony szablonu są kopiowane do "wzorcowego" PdfWritera,
+naprawiana jest struktura AcroForm (usunięcie XFA, NeedAppearances) i budowany
+jest indeks (strona, nazwa pola) -> obiekt adnotacji. Wypełnienie formularza
+dla żądania pracuje na płytkiej kopii tablicy obiektów wzorca: kopiowane są
+tylko słowniki pól, którym nadajemy wartość, reszta dokumentu jest współdzielona.
+
+Domyślnie (ZANT_EWYP_OUTPUT=incremental) wynik nie jest serializowany od nowa:
+do oryginalnych bajtów szablonu dopisujemy aktualizację przyrostową PDF
+(zmienione słowniki pól, poprawiony AcroForm i katalog, strumień xref z /Prev).
+Tryb "full" zapisuje cały dokument przez PdfWriter; kopia wzorca współdzieli
+z nim wewnętrzne struktury pypdf (zapis je modyfikuje), więc wypełnienia w tym
+trybie są szeregowane blokadą szablonu.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import io
+import os
+import threading
+from dataclasses import dataclass
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    BooleanObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+CHECKBOX_VALUES = ("/Yes", "/Off")
+
+OUTPUT_INCREMENTAL = "incremental"
+OUTPUT_FULL = "full"
+OUTPUT_MODE = os.getenv("ZANT_EWYP_OUTPUT", OUTPUT_INCREMENTAL)
+
+
+@dataclass(frozen=True)
+class FieldRef:
+    page: int
+    name: str
+    # Numer obiektu adnotacji we wzorcowym PdfWriterze.
+    idnum: int
+    # Odwołanie do tej samej adnotacji w oryginalnym pliku (aktualizacja przyrostowa).
+    source: IndirectObject
+
+
+class EwypTemplate:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = f.read()
+        # Wersja szablonu (np. do kluczy pamięci podręcznej wygenerowanych dokumentów).
+        self.version = hashlib.sha256(self.data).hexdigest()[:16]
+        self.reader = PdfReader(io.BytesIO(self.data))
+
+        self._writer = PdfWriter()
+        self._writer.append_pages_from_reader(self.reader)
+        self._fix_acroform(self._writer)
+        self.fields = self._index_fields(self._writer, self.reader)
+
+        # Słowniki pól z oryginału rozwiązujemy od razu – PdfReader nie jest
+        # bezpieczny wątkowo, a przy wypełnianiu potrzebujemy tylko ich kopii.
+        self._source_fields = {
+            ref.source.idnum: ref.source.get_object() for ref in self.fields.values()
+        }
+        self._fixed_objects = self._build_fixed_objects()
+        self._full_lock = threading.Lock()
+
+    @staticmethod
+    def _fix_acroform(writer: PdfWriter) -> None:
+        if "/AcroForm" not in writer.root_object:
+            writer.root_object[NameObject("/AcroForm")] = DictionaryObject()
+
+        acroform = writer.root_object["/AcroForm"]
+
+        # Usuwamy XFA (dynamiczny formularz), zostawiamy tylko nasze dane statyczne
+        if "/XFA" in acroform:
+            del acroform["/XFA"]
+        if "/XFA" in writer.root_object:  # Czasem jest też w root
+            del writer.root_object["/XFA"]
+
+        # Wymuszamy na Adobe Readerze przeliczenie wyglądu
+        acroform[NameObject("/NeedAppearances")] = BooleanObject(True)
+
+    @staticmethod
+    def _index_fields(writer: PdfWriter, reader: PdfReader) -> dict[tuple[int, str], FieldRef]:
+        fields: dict[tuple[int, str], FieldRef] = {}
+        for page_num, (page, source_page) in enumerate(zip(writer.pages, reader.pages)):
+            # append_pages_from_reader zachowuje kolejność adnotacji na stronie.
+            source_annots = source_page.get("/Annots", [])
+            for annot, source in zip(page.get("/Annots", []), source_annots):
+                obj = annot.get_object()
+                if "/T" in obj:
+                    key = (page_num, str(obj["/T"]))
+                    fields[key] = FieldRef(page_num, key[1], annot.idnum, source)
+        return fields
+
+    def _build_fixed_objects(self) -> list[tuple[int, bytes]]:
+        """
+        Obiekty aktualizacji przyrostowej niezależne od danych sprawy, serializowane raz:
+        katalog bez /XFA i /Perms (podpis rozszerzeń Readera nie przetrwa zmian)
+        oraz AcroForm bez XFA z NeedAppearances. Zwraca pary (numer obiektu, bajty).
+        """
+        root_ref = self.reader.trailer.raw_get("/Root")
+        root = DictionaryObject(root_ref.get_object())
+        for key in ("/XFA", "/Perms"):
+            if key in root:
+                del root[key]
+
+        objects: list[tuple[IndirectObject, DictionaryObject]] = []
+        acroform_ref = root.raw_get("/AcroForm") if "/AcroForm" in root else None
+        acroform = DictionaryObject(acroform_ref.get_object()) if acroform_ref else DictionaryObject()
+        if "/XFA" in acroform:
+            del acroform["/XFA"]
+        acroform[NameObject("/NeedAppearances")] = BooleanObject(True)
+        if isinstance(acroform_ref, IndirectObject):
+            objects.append((acroform_ref, acroform))
+        else:
+            root[NameObject("/AcroForm")] = acroform
+        objects.append((root_ref, root))
+        return [(ref.idnum, _serialize(ref, obj)) for ref, obj in objects]
+
+    def _set_value(self, obj: DictionaryObject, value: str) -> DictionaryObject:
+        """Zwraca kopię słownika pola z nadaną wartością (wzorzec zostaje nietknięty)."""
+        filled = DictionaryObject(obj)
+        # Logika dla Checkboxów vs Tekst
+        if value in CHECKBOX_VALUES:
+            filled[NameObject("/V")] = NameObject(value)
+            filled[NameObject("/AS")] = NameObject(value)
+        else:
+            filled[NameObject("/V")] = TextStringObject(value)
+
+        # KLUCZOWE: Usuwamy /AP, aby wymusić renderowanie tekstu
+        if "/AP" in filled:
+            del filled["/AP"]
+        return filled
+
+    def fill(self, page_values: dict[int, dict[str, str]], mode: str = OUTPUT_MODE) -> io.BytesIO:
+        """
+        Wypełnia pola wskazane jako {numer strony (od 0): {nazwa pola: wartość}}.
+        Nieznane pola są pomijane; koszt zależy od liczby wypełnianych pól.
+        """
+        if mode == OUTPUT_INCREMENTAL:
+            return self._fill_incremental(page_values)
+
+        with self._full_lock:
+            writer = copy.copy(self._writer)
+            writer._objects = list(self._writer._objects)
+
+            for page_num, values in page_values.items():
+                for name, value in values.items():
+                    ref = self.fields.get((page_num, name))
+                    if ref is None:
+                        continue
+                    writer._objects[ref.idnum - 1] = self._set_value(
+                        self._writer._objects[ref.idnum - 1], value
+                    )
+
+            out = io.BytesIO()
+            writer.write(out)
+        out.seek(0)
+        return out
+
+    def _fill_incremental(self, page_values: dict[int, dict[str, str]]) -> io.BytesIO:
+        out = io.BytesIO()
+        out.write(self.data)
+        if not self.data.endswith(b"\n"):
+            out.write(b"\n")
+
+        offsets: dict[int, int] = {}
+        for page_num, values in page_values.items():
+            for name, value in values.items():
+                ref = self.fields.get((page_num, name))
+                if ref is None:
+                    continue
+                filled = self._set_value(self._source_fields[ref.source.idnum], value)
+                offsets[ref.source.idnum] = out.tell()
+                out.write(_serialize(ref.source, filled))
+
+        for idnum, data in self._fixed_objects:
+            offsets[idnum] = out.tell()
+            out.write(data)
+
+        self._write_xref_stream(out, offsets)
+        out.seek(0)
+        return out
+
+    def _write_xref_stream(self, out: io.BytesIO, offsets: dict[int, int]) -> None:
+        """Sekcja xref aktualizacji (jako strumień, tak jak w oryginale) z /Prev do poprzedniej."""
+        trailer = self.reader.trailer
+        xref_id = int(trailer["/Size"])
+        xref_pos = out.tell()
+        offsets[xref_id] = xref_pos
+
+        ids = sorted(offsets)
+        index: list[int] = []
+        for idnum in ids:
+            if index and index[-2] + index[-1] == idnum:
+                index[-1] += 1
+            else:
+                index += [idnum, 1]
+
+        xref = StreamObject()
+        xref.update(
+            {
+                NameObject("/Type"): NameObject("/XRef"),
+                NameObject("/Size"): NumberObject(xref_id + 1),
+                NameObject("/Index"): ArrayObject(NumberObject(n) for n in index),
+                NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(4), NumberObject(1)]),
+                NameObject("/Prev"): NumberObject(self.reader._startxref),
+            }
+        )
+        for key in ("/Root", "/Info", "/ID"):
+            if key in trailer:
+                xref[NameObject(key)] = trailer.raw_get(key)
+        xref.set_data(b"".join(bytes([1]) + offsets[i].to_bytes(4, "big") + b"\0" for i in ids))
+
+        out.write(f"{xref_id} 0 obj\n".encode())
+        xref.write_to_stream(out)
+        out.write(f"\nendobj\nstartxref\n{xref_pos}\n%%EOF\n".encode())
+
+
+def _serialize(ref: IndirectObject, obj: DictionaryObject) -> bytes:
+    buf = io.BytesIO()
+    buf.write(f"{ref.idnum} {ref.generation} obj\n".encode())
+    obj.write_to_stream(buf)
+    buf.write(b"\nendobj\n")
+    return buf.getvalue()
+
+
+_templates: dict[str, EwypTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def load_ewyp_template(path: str = "EWYP.pdf") -> EwypTemplate:
+    """Zwraca szablon wczytany raz na proces (per ścieżka)."""
+    template = _templates.get(path)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(path)
+            if template is None:
+                template = _templates[path] = EwypTemplate(path)
+    return template
@@ -0,0 +1,477 @@
+"""
+Wymienny dostawca modeli czatu używanych przez `main.get_llm()` i `ocr._get_llm()`.
+
+Tryb wybieramy zmienną środowiskową ZANT_LLM_PROVIDER:
+- "gemini" (domyślnie) – ChatGoogleGenerativeAI, tak jak dotychczas,
+- "fake"   – skryptowany model offline z konfigurowalnym opóźnieniem,
+- "record" – Gemini + zapis odpowiedzi i czasów do pliku JSONL,
+- "replay" – odtwarza nagrane odpowiedzi z zachowaniem nagranych czasów.
+
+Tryby "fake" i "replay" nie wymagają sieci ani klucza API – służą do testów
+obciążeniowych (zob. `loadtest.py`).
+
+Gdy włączona jest pamięć współdzielona (ZANT_CACHE_DB, zob. `shared_cache.py`),
+modele "gemini" i "fake" zapamiętują odpowiedzi na identyczne prompty
+(`SharedLLMCache`) – wspólnie dla wszystkich procesów roboczych.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict, Field, PrivateAttr
+
+from shared_cache import SharedCache, shared_cache
+
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+PROVIDER_ENV = "ZANT_LLM_PROVIDER"
+FAKE_LATENCY_ENV = "ZANT_FAKE_LLM_LATENCY"
+FAKE_SCRIPT_ENV = "ZANT_FAKE_LLM_SCRIPT"
+RECORDING_PATH_ENV = "ZANT_LLM_RECORDING"
+
+DEFAULT_RECORDING_PATH = "llm_recording.jsonl"
+
+
+# --- Rozpoznawanie rodzaju zapytania ---
+
+# Kolejność ma znaczenie: prompt oceny dokumentów wspomina także o CaseState,
+# a prompt planu działań zawiera dane CaseState.
+_KIND_MARKERS: list[tuple[str, str]] = [
+    ("case_evaluation", "CaseEvaluationResult"),
+    ("action_plan", "ActionPlan"),
+    ("skip", "YES albo NO"),
+    ("case_state", "CaseState"),
+]
+
+
+def classify_prompt(messages: List[BaseMessage]) -> str:
+    """
+    Zwraca rodzaj zapytania (case_evaluation / action_plan / skip / case_state / text)
+    na podstawie treści promptu.
+    """
+    text = "\n".join(str(m.content) for m in messages)
+    for kind, marker in _KIND_MARKERS:
+        if marker in text:
+            return kind
+    return "text"
+
+
+def prompt_key(messages: List[BaseMessage]) -> str:
+    """Stabilny klucz promptu używany do nagrywania i odtwarzania odpowiedzi."""
+    payload = json.dumps(
+        [[m.type, str(m.content)] for m in messages], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """Zgrubne oszacowanie liczby tokenów (~4 znaki na token)."""
+    return max(1, len(text) // 4)
+
+
+def _usage(messages: List[BaseMessage], content: str) -> dict:
+    prompt_tokens = estimate_tokens("".join(str(m.content) for m in messages))
+    completion_tokens = estimate_tokens(content)
+    return {
+        "input_tokens": prompt_tokens,
+        "output_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+# --- Rozkłady opóźnień ---
+
+def parse_latency(spec: Optional[str]) -> Callable[[], float]:
+    """
+    Buduje losowanie opóźnienia (w sekundach) ze specyfikacji tekstowej:
+    - "fixed:0.8",
+    - "uniform:0.3,1.5",
+    - "normal:0.8,0.2" (średnia, odchylenie),
+    - "lognormal:-0.3,0.5" (mu, sigma rozkładu normalnego pod spodem),
+    - "exp:0.7" (średnia).
+    Ujemne wartości są obcinane do zera.
+    """
+    if not spec:
+        return lambda: 0.0
+
+    name, _, raw_args = spec.partition(":")
+    try:
+        args = [float(a) for a in raw_args.split(",") if a.strip()]
+    except ValueError as exc:
+        raise ValueError(f"Invalid latency spec: {spec!r}") from exc
+
+    name = name.strip().lower()
+    if name == "fixed" and len(args) == 1:
+        return lambda: max(0.0, args[0])
+    if name == "uniform" and len(args) == 2:
+        return lambda: max(0.0, random.uniform(args[0], args[1]))
+    if name == "normal" and len(args) == 2:
+        return lambda: max(0.0, random.gauss(args[0], args[1]))
+    if name == "lognormal" and len(args) == 2:
+        return lambda: random.lognormvariate(args[0], args[1])
+    if name == "exp" and len(args) == 1 and args[0] > 0:
+        return lambda: random.expovariate(1.0 / args[0])
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+# --- Domyślny skrypt modelu fake ---
+
+# Kolejne etapy odsłaniania danych sprawy. Model fake scala tyle etapów,
+# ile wiadomości użytkownika widzi w historii rozmowy, dzięki czemu
+# symulowana rozmowa przechodzi przez kolejne kategorie pytań.
+DEFAULT_CASE_STATE_STEPS: list[dict] = [
+    {
+        "reporter_type": "victim",
+        "first_name": "Jan",
+        "last_name": "Kowalski",
+        "pesel": "80010112340",
+        "date_of_birth": "1980-01-01",
+        "address_home": "ul. Długa 5/10, 00-123 Warszawa",
+        "address_correspondence": "ul. Długa 5/10, 00-123 Warszawa",
+    },
+    {
+        "nip": "1234563218",
+        "regon": "123456785",
+        "business_address": "ul. Firmowa 10, 30-001 Kraków",
+        "pkd": "43.22.Z",
+        "business_description": "Wykonywanie instalacji wodno-kanalizacyjnych",
+    },
+    {
+        "accident_date": "2025-11-20",
+        "accident_time": "10:30",
+        "accident_place": "Budynek klienta, ul. Polna 3, Kraków",
+        "planned_work_start": "08:00",
+        "planned_work_end": "16:00",
+        "injury_type": "Złamanie kości przedramienia",
+    },
+    {
+        "accident_description": (
+            "Podczas montażu instalacji wchodziłem po drabinie, noga ześlizgnęła się "
+            "ze stopnia i upadłem na posadzkę, łamiąc lewe przedramię."
+        ),
+        "first_aid_info": "Pogotowie ratunkowe, SOR Szpitala Miejskiego",
+        "proceedings_info": "Brak postępowania policji",
+        "equipment_info": "Drabina aluminiowa, sprawna technicznie",
+    },
+]
+
+DEFAULT_ACTION_PLAN: dict = {
+    "actions": [
+        {
+            "step_number": 1,
+            "description": "Zgłoś wypadek w placówce ZUS lub przez PUE ZUS.",
+            "required_documents": ["Zawiadomienie o wypadku"],
+        },
+        {
+            "step_number": 2,
+            "description": "Złóż wniosek o sporządzenie karty wypadku.",
+            "required_documents": ["Wyjaśnienia poszkodowanego", "Zeznania świadków"],
+        },
+        {
+            "step_number": 3,
+            "description": "Dostarcz dokumentację medyczną.",
+            "required_documents": ["Zaświadczenie OL-9", "Karta informacyjna ze szpitala"],
+        },
+    ]
+}
+
+DEFAULT_CASE_EVALUATION: dict = {
+    "normalized_case_state": {},
+    "discrepancies": [],
+    "missing_fields": [],
+    "missing_documents": [],
+    "opinion": "inconclusive",
+    "opinion_explanation": "Odpowiedź wygenerowana przez model testowy (fake).",
+    "accident_card_draft": "KARTA WYPADKU (fake)",
+}
+
+DEFAULT_TEXT = (
+    "OKOLICZNOŚCI ZDARZENIA\nOdpowiedź wygenerowana przez model testowy (fake).\n\n"
+    "WERDYKT\nBrak oceny – tryb testowy."
+)
+
+
+def load_fake_script(path: Optional[str]) -> dict:
+    """
+    Wczytuje skrypt modelu fake z pliku JSON. Rozpoznawane klucze:
+    case_state_steps, action_plan, case_evaluation, skip, text
+    oraz latency (słownik rodzaj -> specyfikacja opóźnienia).
+    Brakujące klucze uzupełniamy domyślnymi odpowiedziami.
+    """
+    script: dict = {
+        "case_state_steps": DEFAULT_CASE_STATE_STEPS,
+        "action_plan": DEFAULT_ACTION_PLAN,
+        "case_evaluation": DEFAULT_CASE_EVALUATION,
+        "skip": "NO",
+        "text": DEFAULT_TEXT,
+        "latency": {},
+    }
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            script.update(json.load(f))
+    return script
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Model czatu offline zwracający gotowe odpowiedzi strukturalne
+    (CaseState, ActionPlan, CaseEvaluationResult) po losowym opóźnieniu.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    script: dict = Field(default_factory=lambda: load_fake_script(None))
+    latency: Optional[str] = None
+
+    _samplers: Dict[str, Callable[[], float]] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "zant-fake"
+
+    def _sampler(self, kind: str) -> Callable[[], float]:
+        if kind not in self._samplers:
+            spec = (self.script.get("latency") or {}).get(kind, self.latency)
+            self._samplers[kind] = parse_latency(spec)
+        return self._samplers[kind]
+
+    def _content_for(self, kind: str, messages: List[BaseMessage]) -> str:
+        if kind == "case_state":
+            user_turns = sum(
+                str(m.content).count("\nuser: ") for m in messages
+            ) + 1
+            state: dict = {}
+            for step in self.script["case_state_steps"][:user_turns]:
+                state.update(step)
+            return json.dumps(state, ensure_ascii=False)
+        if kind == "action_plan":
+            return json.dumps(self.script["action_plan"], ensure_ascii=False)
+        if kind == "case_evaluation":
+            return json.dumps(self.script["case_evaluation"], ensure_ascii=False)
+        if kind == "skip":
+            return str(self.script["skip"])
+        return str(self.script["text"])
+
+    def _respond(self, messages: List[BaseMessage]) -> tuple[ChatResult, float]:
+        kind = classify_prompt(messages)
+        content = self._content_for(kind, messages)
+        message = AIMessage(content=content, usage_metadata=_usage(messages, content))
+        return ChatResult(generations=[ChatGeneration(message=message)]), self._sampler(kind)()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        result, delay = self._respond(messages)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        result, delay = self._respond(messages)
+        await asyncio.sleep(delay)
+        return result
+
+
+class RecordingChatModel(BaseChatModel):
+    """
+    Opakowuje prawdziwy model i dopisuje każdą odpowiedź wraz z czasem
+    jej uzyskania do pliku JSONL (do późniejszego odtwarzania).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: Any
+    path: str = DEFAULT_RECORDING_PATH
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "zant-record"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        start = time.perf_counter()
+        response = self.inner.invoke(messages, stop=stop, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        content = str(response.content)
+        record = {
+            "key": prompt_key(messages),
+            "kind": classify_prompt(messages),
+            "latency_s": round(elapsed, 4),
+            "content": content,
+            "usage": getattr(response, "usage_metadata", None),
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        message = AIMessage(
+            content=content,
+            usage_metadata=getattr(response, "usage_metadata", None),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Odtwarza odpowiedzi nagrane przez RecordingChatModel z nagranym opóźnieniem.
+
+    Najpierw szukamy nagrania dokładnie tego promptu; jeśli go nie ma,
+    bierzemy kolejne nagranie tego samego rodzaju (round-robin),
+    co pozwala odtwarzać ruch dla rozmów innych niż nagrane.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    path: str = DEFAULT_RECORDING_PATH
+
+    _by_key: Dict[str, deque] = PrivateAttr(default_factory=lambda: defaultdict(deque))
+    _by_kind: Dict[str, deque] = PrivateAttr(default_factory=lambda: defaultdict(deque))
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._by_key[record["key"]].append(record)
+                self._by_kind[record["kind"]].append(record)
+
+    @property
+    def _llm_type(self) -> str:
+        return "zant-replay"
+
+    def _next_record(self, messages: List[BaseMessage]) -> dict:
+        with self._lock:
+            for queue in (
+                self._by_key.get(prompt_key(messages)),
+                self._by_kind.get(classify_prompt(messages)),
+            ):
+                if queue:
+                    record = queue[0]
+                    queue.rotate(-1)
+                    return record
+        raise LookupError("No recorded LLM response matches this prompt")
+
+    def _respond(self, messages: List[BaseMessage]) -> tuple[ChatResult, float]:
+        record = self._next_record(messages)
+        content = record["content"]
+        message = AIMessage(
+            content=content,
+            usage_metadata=record.get("usage") or _usage(messages, content),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)]), float(record["latency_s"])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        result, delay = self._respond(messages)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        result, delay = self._respond(messages)
+        await asyncio.sleep(delay)
+        return result
+
+
+# --- Pamięć odpowiedzi współdzielona przez procesy ---
+
+class SharedLLMCache(BaseCache):
+    """
+    Pamięć odpowiedzi modelu (klucz: skrót promptu i parametrów modelu) w `SharedCache`.
+    Zapisujemy samą treść odpowiedzi, bez usage_metadata – trafienie nie zużywa
+    tokenów, więc ewidencja (`usage.py`) go nie liczy.
+    """
+
+    NAMESPACE = "llm"
+
+    def __init__(self, store: SharedCache) -> None:
+        self.store = store
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[list[ChatGeneration]]:
+        contents = self.store.get_json(self.NAMESPACE, self._key(prompt, llm_string))
+        if contents is None:
+            return None
+        return [ChatGeneration(message=AIMessage(content=content)) for content in contents]
+
+    def update(self, prompt: str, llm_string: str, return_val: list) -> None:
+        contents = [getattr(getattr(g, "message", None), "content", g.text) for g in return_val]
+        self.store.set_json(self.NAMESPACE, self._key(prompt, llm_string), contents)
+
+    def clear(self, **kwargs: Any) -> None:
+        pass  # wpisy wygasają same (ZANT_CACHE_TTL)
+
+
+def _llm_cache() -> Optional[SharedLLMCache]:
+    store = shared_cache()
+    return SharedLLMCache(store) if store is not None else None
+
+
+def _create_gemini() -> ChatGoogleGenerativeAI:
+    # Klient Gemini (google.genai) importujemy dopiero tutaj – to ~0,5 s importu,
+    # którego tryby fake/replay i sam start aplikacji nie potrzebują.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+        temperature=0,
+        cache=_llm_cache(),
+    )
+
+
+# Modele offline trzymamy jako singletony procesu – replay ma wspólny stan
+# odtwarzania, a fake nie musi ponownie wczytywać skryptu.
+_shared_models: dict[str, BaseChatModel] = {}
+_shared_lock = threading.Lock()
+
+
+def create_chat_model() -> BaseChatModel:
+    """
+    Zwraca model czatu zgodnie z ZANT_LLM_PROVIDER.
+    Dla "gemini" (domyślnie) zachowuje się jak dotychczasowe `get_llm()`.
+    """
+    provider = os.getenv(PROVIDER_ENV, "gemini").strip().lower()
+    if provider == "gemini":
+        return _create_gemini()
+    if provider == "record":
+        # Nagranie ma zawierać prawdziwe wywołania, więc bez pamięci odpowiedzi.
+        inner = _create_gemini()
+        inner.cache = None
+        return RecordingChatModel(
+            inner=inner,
+            path=os.getenv(RECORDING_PATH_ENV, DEFAULT_RECORDING_PATH),
+        )
+
+    with _shared_lock:
+        if provider not in _shared_models:
+            if provider == "fake":
+                # Bez pamięci odpowiedzi – testy obciążeniowe mierzą opóźnienie modelu, nie trafienia.
+                _shared_models[provider] = ScriptedChatModel(
+                    script=load_fake_script(os.getenv(FAKE_SCRIPT_ENV)),
+                    latency=os.getenv(FAKE_LATENCY_ENV),
+                    cache=False,
+                )
+            elif provider == "replay":
+                _shared_models[provider] = ReplayChatModel(
+                    path=os.getenv(RECORDING_PATH_ENV, DEFAULT_RECORDING_PATH),
+                )
+            else:
+                raise ValueError(f"Unknown {PROVIDER_ENV}: {provider!r}")
+        return _shared_models[provider]
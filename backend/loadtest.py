@@ -0,0 +1,193 @@
+# loadtest.py
+"""
+Generator obciążenia dla backendu ZANT.
+
+Symuluje wiele równoległych rozmów z asystentem (`/api/assistant/message`),
+opcjonalnie kończąc każdą pobraniem dokumentów i oceną dokumentów,
+a na koniec raportuje przepustowość i opóźnienia (p50/p90/p95/p99).
+
+Domyślnie aplikacja jest uruchamiana w tym samym procesie (httpx.ASGITransport)
+z modelem fake, więc nie potrzeba sieci ani klucza Gemini:
+
+    ZANT_FAKE_LLM_LATENCY=lognormal:-0.5,0.4 python loadtest.py -c 20 -n 200 --download
+
+Można też celować w działający serwer: `python loadtest.py --base-url http://localhost:8000`.
+Tryb odtwarzania nagrań: ZANT_LLM_PROVIDER=replay ZANT_LLM_RECORDING=nagranie.jsonl.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+
+USER_MESSAGES = [
+    "Zgłaszam wypadek osobiście, jestem poszkodowanym.",
+    "Jan Kowalski, PESEL 80010112340, mieszkam na ul. Długiej 5/10, 00-123 Warszawa.",
+    "NIP 1234563218, REGON 123456785, firma hydrauliczna w Krakowie.",
+    "Wypadek był 20 listopada o 10:30 u klienta, złamałem przedramię.",
+    "Spadłem z drabiny podczas montażu instalacji, noga ześlizgnęła się ze stopnia.",
+    "Pomocy udzieliło pogotowie, policja nie prowadziła postępowania.",
+]
+
+SAMPLE_DOCUMENTS = [
+    {
+        "name": "Zawiadomienie o wypadku",
+        "type": "zawiadomienie",
+        "text": "Data wypadku: 20.11.2025, godz. 10:30. Poszkodowany: Jan Kowalski, PESEL 80010112340.",
+    },
+    {
+        "name": "Wyjaśnienia poszkodowanego",
+        "type": "wyjaśnienia",
+        "text": "W dniu 20.11.2025 spadłem z drabiny podczas montażu instalacji.",
+    },
+]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def call(
+        self, client: httpx.AsyncClient, name: str, path: str, payload: dict, headers: dict | None = None
+    ) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=payload, headers=headers)
+            # Czas liczymy do odebrania całego ciała odpowiedzi (np. ZIP-a).
+            await response.aread()
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return response
+
+
+async def run_conversation(
+    client: httpx.AsyncClient, stats: Stats, conv_id: int, turns: int, download: bool, evaluate: bool
+) -> None:
+    history: list[dict] = []
+    case_state: dict | None = None
+    for turn in range(turns):
+        message = USER_MESSAGES[turn % len(USER_MESSAGES)]
+        response = await stats.call(
+            client,
+            "assistant_message",
+            "/api/assistant/message",
+            {
+                "case_id": f"load-{conv_id}",
+                "message": message,
+                "mode": "notification",
+                "conversation_history": history,
+                "case_state": case_state,
+            },
+        )
+        if response is None:
+            return
+        data = response.json()
+        history += [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": data["assistant_reply"]},
+        ]
+        case_state = data["case_state_preview"]
+
+    if download and case_state is not None:
+        await stats.call(
+            client,
+            "download_documents",
+            "/api/case/download-documents",
+            case_state,
+            headers={"X-ZANT-Case-Id": f"load-{conv_id}"},
+        )
+    if evaluate:
+        await stats.call(
+            client,
+            "evaluate_documents",
+            "/api/case/evaluate-documents",
+            {"case_id": f"load-{conv_id}", "documents": SAMPLE_DOCUMENTS},
+        )
+
+
+async def run_load(args: argparse.Namespace) -> Stats:
+    if args.base_url:
+        transport = None
+        base_url = args.base_url
+    else:
+        # Import dopiero tutaj, żeby ZANT_LLM_PROVIDER był już ustawiony.
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+
+    stats = Stats()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+        async def one(conv_id: int) -> None:
+            async with semaphore:
+                await run_conversation(client, stats, conv_id, args.turns, args.download, args.evaluate)
+
+        await asyncio.gather(*(one(i) for i in range(args.conversations)))
+    return stats
+
+
+def report(stats: Stats, elapsed: float, conversations: int) -> None:
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f"Czas całkowity: {elapsed:.2f} s")
+    print(f"Rozmowy: {conversations} ({conversations / elapsed:.2f} /s)")
+    print(f"Żądania: {total} ({total / elapsed:.2f} req/s)")
+    print()
+    header = f"{'endpoint':<22}{'n':>6}{'err':>6}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'mean':>9}"
+    print(header)
+    print("-" * len(header))
+    for name in sorted(set(stats.latencies) | set(stats.errors)):
+        samples = stats.latencies.get(name, [])
+        ms = [s * 1000 for s in samples]
+        print(
+            f"{name:<22}{len(samples):>6}{stats.errors.get(name, 0):>6}"
+            f"{percentile(ms, 50):>9.1f}{percentile(ms, 90):>9.1f}{percentile(ms, 95):>9.1f}"
+            f"{percentile(ms, 99):>9.1f}{max(ms, default=0):>9.1f}"
+            f"{statistics.fmean(ms) if ms else 0:>9.1f}"
+        )
+    print("\n(czasy w ms)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Test obciążeniowy backendu ZANT")
+    parser.add_argument("-n", "--conversations", type=int, default=50, help="liczba symulowanych rozmów")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="liczba równoległych rozmów")
+    parser.add_argument("-t", "--turns", type=int, default=len(USER_MESSAGES), help="liczba wiadomości w rozmowie")
+    parser.add_argument("--download", action="store_true", help="zakończ rozmowę pobraniem dokumentów")
+    parser.add_argument("--evaluate", action="store_true", help="wywołaj ocenę przykładowych dokumentów")
+    parser.add_argument("--base-url", help="adres działającego serwera (domyślnie aplikacja w procesie)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if not args.base_url:
+        os.environ.setdefault("ZANT_LLM_PROVIDER", "fake")
+
+    start = time.perf_counter()
+    stats = asyncio.run(run_load(args))
+    report(stats, time.perf_counter() - start, args.conversations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Regułowa ekstrakcja odpowiedzi z danymi (bez LLM).
+
+Duża część odpowiedzi w czacie to same dane: PESEL, NIP, data, godzina, adres.
+`extract_answer` rozpoznaje polskie formaty i przypisuje wartości do pól, o które
+asystent właśnie pytał (`expected`), albo do pól wskazanych słowem w odpowiedzi
+("PESEL 80010112340", "wypadek 12 marca 2024 o 10:30"). Wynik zwracamy tylko
+wtedy, gdy cała wiadomość została „zużyta” – po usunięciu rozpoznanych wartości
+zostają wyłącznie słowa-etykiety. Każda inna treść (opis, pytanie, odmowa)
+oznacza None i zwykłą ekstrakcję przez LLM.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date
+from typing import Optional, Sequence
+
+from addresses import parse_address
+from pkd import fold
+
+MONTHS = {
+    "stycznia": 1, "lutego": 2, "marca": 3, "kwietnia": 4, "maja": 5, "czerwca": 6, "lipca": 7,
+    "sierpnia": 8, "wrzesnia": 9, "pazdziernika": 10, "listopada": 11, "grudnia": 12,
+}
+
+_MONTH_NAMES = "stycznia|lutego|marca|kwietnia|maja|czerwca|lipca|sierpnia|wrze[sś]nia|pa[zź]dziernika|listopada|grudnia"
+_TIME = r"([01]?\d|2[0-3])[:.]([0-5]\d)"
+_POSTAL = re.compile(r"(?<!\d)\d{2}\s?[-–]\s?\d{3}(?!\d)")
+
+_NIP_DASHED = re.compile(r"(?<!\d)(?:\d{3}-\d{3}-\d{2}-\d{2}|\d{3}-\d{2}-\d{2}-\d{3})(?!\d)")
+_DIGITS = re.compile(r"(?<![\d.:/-])\d{9,14}(?![\d.:/-])")
+_DATE_TEXT = re.compile(rf"(?<!\d)(\d{{1,2}})\s+({_MONTH_NAMES})\s+(\d{{4}}|\d{{2}})(?:\s*r\b\.?)?", re.IGNORECASE)
+_DATE_ISO = re.compile(r"(?<![\d.])(\d{4})-(\d{1,2})-(\d{1,2})(?![\d.])")
+_DATE_NUMERIC = re.compile(r"(?<![\d.:])(\d{1,2})[./-](\d{1,2})[./-](\d{4}|\d{2})(?:\s*r\b\.?)?(?![\d.:])")
+_TIME_RANGE = re.compile(
+    rf"(?<![\d.:])(?:od\s+)?(?:godz\.?\s*)?{_TIME}\s*(?:-|–|do)\s*(?:godz\.?\s*)?{_TIME}(?![\d.:])", re.IGNORECASE
+)
+_TIME_SINGLE = re.compile(rf"(?<![\d.:]){_TIME}(?![\d.:])")
+_WORD = re.compile(r"\w+")
+
+# Słowa wskazujące pole (po zdjęciu polskich znaków, prefiksy).
+FIELD_HINTS: dict[str, tuple[str, ...]] = {
+    "pesel": ("pesel",),
+    "nip": ("nip",),
+    "regon": ("regon",),
+    "date_of_birth": ("urodz",),
+    "accident_date": ("wypad", "zdarz"),
+    "accident_time": ("wypad", "zdarz"),
+    "planned_work_start": ("rozpocz", "zaczyn", "poczat"),
+    "planned_work_end": ("zakoncz", "koncz", "koniec"),
+    "address_correspondence": ("koresp",),
+    "business_address": ("dzialaln", "firm", "siedzib"),
+    "address_home": ("zamiesz", "mieszk", "domow"),
+}
+# Słowa, które mogą zostać obok danych bez zmiany ich znaczenia.
+FILLER = frozenset({
+    "a", "adres", "data", "dn", "dnia", "do", "dzien", "godz", "godzina", "godzinie", "godziny", "i", "jest",
+    "mam", "moj", "moja", "moje", "na", "nr", "numer", "o", "od", "oraz", "planowo", "planowana",
+    "planowane", "pracy", "prace", "przy", "r", "roku", "sie", "to", "urodzilam", "urodzilem", "w", "we", "z",
+})
+_ADDRESS_LABEL = re.compile(
+    r"^(?:(?:m[oó]j|moje)\s+)?(?:adres(?:\s+(?:zamieszkania|do\s+korespondencji|korespondencyjny|"
+    r"dzia[łl]alno[sś]ci|firmy|siedziby))?|mieszkam(?:\s+(?:na|przy|w))?|firma|siedziba)\s*(?:to|jest)?\s*[:\-–]?\s*",
+    re.IGNORECASE,
+)
+ADDRESS_FIELDS = ("address_home", "address_correspondence", "business_address")
+DATE_FIELDS = ("date_of_birth", "accident_date")
+TIME_FIELDS = ("accident_time", "planned_work_start", "planned_work_end")
+
+_PROXY = ("pelnomocn",)
+# Rdzenie dopasowywane jako początek słowa; krótkie "sam"/"sama" tylko jako całe słowa
+# ("samochodem", "samozatrudniony" nie wskazują poszkodowanego).
+_VICTIM = ("osobisc", "poszkodowan", "wlasnym", "siebie")
+_VICTIM_WORDS = frozenset({"sam", "sama"})
+_REPORTER_FILLER = frozenset({"jako", "jestem", "ja", "we", "w", "imieniu", "zglaszam", "to", "tak"})
+
+
+def _hinted(words: list[str], field: str) -> bool:
+    stems = FIELD_HINTS.get(field)
+    return bool(stems) and any(word.startswith(stems) for word in words)
+
+
+def _pick(candidates: Sequence[str], expected: Sequence[str], words: list[str]) -> Optional[str]:
+    """Pole dla wartości: wskazane słowem, a jeśli nie – jedyne oczekiwane z kandydatów."""
+    hinted = [f for f in candidates if _hinted(words, f)]
+    if len(hinted) == 1:
+        return hinted[0]
+    if hinted:
+        candidates = hinted
+    pending = [f for f in candidates if f in expected]
+    return pending[0] if len(pending) == 1 else None
+
+
+def _year(value: str, today: date) -> int:
+    year = int(value)
+    if len(value) == 2:
+        year += 2000 if 2000 + year <= today.year else 1900
+    return year
+
+
+def _iso(year: int, month: int, day: int) -> Optional[str]:
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _reporter(words: list[str]) -> Optional[str]:
+    if not words:
+        return None
+    victim = lambda w: w in _VICTIM_WORDS or w.startswith(_VICTIM)  # noqa: E731
+    known = lambda w: w in _REPORTER_FILLER or w.startswith(_PROXY) or victim(w)  # noqa: E731
+    if not all(known(w) for w in words):
+        return None
+    if any(w.startswith(_PROXY) for w in words) or ("imieniu" in words and "poszkodowanego" in words):
+        return "proxy"
+    if any(victim(w) for w in words):
+        return "victim"
+    return None
+
+
+def _address(message: str, expected: Sequence[str]) -> Optional[dict[str, str]]:
+    words = _WORD.findall(fold(message))
+    hinted = [f for f in ADDRESS_FIELDS if _hinted(words, f)]
+    # Bez etykiety: pierwszy z pytanych adresów (asystent pyta w kolejności ADDRESS_FIELDS).
+    pending = hinted or [f for f in ADDRESS_FIELDS if f in expected]
+    if len(hinted) > 1 or not pending:
+        return None
+    field = pending[0]
+    text = _ADDRESS_LABEL.sub("", message.strip(), count=1).strip()
+    parsed = parse_address(text)
+    # Pewny adres: ulica z numerem i kod z miejscowością; pozostałe cyfry to już inne dane.
+    if not (parsed.street and parsed.house and parsed.postal_code and parsed.city):
+        return None
+    if _DIGITS.search(text) or _DATE_NUMERIC.search(text) or _TIME_SINGLE.search(text):
+        return None
+    return {field: text}
+
+
+def extract_answer(message: str, expected: Sequence[str], today: Optional[date] = None) -> Optional[dict[str, str]]:
+    """
+    Aktualizacje pól (nazwa pola -> wartość) dla wiadomości złożonej wyłącznie z danych;
+    None, jeśli czegokolwiek nie umiemy jednoznacznie przypisać.
+    """
+    today = today or date.today()
+    message = message.strip()
+    if not message or len(message) > 300:
+        return None
+
+    if "reporter_type" in expected:
+        reporter = _reporter(_WORD.findall(fold(message)))
+        if reporter:
+            return {"reporter_type": reporter}
+
+    if _POSTAL.search(message):
+        return _address(message, expected)
+
+    words = _WORD.findall(fold(message))
+    updates: dict[str, str] = {}
+    rest = message
+
+    def take(pattern: re.Pattern) -> list[re.Match]:
+        nonlocal rest
+        found = list(pattern.finditer(rest))
+        for match in reversed(found):
+            rest = rest[:match.start()] + " " + rest[match.end():]
+        return found
+
+    for match in take(_NIP_DASHED):
+        updates["nip"] = match.group(0).replace("-", "")
+    for match in take(_DIGITS):
+        digits = match.group(0)
+        field = {11: "pesel", 10: "nip", 9: "regon", 14: "regon"}.get(len(digits))
+        if field is None or field in updates or not (field in expected or _hinted(words, field)):
+            return None
+        updates[field] = digits
+
+    dates: list[Optional[str]] = []
+    for match in take(_DATE_TEXT):
+        day, month, year = match.groups()
+        dates.append(_iso(_year(year, today), MONTHS[fold(month)], int(day)))
+    for match in take(_DATE_ISO):
+        year, month, day = match.groups()
+        dates.append(_iso(int(year), int(month), int(day)))
+    for match in take(_DATE_NUMERIC):
+        day, month, year = match.groups()
+        dates.append(_iso(_year(year, today), int(month), int(day)))
+    if len(dates) > 1 or None in dates:
+        return None
+    if dates:
+        field = _pick(DATE_FIELDS, expected, words)
+        if field is None:
+            return None
+        updates[field] = dates[0]
+
+    ranges = take(_TIME_RANGE)
+    times = take(_TIME_SINGLE)
+    if len(ranges) + len(times) > 1:
+        return None
+    if ranges:
+        if not ({"planned_work_start", "planned_work_end"} <= set(expected) or _hinted(words, "planned_work_start")):
+            return None
+        start_h, start_m, end_h, end_m = ranges[0].groups()
+        updates["planned_work_start"] = f"{int(start_h):02d}:{start_m}"
+        updates["planned_work_end"] = f"{int(end_h):02d}:{end_m}"
+    elif times:
+        field = _pick(TIME_FIELDS, expected, words)
+        if field is None and "accident_date" in updates:
+            field = "accident_time"  # "12.03.2024 o 10:30" – godzina wypadku
+        if field is None:
+            return None
+        hour, minute = times[0].groups()
+        updates[field] = f"{int(hour):02d}:{minute}"
+
+    # Pewność: poza wartościami zostały tylko etykiety pól i słowa-wypełniacze.
+    hints = tuple(stem for field in updates for stem in FIELD_HINTS.get(field, ()))
+    leftover = _WORD.findall(fold(rest))
+    if not updates or any(w not in FILLER and not w.startswith(hints or ("\0",)) for w in leftover):
+        return None
+    return updates
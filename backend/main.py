@@ -1,31 +1,64 @@
 from __future__ import annotations
 
+import asyncio
 import base64
-import json
+import contextvars
+import functools
+import importlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import date
 from enum import Enum
-from typing import Any, List, Optional
-from unittest import result
+from typing import Any, Callable, List, Optional
 
 import io
-import zipfile
-from docx import Document as DocxDocument
-from docx.shared import Pt
 from dotenv import load_dotenv
 from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from fpdf import FPDF
-from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field
-
-import re
-from pypdf import PdfReader, PdfWriter
-from pypdf.generic import NameObject, BooleanObject, TextStringObject, DictionaryObject, ArrayObject
-
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.routing import Match
+from pydantic import BaseModel, Field, ValidationError
+
+
+from document_rules import RuleReport, check_documents
+from chains import ChainSpec, pydantic_parser, registry, str_parser
+from conversation_memory import (
+    MEMORY_WINDOW,
+    TURN_DATA,
+    TURN_NAVIGATION,
+    TURN_REFUSAL,
+    TURN_TEXT,
+    ConversationMemory,
+    TurnMeta,
+    compact_history,
+    history_prompt,
+    record_turn,
+)
+from local_extraction import extract_answer
+from validation import iter_records, validate_case
+from usage import LEDGER, UNKNOWN as UNKNOWN_CASE, current_case_id, current_endpoint
+from action_plans import STATUS_PENDING, STATUS_READY, PlanEntry, case_state_key, store as action_plans
+from addresses import POSTAL_CODES_COMPLETE, ParsedAddress, parse_address, postal_index
+from bundle_cache import bundle_key, bundles, etag_for, etag_matches
+from docx_templates import load_docx_template
+from pkd import PKD_SEARCH_LIMIT, PKD_SEARCH_MAX_LIMIT, fold, pkd_index, suggest_pkd
+from warmup import state as warm_up
+import worker_metrics
+from zipstream import stream_zip
+from metrics import (
+    BUNDLE_CACHE,
+    CONTENT_TYPE,
+    FALLBACKS,
+    LOCAL_EXTRACTION,
+    QUEUE_DEPTH,
+    REQUEST_DURATION,
+    timed_stage,
+)
 from ocr import (
     extract_text_from_image,
     summarize_accident_facts_from_pdfs,
@@ -149,6 +182,10 @@ class AssistantMessageRequest(BaseModel):
         default=None,
         description="Aktualny stan sprawy utrzymywany po stronie frontendu (opcjonalny)",
     )
+    memory: Optional[ConversationMemory] = Field(
+        default=None,
+        description="Pamięć rozmowy z poprzedniej odpowiedzi (streszczenie, pominięte pola, metadane tur)",
+    )
 
 
 class ActionStep(BaseModel):
@@ -161,11 +198,29 @@ class ActionPlan(BaseModel):
     actions: List[ActionStep] = Field(default_factory=list, description="Lista kroków do wykonania")
 
 
+class PkdSuggestion(BaseModel):
+    code: str
+    description: str
+    score: float
+
+
 class AssistantMessageResponse(BaseModel):
     assistant_reply: str
     missing_fields: List[MissingField]
     case_state_preview: CaseState
     recommended_actions: Optional[List[ActionStep]] = None
+    # Klucz planu działań liczonego w tle (GET /api/case/action-plan/{key}).
+    action_plan_key: Optional[str] = None
+    # Propozycje kodu PKD z opisu działalności (gdy kodu jeszcze nie ma).
+    pkd_suggestions: Optional[List[PkdSuggestion]] = None
+    # Pamięć rozmowy do odesłania z kolejną wiadomością (wtedy wystarczy końcówka historii).
+    memory: Optional[ConversationMemory] = None
+
+
+class ActionPlanStatus(BaseModel):
+    key: str
+    status: str = Field(..., description="pending / ready / failed")
+    actions: List[ActionStep] = Field(default_factory=list)
 
 
 class CaseDocument(BaseModel):
@@ -253,12 +308,26 @@ class CaseEvaluationResult(BaseModel):
     )
 
 
+class EvaluationMode(str, Enum):
+    """
+    Tryb oceny dokumentów: pełna ocena LLM (z podpowiedziami z reguł)
+    albo szybka ocena wyłącznie regułowa, bez wywołania LLM.
+    """
+
+    FULL = "full"
+    RULES_ONLY = "rules_only"
+
+
 class CaseEvaluationRequest(BaseModel):
     case_id: str = Field(..., description="Identyfikator sprawy (dowolny identyfikator z frontendu)")
     documents: List[CaseDocument] = Field(
         default_factory=list,
         description="Komplet dokumentów tekstowych (np. zawiadomienia, wyjaśnienia, dokumentacja medyczna)",
     )
+    mode: EvaluationMode = Field(
+        default=EvaluationMode.FULL,
+        description="'full' – ocena LLM, 'rules_only' – natychmiastowa ocena regułowa bez LLM",
+    )
 
 
 class CaseEvaluationResponse(BaseModel):
@@ -266,33 +335,165 @@ class CaseEvaluationResponse(BaseModel):
     evaluation: CaseEvaluationResult
 
 
-app = FastAPI(title="ZANT Backend", version="0.1.0")
+def _warm_up_templates() -> None:
+    from ewyp import load_ewyp_template
+
+    load_ewyp_template("EWYP.pdf")
+    for name in (NOTIFICATION_DOCX_TEMPLATE, EXPLANATION_DOCX_TEMPLATE):
+        load_docx_template(name)
+
+
+def _warm_up_pdf() -> None:
+    # Sam import ładuje fpdf i fontTools (kilkaset ms przy pierwszym PDF-ie).
+    importlib.import_module("markdown_pdf")
+    from pdf_render import warm_up_fonts
+
+    if not warm_up_fonts():
+        print("Brak czcionki DejaVu – PDF-y będą generowane bez polskich znaków.")
+
+
+def _warm_up_indexes() -> None:
+    postal_index()
+    pkd_index()
+    if not POSTAL_CODES_COMPLETE:
+        print(
+            "Brak pełnego spisu kodów pocztowych (ZANT_POSTAL_CODES) – alert postal_city wyłączony, "
+            "miejscowość uzupełniana tylko dla kodów większych miast."
+        )
+
+
+def _warm_up_tesseract() -> None:
+    from ocr import tesseract_version
+
+    tesseract_version()
+
+
+# Zasoby tylko do odczytu – w trybie wieloprocesowym ładowane przed fork() (`serve.py`).
+PREFORK_WARMUP_STEPS = [
+    ("prompts", registry.prepare_prompts),
+    ("templates", _warm_up_templates),
+    ("indexes", _warm_up_indexes),
+    ("pdf", _warm_up_pdf),
+]
+WARMUP_STEPS = [
+    # Kompilacja łańcuchów tworzy też klientów LLM (import klienta Gemini).
+    ("chains", registry.warm_up),
+    *PREFORK_WARMUP_STEPS[1:],
+    ("tesseract", _warm_up_tesseract),
+]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Kompilujemy łańcuchy LLM, parsujemy szablony, czcionki PDF i indeksy raz –
+    # przed pierwszym żądaniem albo w tle (ZANT_WARMUP=background, zob. `warmup.py`).
+    warm_up.start(WARMUP_STEPS)
+    # Przy pamięci współdzielonej /metrics każdego workera pokazuje sumę wszystkich.
+    worker_metrics.start()
+    yield
+
+
+app = FastAPI(title="ZANT Backend", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # na potrzeby hackathonu puszczamy wszystko
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["X-ZANT-Actions"],
+    expose_headers=["X-ZANT-Actions-Key", "ETag"],
 )
 
 
+def route_template(request: Request) -> str:
+    """Szablon ścieżki (np. /api/case/action-plan/{key}) – etykieta o stałej liczności."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    # Etykietujemy szablonem ścieżki, a nie surowym URL – inaczej każdy klucz planu
+    # działań tworzyłby osobny endpoint w metrykach i ewidencji tokenów.
+    endpoint = route_template(request)
+    # Kontekst do ewidencji tokenów; endpointy z case_id w treści nadpisują sprawę.
+    current_endpoint.set(endpoint)
+    current_case_id.set(request.headers.get("X-ZANT-Case-Id", UNKNOWN_CASE))
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            endpoint=endpoint,
+            status=str(status),
+        )
+
+
 @app.get("/")
 async def root() -> dict:
     return {"status": "ok", "service": "ZANT backend"}
 
 
+@app.get("/ready")
+async def ready(response: Response) -> dict:
+    """Sonda gotowości: 503, dopóki trwa rozgrzewka; w treści czasy kroków."""
+    if not warm_up.ready:
+        response.status_code = 503
+    return warm_up.snapshot()
+
+
+def require_admin(request: Request) -> None:
+    """Jeśli ustawiono ZANT_ADMIN_TOKEN, endpointy administracyjne wymagają nagłówka X-Admin-Token."""
+    token = os.getenv("ZANT_ADMIN_TOKEN")
+    if token and request.headers.get("X-Admin-Token") != token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.get("/api/admin/usage")
+async def admin_usage(request: Request, case_id: Optional[str] = None) -> dict:
+    """
+    Zużycie tokenów (prompt/completion) i koszt – łącznie oraz per sprawa,
+    łańcuch i endpoint. Z parametrem case_id zwraca szczegóły jednej sprawy.
+    """
+    require_admin(request)
+    return await asyncio.to_thread(LEDGER.summary, case_id)
+
+
+@app.get("/api/admin/usage/export")
+async def admin_usage_export(request: Request, case_id: Optional[str] = None) -> StreamingResponse:
+    """Eksport pojedynczych wywołań LLM jako JSONL."""
+    require_admin(request)
+    return StreamingResponse(
+        LEDGER.export_jsonl(case_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=llm_usage.jsonl"},
+    )
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Metryki w formacie tekstowym Prometheusa (łącznie ze wszystkich workerów)."""
+    return Response(content=await asyncio.to_thread(worker_metrics.render), media_type=CONTENT_TYPE)
+
+
 def get_llm() -> Optional[Any]:
     """
     Prosty factory na LLM-a.
     Jeśli LangChain/Gemini nie są zainstalowane, zwracamy None,
     a pipeline zadziała w trybie fallback (bez LLM).
     """
-    # Możesz sterować modelem przez ENV: GEMINI_MODEL=gemini-1.5-flash
-    return ChatGoogleGenerativeAI(
-        model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
-        temperature=0,
-    )
+    # Możesz sterować modelem przez ENV: GEMINI_MODEL=gemini-1.5-flash,
+    # a dostawcą (gemini / fake / record / replay) przez ZANT_LLM_PROVIDER.
+    from llm_provider import create_chat_model
+
+    return create_chat_model()
 
 
 def simple_missing_fields(
@@ -436,6 +637,44 @@ def field_name_from_label(label: str) -> Optional[str]:
     return None
 
 
+SKIP_PHRASES = [
+    "nie chcę podawać",
+    "nie chce podawać",
+    "nie chcę tego podawać",
+    "nie chce tego podawać",
+    "nie chcę podać",
+    "nie chce podać",
+    "nie podam",
+    "wolę nie podawać",
+    "wole nie podawac",
+    "wolę nie mówić",
+    "wolę nie mowic",
+    "nie chcę mówić",
+    "nie chce mowic",
+    "pomiń",
+    "pomin",
+    "pomijamy",
+    "pomiń kategorię",
+    "idź dalej z kategorią",
+    "następna kategoria"
+]
+
+NEXT_CATEGORY_PHRASES = [
+    "następna kategoria",
+    "nastepna kategoria",
+    "kolejna kategoria",
+    "idź dalej z kategorią",
+    "idz dalej z kategoria",
+    "pomiń kategorię",
+    "pomijam tę kategorię",
+    "chcę pominąć kategorię",
+    "chcialbym pominac te kategorie",
+    "chciałbym pominąć tę kategorię",
+    "przejdź dalej bez tej kategorii",
+    "przejdz dalej bez tej kategorii",
+]
+
+
 def message_looks_like_skip(text: str) -> bool:
     """
     Bardzo prosta heurystyka: czy użytkownik chce pominąć odpowiedź.
@@ -443,28 +682,7 @@ def message_looks_like_skip(text: str) -> bool:
     t = text.strip().lower()
     if not t:
         return False
-    phrases = [
-        "nie chcę podawać",
-        "nie chce podawać",
-        "nie chcę tego podawać",
-        "nie chce tego podawać",
-        "nie chcę podać",
-        "nie chce podać",
-        "nie podam",
-        "wolę nie podawać",
-        "wole nie podawac",
-        "wolę nie mówić",
-        "wolę nie mowic",
-        "nie chcę mówić",
-        "nie chce mowic",
-        "pomiń",
-        "pomin",
-        "pomijamy",
-        "pomiń kategorię",
-        "idź dalej z kategorią",
-        "następna kategoria"
-    ]
-    return any(p in t for p in phrases)
+    return any(p in t for p in SKIP_PHRASES)
 
 
 def message_asks_next_category(text: str) -> bool:
@@ -474,21 +692,7 @@ def message_asks_next_category(text: str) -> bool:
     t = text.strip().lower()
     if not t:
         return False
-    phrases = [
-        "następna kategoria",
-        "nastepna kategoria",
-        "kolejna kategoria",
-        "idź dalej z kategorią",
-        "idz dalej z kategoria",
-        "pomiń kategorię",
-        "pomijam tę kategorię",
-        "chcę pominąć kategorię",
-        "chcialbym pominac te kategorie",
-        "chciałbym pominąć tę kategorię",
-        "przejdź dalej bez tej kategorii",
-        "przejdz dalej bez tej kategorii",
-    ]
-    return any(p.lower() in t.lower() for p in phrases)
+    return any(p.lower() in t for p in NEXT_CATEGORY_PHRASES)
 
 
 def extract_category_label_from_text(text: str) -> Optional[str]:
@@ -512,17 +716,65 @@ def extract_category_label_from_text(text: str) -> Optional[str]:
     return None
 
 
-def detect_skip_with_llm(question_label: str, answer: str) -> bool:
+ROUTE_NAVIGATION = "navigation"
+ROUTE_REFUSAL = "refusal"
+# Słowa, które mogą stać obok frazy nawigacji/odmowy ("nie, pomiń proszę") – po zdjęciu
+# polskich znaków. Każde inne słowo (imię, nazwa pola, dane) oznacza zwykłą ekstrakcję.
+ROUTE_FILLER = frozenset({
+    "a", "ale", "bo", "chce", "chcialabym", "chcialbym", "dalej", "dziekuje", "i", "ja", "juz",
+    "kategoria", "kategorie", "kategorii", "lepiej", "moze", "na", "nie", "no", "o", "ok", "okej",
+    "pytanie", "prosze", "przepraszam", "raczej", "tak", "te", "tego", "teraz", "tej", "to", "tym",
+    "wiec", "wole",
+})
+
+
+def _only_phrases(text: str, phrases: list[str]) -> bool:
+    """Czy wiadomość to wyłącznie któraś z fraz (plus słowa-wypełniacze)."""
+    rest = fold(text)
+    matched = False
+    for phrase in sorted(phrases, key=len, reverse=True):
+        phrase = fold(phrase)
+        if phrase in rest:
+            rest = rest.replace(phrase, " ")
+            matched = True
+    words = "".join(c if c.isalnum() else " " for c in rest).split()
+    return matched and all(word in ROUTE_FILLER for word in words)
+
+
+def route_message(text: str) -> Optional[str]:
     """
-    Używa LLM do wykrycia, czy użytkownik odmawia podania danej informacji.
-    Jeśli LLM nie jest dostępny, spada do prostej heurystyki.
+    Szybka klasyfikacja przed ekstrakcją: prośba o następną kategorię
+    (ROUTE_NAVIGATION), odmowa odpowiedzi (ROUTE_REFUSAL) albo None – zwykła odpowiedź.
+    Omijamy ekstrakcję tylko wtedy, gdy cała wiadomość jest taką frazą –
+    "Jan Kowalski, PESEL nie podam" zawiera dane i idzie do ekstrakcji.
     """
-    llm = get_llm()
-    if llm is None or ChatPromptTemplate is None:
-        return message_looks_like_skip(answer)
+    if _only_phrases(text, NEXT_CATEGORY_PHRASES):
+        return ROUTE_NAVIGATION
+    if _only_phrases(text, SKIP_PHRASES):
+        return ROUTE_REFUSAL
+    return None
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
+
+SKIP_DECISION_CACHE_SIZE = 2048
+# (etykieta pytania, odpowiedź) -> czy to odmowa; historia rozmowy wraca w każdej turze,
+# więc każdą parę klasyfikujemy (LLM-em) najwyżej raz na proces.
+_skip_decisions: OrderedDict[tuple[str, str], bool] = OrderedDict()
+_skip_decisions_lock = threading.Lock()
+
+
+def remember_skip_decision(label: str, answer: str, skipped: bool) -> None:
+    with _skip_decisions_lock:
+        _skip_decisions[(label, answer)] = skipped
+        _skip_decisions.move_to_end((label, answer))
+        while len(_skip_decisions) > SKIP_DECISION_CACHE_SIZE:
+            _skip_decisions.popitem(last=False)
+
+
+registry.register(
+    ChainSpec(
+        name="skip_detection",
+        version="1",
+        messages=[
             (
                 "system",
                 (
@@ -544,13 +796,47 @@ def detect_skip_with_llm(question_label: str, answer: str) -> bool:
                     "Odpowiedź użytkownika: {answer}"
                 ),
             ),
-        ]
+        ],
+        parser_factory=str_parser,
+        llm_factory=lambda: get_llm(),
+        sample_inputs={"label": "PESEL poszkodowanego", "answer": "nie podam"},
     )
+)
 
-    chain = prompt | llm | StrOutputParser()
+
+def detect_skip_with_llm(question_label: str, answer: str) -> bool:
+    """
+    Używa LLM do wykrycia, czy użytkownik odmawia podania danej informacji.
+    Jeśli LLM nie jest dostępny, spada do prostej heurystyki.
+    """
+    known = _skip_decisions.get((question_label, answer))
+    if known is not None:
+        return known
+    if route_message(answer) is not None:
+        remember_skip_decision(question_label, answer, True)
+        return True
+
+    chain = registry.get("skip_detection")
+    if chain is None:
+        FALLBACKS.inc(component="skip_detection")
+        return message_looks_like_skip(answer)
 
     result = chain.invoke({"label": question_label, "answer": answer}).strip().upper()
-    return result.startswith("YES")
+    skipped = result.startswith("YES")
+    remember_skip_decision(question_label, answer, skipped)
+    return skipped
+
+
+def answer_is_skip(question_label: str, answer: str) -> bool:
+    """
+    Odmowa w bieżącej turze: fraza odmowy w wiadomości wystarcza (bez LLM),
+    pozostałe odpowiedzi ocenia `detect_skip_with_llm`. Tylko dla odpowiedzi,
+    które nie uzupełniły pytanych pól – "Jan Kowalski, PESEL nie podam" to dane.
+    """
+    if message_looks_like_skip(answer):
+        remember_skip_decision(question_label, answer, True)
+        return True
+    return detect_skip_with_llm(question_label, answer)
 
 
 def infer_skipped_fields_from_history(history: List[ChatTurn]) -> List[str]:
@@ -596,36 +882,11 @@ def infer_skipped_fields_from_history(history: List[ChatTurn]) -> List[str]:
     return list(skipped)
 
 
-def extract_case_state_with_llm(
-    previous_state: CaseState,
-    message: str,
-    mode: Mode,
-    today: str,
-    conversation_history: List[ChatTurn],
-) -> CaseState:
-    """
-    Wykorzystuje LangChain + LLM (Gemini) do uzupełnienia CaseState na podstawie wiadomości.
-    Jeśli Gemini nie jest dostępny, działa w trybie fallback.
-    """
-    llm = get_llm()
-    if llm is None or ChatPromptTemplate is None or PydanticOutputParser is None:
-        # Fallback: tylko podmień opis wypadku na podstawie wiadomości
-        return previous_state.model_copy(
-            update={
-                "accident_description": message.strip()
-                or previous_state.accident_description
-            }
-        )
-
-
-    parser = PydanticOutputParser(pydantic_object=CaseState)
-
-    history_text = "\n".join(
-        f"{turn.role}: {turn.content}" for turn in conversation_history[-10:]
-    )
-
-    prompt = ChatPromptTemplate.from_messages(
-        [
+registry.register(
+    ChainSpec(
+        name="case_state_extraction",
+        version="1",
+        messages=[
             (
                 "system",
                 (
@@ -657,10 +918,44 @@ def extract_case_state_with_llm(
                     "- odpowiedz wyłącznie JSON-em pasującym do schematu CaseState."
                 ),
             ),
-        ]
+        ],
+        parser_factory=pydantic_parser(CaseState),
+        llm_factory=lambda: get_llm(),
+        sample_inputs={
+            "current_state": CaseState().model_dump(),
+            "mode": Mode.NOTIFICATION.value,
+            "message": "",
+            "today": "2025-01-01",
+            "history": "",
+        },
     )
+)
 
-    chain = prompt | llm | parser
+
+def extract_case_state_with_llm(
+    previous_state: CaseState,
+    message: str,
+    mode: Mode,
+    today: str,
+    conversation_history: List[ChatTurn],
+    summary: str = "",
+) -> CaseState:
+    """
+    Wykorzystuje LangChain + LLM (Gemini) do uzupełnienia CaseState na podstawie wiadomości.
+    Jeśli Gemini nie jest dostępny, działa w trybie fallback.
+    """
+    chain = registry.get("case_state_extraction")
+    if chain is None:
+        # Fallback: tylko podmień opis wypadku na podstawie wiadomości
+        FALLBACKS.inc(component="case_state_extraction")
+        return previous_state.model_copy(
+            update={
+                "accident_description": message.strip()
+                or previous_state.accident_description
+            }
+        )
+
+    history_text = history_prompt(summary, conversation_history[-MEMORY_WINDOW:])
 
     try:
         updated_state: CaseState = chain.invoke(
@@ -676,6 +971,7 @@ def extract_case_state_with_llm(
     except Exception as e:
         # Fallback: tylko podmień opis wypadku na podstawie wiadomości
         print(f"BŁĄD LLM: {e}") 
+        FALLBACKS.inc(component="case_state_extraction")
 
         return previous_state.model_copy(
             update={
@@ -683,21 +979,13 @@ def extract_case_state_with_llm(
                 or previous_state.accident_description
             }
         )
-def generate_post_accident_actions(case_state: CaseState) -> List[ActionStep]:
-    """
-    Generuje spersonalizowaną listę kroków i dokumentów na podstawie zebranych danych.
-    """
-    llm = get_llm()
-    if llm is None:
-        return []
 
-    guide_excerpt = ACTION_PLAN_GUIDE
 
-    # Używamy PydanticOutputParser z wrapperem ActionPlan, aby uzyskać poprawną strukturę listy.
-    parser = PydanticOutputParser(pydantic_object=ActionPlan)
-
-    prompt = ChatPromptTemplate.from_messages(
-        [
+registry.register(
+    ChainSpec(
+        name="action_plan",
+        version="1",
+        messages=[
             (
                 "system",
                 (
@@ -736,49 +1024,47 @@ def generate_post_accident_actions(case_state: CaseState) -> List[ActionStep]:
                     "Na podstawie powyższych danych przygotuj ActionPlan (lista 'actions')."
                 ),
             ),
-        ]
+        ],
+        # Używamy PydanticOutputParser z wrapperem ActionPlan, aby uzyskać poprawną strukturę listy.
+        parser_factory=pydantic_parser(ActionPlan),
+        llm_factory=lambda: get_llm(),
+        static={"guide_excerpt": ACTION_PLAN_GUIDE},
+        format_instructions=True,
+        sample_inputs={"case_state": CaseState().model_dump_json()},
     )
+)
+
 
-    chain = prompt | llm | parser
+def generate_post_accident_actions(case_state: CaseState) -> List[ActionStep]:
+    """
+    Generuje spersonalizowaną listę kroków i dokumentów na podstawie zebranych danych.
+    Błąd LLM jest zgłaszany dalej – magazyn planów oznacza wtedy plan jako nieudany
+    i ponawia go przy kolejnym zleceniu (zamiast zapamiętać pusty plan).
+    """
+    chain = registry.get("action_plan")
+    if chain is None:
+        FALLBACKS.inc(component="action_plan")
+        return []
 
     try:
         result: ActionPlan = chain.invoke({
             "case_state": case_state.model_dump_json(),
-            "format_instructions": parser.get_format_instructions(),
-            "guide_excerpt": guide_excerpt,
         })
-        return result.actions
-    except Exception as e:
-        print(f"Błąd generowania zaleceń: {e}")
-        return []
-
-PESEL_REGEX = re.compile(r"^\d{11}$")
-POSTAL_REGEX = re.compile(r"\d{2}-\d{3}")
-NIP_REGEX = re.compile(r"^\d{10}$")
-REGON_REGEX = re.compile(r"^(\d{9}|\d{14})$")
-PKD_REGEX = re.compile(r"^\d{2}\.\d{2}\.[A-Z]$", re.IGNORECASE)
+    except Exception:
+        FALLBACKS.inc(component="action_plan")
+        raise
+    return result.actions
+
+def schedule_action_plan(case_state: CaseState) -> PlanEntry:
+    """Zleca (albo zwraca z pamięci) plan działań dla danego stanu sprawy."""
+    return action_plans.submit(
+        case_state_key(case_state),
+        functools.partial(generate_post_accident_actions, case_state.model_copy(deep=True)),
+    )
 
 def check_validation_of_fields(state: CaseState) -> list[str]:
-    alerts: list[str] = []
-    if state.pesel and not PESEL_REGEX.match(state.pesel):
-        alerts.append("PESEL musi mieć dokładnie 11 cyfr.")
-    if state.nip:
-        normalized_nip = state.nip.replace(" ", "").replace("-", "")
-        if not NIP_REGEX.match(normalized_nip):
-            alerts.append("NIP powinien zawierać 10 cyfr (bez spacji i kresek).")
-    if state.regon:
-        normalized_regon = state.regon.replace(" ", "").replace("-", "")
-        if not REGON_REGEX.match(normalized_regon):
-            alerts.append("REGON powinien mieć 9 lub 14 cyfr.")
-    if state.pkd:
-        normalized_pkd = state.pkd.strip().upper()
-        if not PKD_REGEX.match(normalized_pkd):
-            alerts.append("PKD wpisz w formacie 00.00.X (np. 62.01.Z).")
-    if state.address_home:
-        match = POSTAL_REGEX.search(state.address_home)
-        if not match:
-            alerts.append("Adres zamieszkania powinien zawierać kod pocztowy w formacie 00-000.")
-    return alerts
+    """Komunikaty walidacji pól (formaty, cyfry kontrolne, daty) – patrz `validation.py`."""
+    return [alert.message for alert in validate_case(state)]
 
 def prepend_validation_warnings(reply: str, alerts: list[str]) -> str:
     if not alerts:
@@ -786,12 +1072,94 @@ def prepend_validation_warnings(reply: str, alerts: list[str]) -> str:
     warning = "Uwaga: wykryto problemy z formatem danych. Sprawdź proszę:\n- " + "\n- ".join(alerts)
     return f"{warning}\n\n{reply}" if reply else warning
 
+LOCAL_EXTRACTION_ENABLED = os.getenv("ZANT_LOCAL_EXTRACTION", "1") != "0"
+
+
+def fields_asked_last(state: CaseState, history: List[ChatTurn]) -> list[str]:
+    """
+    Pola, o które pytała ostatnia wiadomość asystenta: puste pola z kategorii
+    wskazanej w pytaniu albo typ zgłaszającego.
+    """
+    last_assistant = next((t for t in reversed(history) if t.role == "assistant"), None)
+    if last_assistant is None:
+        return []
+    text = last_assistant.content
+    if state.reporter_type is None and "pełnomocnik" in text:
+        return ["reporter_type"]
+    cat_label = extract_category_label_from_text(text)
+    cat = find_category_by_label(cat_label) if cat_label else None
+    if cat is None:
+        return []
+    asked = []
+    for name in cat[2]:
+        value = getattr(state, name, None)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            asked.append(name)
+    return asked
+
+
+def extract_case_state(
+    previous_state: CaseState,
+    message: str,
+    mode: Mode,
+    today: str,
+    conversation_history: List[ChatTurn],
+    asked_fields: Optional[List[str]] = None,
+    summary: str = "",
+) -> tuple[CaseState, str]:
+    """
+    Najpierw reguły lokalne (odpowiedź z samymi danymi na ostatnie pytanie),
+    a dopiero gdy nie są pewne – `extract_case_state_with_llm`.
+    Zwraca nowy stan i klasyfikację odpowiedzi (TURN_DATA / TURN_TEXT).
+    """
+    if LOCAL_EXTRACTION_ENABLED:
+        if asked_fields is None:
+            asked_fields = fields_asked_last(previous_state, conversation_history)
+        updates = extract_answer(message, asked_fields, date.fromisoformat(today))
+        if updates is not None:
+            LOCAL_EXTRACTION.inc(path="rules")
+            return CaseState.model_validate({**previous_state.model_dump(), **updates}), TURN_DATA
+    LOCAL_EXTRACTION.inc(path="llm")
+    state = extract_case_state_with_llm(
+        previous_state=previous_state,
+        message=message,
+        mode=mode,
+        today=today,
+        conversation_history=conversation_history,
+        summary=summary,
+    )
+    return state, TURN_TEXT
+
+
+def suggest_pkd_for_state(state: CaseState) -> list[PkdSuggestion]:
+    """Propozycje kodu PKD z opisu działalności (lokalny ranker, bez LLM), gdy kodu brak."""
+    if (state.pkd and state.pkd.strip()) or not (state.business_description and state.business_description.strip()):
+        return []
+    return [
+        PkdSuggestion(code=entry.code, description=entry.desc, score=score)
+        for entry, score in suggest_pkd(state.business_description.strip())
+    ]
+
+
+def append_pkd_suggestion(reply: str, suggestions: list[PkdSuggestion]) -> str:
+    if not suggestions:
+        return reply
+    # Kandydaci do sprawdzenia przez użytkownika, nie rozstrzygnięcie.
+    candidates = "; ".join(f"{s.code} ({s.description})" for s in suggestions)
+    single = len(suggestions) == 1
+    hint = (
+        f"{'Możliwy kod PKD' if single else 'Możliwe kody PKD'} na podstawie opisu działalności: {candidates}. "
+        f"Sprawdź {'go' if single else 'je'} w wykazie i potwierdź właściwy kod albo podaj inny."
+    )
+    return f"{reply}\n\n{hint}"
+
 def run_assistant_pipeline(
     case_id: str,
     message: str,
     mode: Mode,
     previous_state: Optional[CaseState] = None,
     conversation_history: Optional[List[ChatTurn]] = None,
+    memory: Optional[ConversationMemory] = None,
 ) -> AssistantMessageResponse:
     """
     Miejsce na LangChain:
@@ -805,6 +1173,10 @@ def run_assistant_pipeline(
     Póki co używamy prostego chaina:
     - LLM uzupełnia CaseState na podstawie wiadomości,
     - prosta funkcja Pythonowa wykrywa braki.
+
+    Historia jest czytana przez `ConversationMemory`: streszczenie + okno ostatnich
+    wiadomości. Bez pamięci (pierwsza tura, starszy klient) pominięte pola
+    odtwarzamy raz z całej historii.
     """
     # TODO: tutaj podłącz w przyszłości storage (np. bazę danych) po case_id
     base_state = previous_state or CaseState()
@@ -813,29 +1185,57 @@ def run_assistant_pipeline(
     today = date.today().isoformat()
 
     history = conversation_history or []
-
-    # LangChain: próba uzupełnienia CaseState na podstawie wiadomości i historii
-    case_state = extract_case_state_with_llm(
-        previous_state=base_state,
-        message=message,
-        mode=mode,
-        today=today,
-        conversation_history=history,
-    )
+    if memory is None:
+        memory = ConversationMemory(skipped_fields=infer_skipped_fields_from_history(history))
+    window = compact_history(memory, history)
+
+    last_assistant = next((t for t in reversed(history) if t.role == "assistant"), None)
+    asked_fields = fields_asked_last(base_state, history)
+    asked_label = extract_category_label_from_text(last_assistant.content) if last_assistant else None
+
+    # Nawigacja i odmowy nie zawierają danych – stan zostaje bez zmian, bez ekstrakcji.
+    route = route_message(message)
+    if route is not None:
+        LOCAL_EXTRACTION.inc(path="routed")
+        case_state = base_state.model_copy(deep=True)
+        turn_kind = TURN_NAVIGATION if route == ROUTE_NAVIGATION else TURN_REFUSAL
+    else:
+        # Reguły lokalne albo LangChain: uzupełnienie CaseState na podstawie wiadomości i historii
+        case_state, turn_kind = extract_case_state(
+            previous_state=base_state,
+            message=message,
+            mode=mode,
+            today=today,
+            conversation_history=window.recent,
+            asked_fields=asked_fields,
+            summary=window.summary,
+        )
+    filled = [
+        name for name in ("reporter_type", *FIELD_LABELS)
+        if getattr(case_state, name, None) != getattr(base_state, name, None)
+    ]
+    if asked_label:
+        # Decyzja dla tej pary przyda się przy odtwarzaniu historii (infer_skipped_fields_from_history):
+        # odmowa albo odpowiedź, która uzupełniła któreś z pytanych pól.
+        if route is not None:
+            remember_skip_decision(asked_label, message, True)
+        elif any(name in filled for name in asked_fields):
+            remember_skip_decision(asked_label, message, False)
 
     case_state.address_home = normalize_address(case_state.address_home)
     case_state.address_correspondence = normalize_address(case_state.address_correspondence)
     validation_alerts = check_validation_of_fields(case_state)
+    pkd_suggestions = suggest_pkd_for_state(case_state)
 
-    # Wyznacz pola, których użytkownik nie chce podawać – na podstawie historii + bieżącej odpowiedzi.
-    skipped_from_history = set(infer_skipped_fields_from_history(history))
+    # Wyznacz pola, których użytkownik nie chce podawać – z pamięci rozmowy + bieżącej odpowiedzi.
+    skipped_from_history = set(memory.skipped_fields)
     # Sprawdź, czy bieżąca wiadomość jest odmową odpowiedzi lub prośbą o przejście
     # do kolejnej kategorii na podstawie ostatniego pytania asystenta.
     skipped_current: set[str] = set()
-    if history:
-        last_assistant = next(
-            (t for t in reversed(history) if t.role == "assistant"), None
-        )
+    if route is not None:
+        # Pomijamy pola, o które pytał asystent (puste pola bieżącej kategorii).
+        skipped_current.update(asked_fields)
+    elif history:
         if last_assistant:
             text = last_assistant.content
 
@@ -854,18 +1254,40 @@ def run_assistant_pipeline(
                             ):
                                 skipped_current.add(name)
             else:
-                # Standardowy przypadek: sprawdzamy odmowę dla konkretnego pola
-                if ":" in text:
+                # Jedno sprawdzenie odmowy na turę: pytanie o kategorię albo o konkretne pole
+                # (pytanie o kategorię też zawiera ":", jak w infer_skipped_fields_from_history).
+                # Najpierw fraza odmowy w wiadomości, LLM tylko dla odpowiedzi bez niej.
+                cat = find_category_by_label(asked_label) if asked_label else None
+                if cat:
+                    if (
+                        turn_kind == TURN_TEXT
+                        and not any(name in filled for name in asked_fields)
+                        and answer_is_skip(asked_label, message)
+                    ):
+                        skipped_current.update(cat[2])
+                        turn_kind = TURN_REFUSAL
+                elif ":" in text:
+                    # Standardowy przypadek: sprawdzamy odmowę dla konkretnego pola
                     label = (
                         text.split(":")[-2 if text.count(":") > 1 else 0]
                         .splitlines()[-1]
                         .strip()
                     )
                     field_name = field_name_from_label(label)
-                    if field_name and detect_skip_with_llm(label, message):
+                    if field_name and field_name not in filled and answer_is_skip(label, message):
                         skipped_current.add(field_name)
 
+    # Pole uzupełnione w tej turze nie jest pominięte (np. "Jan Kowalski, PESEL nie podam").
+    skipped_current.difference_update(filled)
     skipped_all = list(skipped_from_history | skipped_current)
+    memory = record_turn(memory, window, TurnMeta(
+        turn=memory.turn_count + 1,
+        asked=asked_label,
+        asked_fields=asked_fields,
+        kind=turn_kind,
+        filled=filled,
+        skipped=sorted(skipped_current),
+    ))
 
     # Sprawdź braki obowiązkowe (dla missing_fields), ignorując pola, które użytkownik świadomie pominął.
     missing = simple_missing_fields(case_state, mode, skipped_fields=skipped_all)
@@ -971,14 +1393,10 @@ def run_assistant_pipeline(
     else:
         # To jest moment, w którym generujemy raport końcowy i zalecenia
         
-        # Wywołaj LLM z promptem:
-        # "Na podstawie zgromadzonych danych (CaseState):
-        # 1. Czy to był wypadek w drodze, czy przy pracy?
-        # 2. Jakie dokumenty są wymagane dla tego konkretnego przypadku?
-        # 3. Jakie kroki musi podjąć użytkownik?
-        # Zwróć listę ActionStep."
-        
-        actions = generate_post_accident_actions(case_state) # Nowa funkcja z LLM
+        # Plan działań (LLM) liczymy w tle – odpowiedź nie czeka na model.
+        # Jeśli plan dla tego stanu sprawy jest już gotowy, zwracamy go od razu.
+        plan = schedule_action_plan(case_state)
+        actions = plan.actions if plan.status == STATUS_READY else None
         
         assistant_reply = (
             "Dziękuję, to wszystkie pytania o dane wymagane w formularzu. "
@@ -991,61 +1409,74 @@ def run_assistant_pipeline(
             assistant_reply=assistant_reply,
             missing_fields=missing,
             case_state_preview=case_state,
-            recommended_actions=actions
+            recommended_actions=actions,
+            action_plan_key=plan.key,
+            memory=memory,
         )
 
+    # Podpowiedź kodu dopisujemy, gdy rozmowa jest przy danych działalności.
+    next_category = find_category_for_field(next_field)
+    if next_category and "pkd" in next_category[2] and "pkd" not in skipped:
+        assistant_reply = append_pkd_suggestion(assistant_reply, pkd_suggestions)
     assistant_reply = prepend_validation_warnings(assistant_reply, validation_alerts)
 
     return AssistantMessageResponse(
         assistant_reply=assistant_reply,
         missing_fields=missing,
         case_state_preview=case_state,
+        pkd_suggestions=pkd_suggestions or None,
+        memory=memory,
     )
 
 
-def evaluate_case_from_documents(
-    documents: List[CaseDocument], case_id: str
-) -> CaseEvaluationResult:
-    """
-    Uruchamia złożony pipeline LLM na komplecie dokumentów:
-    - ujednolica stan faktyczny (CaseState),
-    - wykrywa rozbieżności,
-    - wskazuje brakujące informacje i dokumenty,
-    - wydaje opinię, czy zdarzenie jest wypadkiem podczas prowadzenia pozarolniczej DG,
-    - generuje projekt karty wypadku.
-    """
-    llm = get_llm()
-    if llm is None or ChatPromptTemplate is None or PydanticOutputParser is None:
-        # Fallback: minimalna implementacja bez LLM – zwracamy puste rozstrzygnięcie.
-        base_state = CaseState()
-        missing = simple_missing_fields(base_state, Mode.NOTIFICATION)
-        return CaseEvaluationResult(
-            normalized_case_state=base_state,
-            discrepancies=[],
-            missing_fields=missing,
-            missing_documents=[],
-            opinion=OpinionOutcome.INCONCLUSIVE,
-            opinion_explanation=(
-                "Brak dostępnego modelu LLM – nie można przeprowadzić pełnej oceny na podstawie dokumentów."
-            ),
-            accident_card_draft=(
-                "Brak projektu karty wypadku – środowisko LLM nie jest dostępne."
-            ),
+def rule_discrepancies(report: RuleReport) -> List[Discrepancy]:
+    """Zamienia rozbieżności wykryte regułami na modele `Discrepancy`."""
+    return [
+        Discrepancy(
+            description=f.description,
+            fields_affected=f.fields_affected,
+            documents_involved=f.documents_involved,
         )
+        for f in report.findings
+    ]
 
-    parser = PydanticOutputParser(pydantic_object=CaseEvaluationResult)
 
-    docs_as_text = [
-        {
-            "name": d.name,
-            "type": d.type or "",
-            "text": d.text,
-        }
-        for d in documents
-    ]
+def case_state_from_rules(report: RuleReport) -> CaseState:
+    """
+    Buduje CaseState z wartości, co do których wszystkie dokumenty są zgodne.
+    """
+    agreed = report.agreed_values()
+    update = {
+        name: agreed[name]
+        for name in ["accident_date", "accident_time", "date_of_birth", "pesel", "nip", "regon"]
+        if name in agreed
+    }
+    if "victim_name" in agreed:
+        first_name, last_name = agreed["victim_name"].split(" ", 1)
+        update.update(first_name=first_name, last_name=last_name)
+    return CaseState(**update)
+
+
+def evaluate_case_from_rules(report: RuleReport, explanation: str, card_draft: str) -> CaseEvaluationResult:
+    """Wynik oceny oparty wyłącznie na regułach (tryb rules_only oraz fallbacki)."""
+    base_state = case_state_from_rules(report)
+    missing = simple_missing_fields(base_state, Mode.NOTIFICATION)
+    return CaseEvaluationResult(
+        normalized_case_state=base_state,
+        discrepancies=rule_discrepancies(report),
+        missing_fields=missing,
+        missing_documents=[],
+        opinion=OpinionOutcome.INCONCLUSIVE,
+        opinion_explanation=explanation,
+        accident_card_draft=card_draft,
+    )
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
+
+registry.register(
+    ChainSpec(
+        name="case_evaluation",
+        version="1",
+        messages=[
             (
                 "system",
                 (
@@ -1072,6 +1503,9 @@ def evaluate_case_from_documents(
                     "Identyfikator sprawy: {case_id}\n\n"
                     "Komplet dokumentów (po OCR) w formacie JSON:\n"
                     "{documents_json}\n\n"
+                    "Rozbieżności wykryte wstępnie regułami (daty, godziny, PESEL/NIP/REGON, "
+                    "kody pocztowe, nazwiska) – zweryfikuj je i uwzględnij w wyniku:\n"
+                    "{rule_hints}\n\n"
                     "Twoje zadanie:\n"
                     "- przeanalizuj wszystkie dokumenty razem (załóż, że mogą zawierać błędy i sprzeczne dane),\n"
                     "- ujednolicz stan faktyczny w strukturze CaseState,\n"
@@ -1083,34 +1517,94 @@ def evaluate_case_from_documents(
                     "Odpowiedz TYLKO JSON-em zgodnym ze schematem CaseEvaluationResult."
                 ),
             ),
-        ]
+        ],
+        parser_factory=pydantic_parser(CaseEvaluationResult),
+        llm_factory=lambda: get_llm(),
+        sample_inputs={"case_id": "", "documents_json": [], "rule_hints": ""},
     )
+)
 
-    chain = prompt | llm | parser
+
+def evaluate_case_from_documents(
+    documents: List[CaseDocument],
+    case_id: str,
+    mode: EvaluationMode = EvaluationMode.FULL,
+) -> CaseEvaluationResult:
+    """
+    Uruchamia złożony pipeline LLM na komplecie dokumentów:
+    - ujednolica stan faktyczny (CaseState),
+    - wykrywa rozbieżności,
+    - wskazuje brakujące informacje i dokumenty,
+    - wydaje opinię, czy zdarzenie jest wypadkiem podczas prowadzenia pozarolniczej DG,
+    - generuje projekt karty wypadku.
+
+    Przed wywołaniem LLM dokumenty przechodzą regułowy pre-pass (`document_rules`),
+    którego wyniki trafiają do promptu jako podpowiedzi. W trybie RULES_ONLY
+    zwracamy od razu wynik reguł, bez wywołania LLM.
+    """
+    report = check_documents(documents)
+
+    if mode == EvaluationMode.RULES_ONLY:
+        if report.consistent:
+            explanation = (
+                "Ocena regułowa: nie wykryto rozbieżności w datach, godzinach, "
+                "identyfikatorach (PESEL/NIP/REGON), kodach pocztowych ani nazwiskach. "
+                "Kwalifikacja prawna zdarzenia wymaga pełnej oceny."
+            )
+        else:
+            explanation = (
+                f"Ocena regułowa: wykryto rozbieżności ({len(report.findings)}) – "
+                "dokumenty wymagają wyjaśnienia przed pełną oceną."
+            )
+        return evaluate_case_from_rules(
+            report,
+            explanation=explanation,
+            card_draft="Projekt karty wypadku nie jest generowany w trybie regułowym.",
+        )
+
+    chain = registry.get("case_evaluation")
+    if chain is None:
+        # Fallback: minimalna implementacja bez LLM – zwracamy wynik samych reguł.
+        FALLBACKS.inc(component="case_evaluation")
+        return evaluate_case_from_rules(
+            report,
+            explanation=(
+                "Brak dostępnego modelu LLM – nie można przeprowadzić pełnej oceny na podstawie dokumentów."
+            ),
+            card_draft=(
+                "Brak projektu karty wypadku – środowisko LLM nie jest dostępne."
+            ),
+        )
+
+    docs_as_text = [
+        {
+            "name": d.name,
+            "type": d.type or "",
+            "text": d.text,
+        }
+        for d in documents
+    ]
 
     try:
         result: CaseEvaluationResult = chain.invoke(
             {
                 "case_id": case_id,
                 "documents_json": docs_as_text,
+                "rule_hints": report.as_hints(),
             }
         )
         return result
     except Exception:
-        # Bezpieczny fallback: nie przerywamy działania API, tylko zwracamy odpowiedź INCONCLUSIVE.
-        base_state = CaseState()
-        missing = simple_missing_fields(base_state, Mode.NOTIFICATION)
-        return CaseEvaluationResult(
-            normalized_case_state=base_state,
-            discrepancies=[],
-            missing_fields=missing,
-            missing_documents=[],
-            opinion=OpinionOutcome.INCONCLUSIVE,
-            opinion_explanation=(
+        # Bezpieczny fallback: nie przerywamy działania API, tylko zwracamy odpowiedź INCONCLUSIVE
+        # (z rozbieżnościami wykrytymi regułami).
+        FALLBACKS.inc(component="case_evaluation")
+        return evaluate_case_from_rules(
+            report,
+            explanation=(
                 "Wystąpił błąd podczas przetwarzania dokumentów przez model LLM – "
                 "nie można przeprowadzić pełnej oceny."
             ),
-            accident_card_draft=(
+            card_draft=(
                 "Projekt karty wypadku nie został wygenerowany z powodu błędu LLM."
             ),
         )
@@ -1126,25 +1620,82 @@ async def assistant_message(
     - uruchamia pipeline asystenta,
     - zwraca tekst odpowiedzi, listę braków i podgląd stanu sprawy.
     """
+    current_case_id.set(payload.case_id)
     return run_assistant_pipeline(
         case_id=payload.case_id,
         message=payload.message,
         mode=payload.mode,
         previous_state=payload.case_state,
         conversation_history=payload.conversation_history,
+        memory=payload.memory,
     )
 
 
+VALIDATION_MAX_RECORDS = int(os.getenv("ZANT_VALIDATION_MAX_RECORDS", "100000"))
+
+
+def validate_bulk(body: bytes, only_invalid: bool = False) -> dict:
+    """Waliduje rekordy CaseState (tablica JSON lub JSONL); wynik per rekord w kolejności wejścia."""
+    today = date.today()
+    results: list[dict] = []
+    total = invalid = 0
+    for index, (case_id, record, error) in enumerate(iter_records(body, CaseState.model_fields)):
+        if index >= VALIDATION_MAX_RECORDS:
+            raise HTTPException(status_code=413, detail=f"Maksymalnie {VALIDATION_MAX_RECORDS} rekordów na żądanie")
+        total += 1
+        alerts: list[dict] = []
+        if error is None:
+            try:
+                alerts = [alert.as_dict() for alert in validate_case(CaseState.model_validate(record), today)]
+            except ValidationError as e:
+                error = f"Niepoprawny CaseState: {e.error_count()} błędów walidacji"
+        if error is not None:
+            alerts = [{"field": None, "code": "invalid_record", "message": error}]
+        if alerts:
+            invalid += 1
+        elif only_invalid:
+            continue
+        results.append({"index": index, "case_id": case_id, "valid": not alerts, "alerts": alerts})
+    return {"total": total, "invalid": invalid, "results": results}
+
+
+@app.post("/api/validation/bulk")
+async def validation_bulk(request: Request, only_invalid: bool = False) -> dict:
+    """
+    Masowa walidacja rekordów CaseState: tablica JSON albo JSONL (rekord na wiersz),
+    opcjonalnie z `case_id`. Zwraca alerty per rekord (PESEL/NIP/REGON z cyframi
+    kontrolnymi, data urodzenia z PESEL-u, zakresy dat); `only_invalid=true`
+    pomija rekordy bez uwag.
+    """
+    body = await request.body()
+    try:
+        return await asyncio.to_thread(validate_bulk, body, only_invalid)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@app.get("/api/pkd/search")
+async def pkd_search(q: str = "", limit: int = PKD_SEARCH_LIMIT) -> dict:
+    """
+    Podpowiedzi kodów PKD: prefiks kodu ("62.0", "6201") albo słowa opisu
+    ("instalacje elektr"), bez rozróżniania polskich znaków.
+    """
+    limit = max(1, min(limit, PKD_SEARCH_MAX_LIMIT))
+    return {"query": q, "results": [entry.as_dict() for entry in pkd_index().search(q, limit)]}
+
+
 @app.post("/api/case/evaluate-documents", response_model=CaseEvaluationResponse)
 async def evaluate_documents(payload: CaseEvaluationRequest) -> CaseEvaluationResponse:
     """
     Endpoint dla II etapu oceny:
     - przyjmuje komplet dokumentów w formie tekstowej (po OCR),
-    - uruchamia LLM do analizy,
+    - uruchamia regułowy pre-pass rozbieżności i LLM do analizy
+      (w trybie 'rules_only' tylko reguły – odpowiedź natychmiastowa),
     - zwraca ujednolicony stan faktyczny, rozbieżności, braki, opinię i projekt karty wypadku.
     """
+    current_case_id.set(payload.case_id)
     evaluation = evaluate_case_from_documents(
-        documents=payload.documents, case_id=payload.case_id
+        documents=payload.documents, case_id=payload.case_id, mode=payload.mode
     )
     return CaseEvaluationResponse(case_id=payload.case_id, evaluation=evaluation)
 
@@ -1177,12 +1728,9 @@ async def read_document_ocr(file: UploadFile = File(...)) -> dict:
 
 # --- GENEROWANIE DOKUMENTÓW ---
 
-class PDF(FPDF):
-    def header(self):
-        # Prosty nagłówek PDF
-        self.set_font('Arial', 'B', 12)
-        self.cell(0, 10, 'Dokument wygenerowany przez asystenta ZANT', 0, 1, 'C')
-        self.ln(10)
+# Szablony DOCX (katalog templates/, generowane przez templates/build_templates.py)
+NOTIFICATION_DOCX_TEMPLATE = "zawiadomienie.docx"
+EXPLANATION_DOCX_TEMPLATE = "wyjasnienia.docx"
 
 def sanitize_text(text: Optional[str]) -> str:
     """Czyści tekst z None i obsługuje polskie znaki dla prostego PDF."""
@@ -1190,121 +1738,69 @@ def sanitize_text(text: Optional[str]) -> str:
         return "---"
     return text
 
+@timed_stage("create_notification_docx")
 def create_notification_docx(state: CaseState) -> io.BytesIO:
-    """Tworzy plik Word z Zawiadomieniem o wypadku."""
-    doc = DocxDocument()
-    
-    doc.add_heading('ZAWIADOMIENIE O WYPADKU', 0)
-    doc.add_heading('przy prowadzeniu działalności gospodarczej', 1)
-
-    # Sekcja 1: Poszkodowany
-    doc.add_heading('1. Dane poszkodowanego (Zgłaszającego)', level=2)
-    p = doc.add_paragraph()
-    p.add_run(f"Imię i nazwisko: ").bold = True
-    p.add_run(f"{sanitize_text(state.first_name)} {sanitize_text(state.last_name)}\n")
-    p.add_run(f"PESEL: ").bold = True
-    p.add_run(f"{sanitize_text(state.pesel)}\n")
-    p.add_run(f"Adres zamieszkania: ").bold = True
-    p.add_run(f"{sanitize_text(state.address_home)}")
-
-    # Sekcja 2: Płatnik składek
-    doc.add_heading('2. Dane płatnika składek (Działalność)', level=2)
-    p = doc.add_paragraph()
-    p.add_run(f"Nazwa/Opis: ").bold = True
-    p.add_run(f"{sanitize_text(state.business_description)}\n")
-    p.add_run(f"NIP: ").bold = True
-    p.add_run(f"{sanitize_text(state.nip)}   ")
-    p.add_run(f"REGON: ").bold = True
-    p.add_run(f"{sanitize_text(state.regon)}\n")
-    p.add_run(f"Adres działalności: ").bold = True
-    p.add_run(f"{sanitize_text(state.business_address)}")
-
-    # Sekcja 3: Informacje o wypadku
-    doc.add_heading('3. Informacje o wypadku', level=2)
-    p = doc.add_paragraph()
-    p.add_run(f"Data i godzina: ").bold = True
-    p.add_run(f"{sanitize_text(state.accident_date)}, godz. {sanitize_text(state.accident_time)}\n")
-    p.add_run(f"Miejsce wypadku: ").bold = True
-    p.add_run(f"{sanitize_text(state.accident_place)}\n")
-    p.add_run(f"Rodzaj urazu: ").bold = True
-    p.add_run(f"{sanitize_text(state.injury_type)}")
-
-    doc.add_heading('Okoliczności i przyczyny wypadku:', level=3)
-    doc.add_paragraph(sanitize_text(state.accident_description))
-
-    # Sekcja 4: Świadkowie
-    if state.witnesses:
-        doc.add_heading('4. Świadkowie', level=2)
-        for i, w in enumerate(state.witnesses, 1):
-            doc.add_paragraph(f"{i}. {w.first_name} {w.last_name}, adres: {w.address or 'brak'}")
-    
-    doc.add_paragraph("\n\n......................................................\n(podpis zgłaszającego)")
-
-    # Zapis do bufora
-    file_stream = io.BytesIO()
-    doc.save(file_stream)
-    file_stream.seek(0)
-    return file_stream
+    """Tworzy plik Word z Zawiadomieniem o wypadku (szablon `templates/zawiadomienie.docx`)."""
+    context = {
+        "first_name": sanitize_text(state.first_name),
+        "last_name": sanitize_text(state.last_name),
+        "pesel": sanitize_text(state.pesel),
+        "address_home": sanitize_text(state.address_home),
+        "business_description": sanitize_text(state.business_description),
+        "nip": sanitize_text(state.nip),
+        "regon": sanitize_text(state.regon),
+        "business_address": sanitize_text(state.business_address),
+        "accident_date": sanitize_text(state.accident_date),
+        "accident_time": sanitize_text(state.accident_time),
+        "accident_place": sanitize_text(state.accident_place),
+        "injury_type": sanitize_text(state.injury_type),
+        "accident_description": sanitize_text(state.accident_description),
+        "has_witnesses": bool(state.witnesses),
+        "witnesses": [
+            {
+                "index": i,
+                "first_name": w.first_name or "",
+                "last_name": w.last_name or "",
+                "address": w.address or "brak",
+            }
+            for i, w in enumerate(state.witnesses or [], 1)
+        ],
+    }
+    return load_docx_template(NOTIFICATION_DOCX_TEMPLATE).render(context)
 
+@timed_stage("create_explanation_docx")
 def create_explanation_docx(state: CaseState) -> io.BytesIO:
-    """Tworzy plik Word z Wyjaśnieniami poszkodowanego."""
-    doc = DocxDocument()
-    doc.add_heading('ZAPIS WYJAŚNIEŃ POSZKODOWANEGO', 0)
-
-    p = doc.add_paragraph()
-    p.add_run(f"Ja, niżej podpisany/a: ").bold = True
-    p.add_run(f"{sanitize_text(state.first_name)} {sanitize_text(state.last_name)}\n")
-    
-    doc.add_heading('Treść wyjaśnień:', level=2)
-    # Tutaj wstawiamy opis wypadku jako główne wyjaśnienie
-    doc.add_paragraph(sanitize_text(state.accident_description))
-
-    if state.equipment_info:
-         doc.add_heading('Informacje dodatkowe (maszyny, BHP):', level=3)
-         doc.add_paragraph(state.equipment_info)
-
-    doc.add_paragraph("\n\nOświadczam, że powyższe wyjaśnienia są zgodne z prawdą.")
-    doc.add_paragraph("\n......................................................\n(data i podpis)")
-
-    file_stream = io.BytesIO()
-    doc.save(file_stream)
-    file_stream.seek(0)
-    return file_stream
-
-def remove_polish_chars(text: str) -> str:
-    """
-    Zamienia polskie znaki i inne znaki specjalne na odpowiedniki ASCII/Latin-1,
-    aby uniknąć błędów FPDF przy braku czcionki Unicode.
-    """
-    replacements = {
-        'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
-        'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z',
-        '„': '"', '”': '"', '–': '-', '—': '-', '’': "'", '…': '...'
+    """Tworzy plik Word z Wyjaśnieniami poszkodowanego (szablon `templates/wyjasnienia.docx`)."""
+    context = {
+        "first_name": sanitize_text(state.first_name),
+        "last_name": sanitize_text(state.last_name),
+        # Tutaj wstawiamy opis wypadku jako główne wyjaśnienie
+        "accident_description": sanitize_text(state.accident_description),
+        "equipment_info": state.equipment_info,
     }
-    # 1. Znane zamienniki
-    text = "".join(replacements.get(c, c) for c in text)
-    
-    # 2. Usuń wszystko co nie jest latin-1 (zamień na ?)
-    # FPDF (standard fonts) obsługuje latin-1.
-    return text.encode('latin-1', 'replace').decode('latin-1')
-
+    return load_docx_template(EXPLANATION_DOCX_TEMPLATE).render(context)
 
+@timed_stage("create_simple_pdf")
 def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
     """
     Tworzy prosty PDF. Może zajmować wiele stron.
     Zastosowano bezpieczny layout wertykalny (Etykieta nad Wartością) dla długich pól,
-    aby uniknąć błędów FPDF i wychodzenia poza margines.
+    aby uniknąć błędów FPDF i wychodzenia poza margines. Polskie znaki są zachowane,
+    jeśli dostępna jest czcionka Unicode (patrz `pdf_render.py`).
     """
+    from pdf_render import PDF
+
     pdf = PDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
-    
-    # Fallback dla standardowego Ariala
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, remove_polish_chars(title), ln=True, align='C')
+
+    # DejaVu (Unicode) albo – gdy brak czcionki – Arial z transliteracją polskich znaków
+    family = pdf.font_family_name
+    pdf.set_font(family, 'B', 14)
+    pdf.cell(0, 10, pdf.txt(title), ln=True, align='C')
     pdf.ln(5)
 
-    pdf.set_font("Arial", size=11)
+    pdf.set_font(family, size=11)
     
     # Efektywna szerokość strony (obszar roboczy)
     effective_page_width = pdf.w - pdf.l_margin - pdf.r_margin
@@ -1312,15 +1808,15 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
     placeholder_line = ". " * 65
 
     for key, value in content_dict.items():
-        clean_key = remove_polish_chars(str(key))
+        clean_key = pdf.txt(str(key))
         
         # Nagłówki sekcji
         if key.startswith("---"):
             pdf.ln(5)
-            pdf.set_font("Arial", 'B', 11)
+            pdf.set_font(family, 'B', 11)
             pdf.set_x(pdf.l_margin)
             pdf.multi_cell(0, 8, clean_key)
-            pdf.set_font("Arial", '', 11)
+            pdf.set_font(family, '', 11)
             continue
 
         # Przygotowanie wartości
@@ -1334,7 +1830,7 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
             field_value = value.get("value")
 
         if field_value and str(field_value).strip():
-            clean_val = remove_polish_chars(str(field_value))
+            clean_val = pdf.txt(str(field_value))
             if extra_lines:
                 trailing_space = "\n".join(placeholder_line for _ in range(extra_lines))
                 clean_val = f"{clean_val}\n{trailing_space}"
@@ -1344,13 +1840,13 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
             total_lines = max(extra_lines, 2 if len(clean_key) > 25 else 1)
             block = "\n".join(placeholder_line for _ in range(total_lines))
             if placeholder_hint:
-                clean_val = f"{remove_polish_chars(placeholder_hint)}\n{block}"
+                clean_val = f"{pdf.txt(placeholder_hint)}\n{block}"
             else:
                 clean_val = block
             is_placeholder = True
 
         # Layout
-        pdf.set_font("Arial", 'B', 11)
+        pdf.set_font(family, 'B', 11)
         key_str = clean_key + ": "
         
         # Sprawdzamy szerokości
@@ -1376,7 +1872,7 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
             # Wartość
             pdf.set_x(pdf.l_margin)
             pdf.multi_cell(0, 6, key_str)
-            pdf.set_font("Arial", '', 11)
+            pdf.set_font(family, '', 11)
             pdf.set_x(pdf.l_margin)
             pdf.multi_cell(0, 6, clean_val)
         else:
@@ -1387,11 +1883,11 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
                 if pdf.get_y() > pdf.h - pdf.b_margin - 10:
                     pdf.add_page()
 
-                pdf.set_font("Arial", 'B', 11)
+                pdf.set_font(family, 'B', 11)
                 pdf.set_x(pdf.l_margin)
                 pdf.cell(key_width, 6, key_str, ln=False)
                 
-                pdf.set_font("Arial", '', 11)
+                pdf.set_font(family, '', 11)
                 # multi_cell(0) używa pozostałej szerokości do prawego marginesu
                 pdf.set_x(pdf.get_x())
                 pdf.multi_cell(0, 6, clean_val)
@@ -1399,9 +1895,9 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
                 # Fallback w razie błędu - resetujemy stan i drukujemy wertykalnie
                 pdf.ln()
                 pdf.set_x(pdf.l_margin)
-                pdf.set_font("Arial", 'B', 11)
+                pdf.set_font(family, 'B', 11)
                 pdf.multi_cell(0, 6, key_str)
-                pdf.set_font("Arial", '', 11)
+                pdf.set_font(family, '', 11)
                 pdf.multi_cell(0, 6, clean_val)
 
     output = io.BytesIO()
@@ -1410,121 +1906,45 @@ def create_simple_pdf(title: str, content_dict: dict) -> io.BytesIO:
     return output
 
 
+@timed_stage("create_pdf_from_markdown")
 def create_pdf_from_markdown(markdown_text: str, title: str = "Karta wypadku") -> io.BytesIO:
     """
-    Bardzo prosta konwersja Markdown -> PDF oparta na istniejącym
-    helperze `create_simple_pdf`.
+    Konwersja Markdown -> PDF dla wypełnionej karty wypadku.
 
-    Nie próbuje odwzorować całego formatowania Markdown – traktuje
-    wypełnioną kartę jako jeden długi blok tekstu w PDF.
+    Nagłówki, listy, miejsca do wpisania (kropki) i akapity są układane
+    blok po bloku (patrz `markdown_pdf.py`), z łamaniem stron na bieżąco.
     """
-    content = {
-        "Treść karty (Markdown)": {
-            "value": markdown_text,
-            # Kilka dodatkowych linii na ręczne dopiski
-            "lines": 10,
-        }
-    }
-    return create_simple_pdf(title, content)
+    from markdown_pdf import render_markdown_pdf
+
+    return render_markdown_pdf(markdown_text, title=title)
 
 
 # Dodatkowe wypełniajace EWYP
 def parse_address_to_dict(address_str: Optional[str]) -> dict:
     """
-    Rozbija string adresu (np. 'ul. Długa 5/10, 00-123 Warszawa') na części:
-    ulica, nr_domu, nr_lokalu, kod, poczta.
-    Działa na zasadzie heurystyki (best-effort).
+    Rozbija string adresu (np. 'ul. Długa 5/10, 00-123 Warszawa' albo
+    'ul. Długa 5 m. 10, 00-123') na części: ulica, nr_domu, nr_lokalu, kod, poczta.
+    Parsowanie jest zapamiętywane, a brakująca miejscowość uzupełniana z lokalnego
+    indeksu kodów pocztowych (patrz `addresses.py`).
     """
-    result = {
-        "ulica": "",
-        "nr_domu": "",
-        "nr_lokalu": "",
-        "kod": "",
-        "poczta": ""
-    }
-    
     if not address_str:
-        return result
-
-    # 1. Wyciągamy kod pocztowy (XX-XXX)
-    zip_match = re.search(r'(\d{2}-\d{3})', address_str)
-    if zip_match:
-        result["kod"] = zip_match.group(1)
-        # Poczta to zazwyczaj to, co jest po kodzie pocztowym
-        parts = address_str.split(result["kod"])
-        if len(parts) > 1:
-            result["poczta"] = parts[1].strip(" ,.")
-        
-        # Reszta (przed kodem) to ulica i numer
-        street_part = parts[0].strip(" ,.")
-    else:
-        street_part = address_str
-
-    # 2. Próbujemy oddzielić numer domu i lokalu od ulicy
-    # Szukamy cyfry na końcu ciągu
-    # Wzorce: "Długa 5", "Długa 5/10", "Długa 5 m. 10"
-    match_nr = re.search(r'(\d+[a-zA-Z]?\/?\s?\d*)$', street_part)
-    if match_nr:
-        numer_full = match_nr.group(1)
-        # Ulica to wszystko przed numerem
-        result["ulica"] = street_part[:match_nr.start()].strip()
-        
-        # Rozbicie na dom i lokal
-        if '/' in numer_full:
-            d, l = numer_full.split('/', 1)
-            result["nr_domu"] = d.strip()
-            result["nr_lokalu"] = l.strip()
-        elif 'm.' in numer_full:
-            d, l = numer_full.split('m.', 1)
-            result["nr_domu"] = d.strip()
-            result["nr_lokalu"] = l.strip()
-        else:
-            result["nr_domu"] = numer_full.strip()
-    else:
-        # Jeśli nie udało się znaleźć numeru, wszystko trafia do ulicy
-        result["ulica"] = street_part
-
-    return result
+        return ParsedAddress().as_dict()
+    return parse_address(address_str).as_dict()
 
 
 def normalize_address(address: Optional[str]) -> Optional[str]:
     """Formatuje adres do postaci 'Ulica 1/2, 00-000 Miasto'"""
     if not address or not address.strip():
         return address
-
-    parts = parse_address_to_dict(address)
-    if not any(parts.values()):
-        return address.strip()
-
-    street = parts["ulica"].strip()
-    house = parts["nr_domu"].strip()
-    flat = parts["nr_lokalu"].strip()
-    postal = parts["kod"].strip()
-    city = parts["poczta"].strip()
-
-    street_block = street
-    if house:
-        number = house
-        if flat:
-            number = f"{number}/{flat}"
-        street_block = f"{street} {number}".strip()
-
-    locality = " ".join(item for item in [postal, city] if item).strip()
-
-    pieces = [p for p in [street_block, locality] if p]
-    normalized = ", ".join(pieces)
-    return normalized or address.strip()
+    return parse_address(address).format() or address.strip()
 
 
+@timed_stage("fill_ewyp_pdf")
 def fill_ewyp_pdf(case_state: CaseState, template_path: str = "EWYP.pdf") -> io.BytesIO:
     """
     Wypełnia formularz ZUS EWYP (wersja naprawiona: krótkie nazwy pól).
     Rozróżnia strony, aby unikać konfliktów (np. Imię[0] na str 1 vs str 5).
     """
-    reader = PdfReader(template_path)
-    writer = PdfWriter()
-    writer.append_pages_from_reader(reader)
-    
     # Funkcje pomocnicze
     def val(v): return str(v) if v is not None else ""
 
@@ -1559,7 +1979,12 @@ def fill_ewyp_pdf(case_state: CaseState, template_path: str = "EWYP.pdf") -> io.
     # Definiujemy mapę pól ODDZIELNIE dla każdej strony (0-indexed),
     # aby Imię[0] na str. 1 (poszkodowany) nie nadpisało Imię[0] na str. 5 (świadek).
     
-    for page_num, page in enumerate(writer.pages):
+    from ewyp import load_ewyp_template
+
+    template = load_ewyp_template(template_path)
+    page_values: dict[int, dict[str, str]] = {}
+
+    for page_num in range(len(template.reader.pages)):
         # Słownik z danymi tylko dla TEJ konkretnej strony
         page_map = {}
 
@@ -1648,92 +2073,20 @@ def fill_ewyp_pdf(case_state: CaseState, template_path: str = "EWYP.pdf") -> io.
                  'Data[0]': date_val(case_state.accident_date) # lub date.today().isoformat()
              }
 
-        # --- APLIKOWANIE DANYCH (LOW LEVEL) ---
-        if "/Annots" in page:
-            for annot in page["/Annots"]:
-                try:
-                    obj = annot.get_object()
-                    if "/T" in obj:
-                        key = obj["/T"]
-                        
-                        if key in page_map:
-                            val_to_set = page_map[key]
-                            
-                            # Logika dla Checkboxów vs Tekst
-                            if val_to_set in ['/Yes', '/Off']:
-                                obj[NameObject("/V")] = NameObject(val_to_set)
-                                obj[NameObject("/AS")] = NameObject(val_to_set)
-                            else:
-                                obj[NameObject("/V")] = TextStringObject(val_to_set)
-                            
-                            # KLUCZOWE: Usuwamy /AP, aby wymusić renderowanie tekstu
-                            if "/AP" in obj:
-                                del obj["/AP"]
-                except Exception:
-                    continue # Ignorujemy błędy pojedynczych pól
-
-    # --- FIX STRUKTURY FORMULARZA (GLOBALNY) ---
-    if "/AcroForm" not in writer.root_object:
-        writer.root_object[NameObject("/AcroForm")] = DictionaryObject()
-    
-    acroform = writer.root_object["/AcroForm"]
-    
-    # Usuwamy XFA (dynamiczny formularz), zostawiamy tylko nasze dane statyczne
-    if "/XFA" in acroform:
-        del acroform["/XFA"]
-    if "/XFA" in writer.root_object: # Czasem jest też w root
-        del writer.root_object["/XFA"]
+        page_values[page_num] = page_map
 
-    # Wymuszamy na Adobe Readerze przeliczenie wyglądu
-    acroform[NameObject("/NeedAppearances")] = BooleanObject(True)
+    # Szablon jest sparsowany raz; wypełniamy tylko pola z page_values
+    # (struktura AcroForm jest naprawiona już przy wczytaniu szablonu).
+    return template.fill(page_values)
 
-    out = io.BytesIO()
-    writer.write(out)
-    out.seek(0)
-    return out
 
+# Pula wątków dla builderów dokumentów (PDF/DOCX) – poza pętlą zdarzeń.
+DOCUMENT_WORKERS = int(os.getenv("ZANT_DOCUMENT_WORKERS", "4"))
+document_pool = ThreadPoolExecutor(max_workers=DOCUMENT_WORKERS, thread_name_prefix="zant-docs")
 
-@app.post("/api/case/download-documents")
-async def download_documents(case_state: CaseState):
-    """
-    Generuje komplet dokumentów:
-    1. ZUS EWYP (PDF) - wypełniony danymi formularz
-    2. Wyjaśnienia (DOCX) - edytowalne
-    3. Wyjaśnienia (PDF) - załącznik
-    4. Wszystkie Dane z formularza
-    i zwraca je jako ZIP.
-    """
-    
-    files_to_zip = []
-    actions = generate_post_accident_actions(case_state)
-
-    # 1. Zawiadomienie o wypadku (Oryginalny PDF ZUS)
-    try:
-        # Zakładamy, że plik EWYP.pdf leży w głównym katalogu
-        pdf_zus_content = fill_ewyp_pdf(case_state, template_path="EWYP.pdf")
-        files_to_zip.append(("ZUS_EWYP_Zgloszenie.pdf", pdf_zus_content))
-    except Exception as e:
-        print(f"Błąd wypełniania PDF ZUS: {e}")
-        # W razie błędu nie przerywamy, po prostu nie dodajemy tego pliku
-        # lub dodajemy pusty plik error.txt
-        pass
-
-    # 2. Wyjaśnienia (DOCX) - zawsze warto mieć edytowalne
-    if case_state.accident_description:
-        docx_explanation = create_explanation_docx(case_state)
-        files_to_zip.append(("Wyjasnienia_Poszkodowanego.docx", docx_explanation))
-        
-        # 3. Wyjaśnienia (PDF) - jako prosty załącznik
-        explanation_data = {
-            "--- WYJAŚNIENIA POSZKODOWANEGO ---": "",
-            "Imię i nazwisko": f"{case_state.first_name or ''} {case_state.last_name or ''}".strip() or None,
-            "Treść wyjaśnień": case_state.accident_description,
-            "Informacje dodatkowe": case_state.equipment_info,
-        }
-        # Używamy Twojej funkcji create_simple_pdf (upewnij się, że jest w kodzie)
-        pdf_explanation = create_simple_pdf("Załącznik - Wyjaśnienia", explanation_data)
-        files_to_zip.append(("Zalacznik_Wyjasnienia.pdf", pdf_explanation))
 
+def build_notification_data(case_state: CaseState) -> dict:
+    """Dane do roboczego PDF zawiadomienia (wszystkie dane z formularza)."""
     reporter_label = None
     if case_state.reporter_type == ReporterType.VICTIM:
         reporter_label = "Poszkodowany"
@@ -1759,7 +2112,7 @@ async def download_documents(case_state: CaseState):
                 witness_rows.append(entry)
         witness_value = "\n".join(witness_rows) or None
 
-    notification_data = {
+    return {
         "--- DANE ZGŁASZAJĄCEGO ---": "",
         "Kto zgłasza wypadek": reporter_label,
         "Czy załączono pełnomocnictwo": proxy_info,
@@ -1797,32 +2150,190 @@ async def download_documents(case_state: CaseState):
         "Dane świadków": {"value": witness_value, "lines": 4, "hint": witness_hint},
     }
 
-    pdf_notification = create_simple_pdf("Zawiadomienie (Draft PDF)", notification_data)
-    files_to_zip.append(("zawiadomienie_o_wypadku.pdf", pdf_notification))
 
-    # --- Pakowanie do ZIP ---
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, file_stream in files_to_zip:
-            file_stream.seek(0)
-            zip_file.writestr(filename, file_stream.read())
+def build_document_jobs(
+    case_state: CaseState, include_notification_docx: bool = False
+) -> list[tuple[str, str, Callable[[], io.BytesIO]]]:
+    """
+    Lista dokumentów do paczki: (nazwa pliku, komponent do metryk, funkcja budująca).
+    Funkcje są niezależne, więc mogą działać równolegle. Edytowalne zawiadomienie
+    (DOCX) dokładamy na życzenie – np. w przeliczeniach wsadowych (`batch_render.py`).
+    """
+    jobs: list[tuple[str, str, Callable[[], io.BytesIO]]] = [
+        # 1. Zawiadomienie o wypadku (Oryginalny PDF ZUS)
+        # Zakładamy, że plik EWYP.pdf leży w głównym katalogu
+        ("ZUS_EWYP_Zgloszenie.pdf", "fill_ewyp_pdf",
+         functools.partial(fill_ewyp_pdf, case_state, template_path="EWYP.pdf")),
+    ]
+
+    # 2. Wyjaśnienia (DOCX) - zawsze warto mieć edytowalne
+    if case_state.accident_description:
+        jobs.append(("Wyjasnienia_Poszkodowanego.docx", "create_explanation_docx",
+                     functools.partial(create_explanation_docx, case_state)))
+
+        # 3. Wyjaśnienia (PDF) - jako prosty załącznik
+        explanation_data = {
+            "--- WYJAŚNIENIA POSZKODOWANEGO ---": "",
+            "Imię i nazwisko": f"{case_state.first_name or ''} {case_state.last_name or ''}".strip() or None,
+            "Treść wyjaśnień": case_state.accident_description,
+            "Informacje dodatkowe": case_state.equipment_info,
+        }
+        jobs.append(("Zalacznik_Wyjasnienia.pdf", "explanation_pdf",
+                     functools.partial(create_simple_pdf, "Załącznik - Wyjaśnienia", explanation_data)))
+
+    # 4. Wszystkie dane z formularza
+    jobs.append(("zawiadomienie_o_wypadku.pdf", "notification_pdf",
+                 functools.partial(create_simple_pdf, "Zawiadomienie (Draft PDF)",
+                                   build_notification_data(case_state))))
+    if include_notification_docx:
+        jobs.append(("zawiadomienie_o_wypadku.docx", "create_notification_docx",
+                     functools.partial(create_notification_docx, case_state)))
+    return jobs
+
+
+async def run_in_document_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """Uruchamia funkcję w puli dokumentów z kopią kontekstu (ewidencja tokenów)."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    QUEUE_DEPTH.inc(queue="documents")
+    try:
+        return await loop.run_in_executor(document_pool, functools.partial(context.run, func, *args))
+    finally:
+        QUEUE_DEPTH.dec(queue="documents")
+
+
+# Podbij przy zmianie builderów dokumentów – unieważnia paczki w pamięci podręcznej.
+BUNDLE_FORMAT_VERSION = "1"
+
+
+def document_versions(template_path: str = "EWYP.pdf") -> list[str]:
+    """Wersje szablonów i rendererów, od których zależy zawartość paczki."""
+    from ewyp import OUTPUT_MODE as EWYP_OUTPUT_MODE, load_ewyp_template
+    from pdf_render import unicode_fonts_available
+
+    try:
+        ewyp_version = load_ewyp_template(template_path).version
+    except Exception:
+        ewyp_version = "missing"
+    docx_versions = []
+    for name in (NOTIFICATION_DOCX_TEMPLATE, EXPLANATION_DOCX_TEMPLATE):
+        try:
+            docx_versions.append(load_docx_template(name).version)
+        except Exception:
+            docx_versions.append("missing")
+    return [
+        BUNDLE_FORMAT_VERSION,
+        f"ewyp:{ewyp_version}:{EWYP_OUTPUT_MODE}",
+        f"docx:{':'.join(docx_versions)}",
+        f"pdf:{'unicode' if unicode_fonts_available() else 'latin1'}",
+    ]
 
-    zip_buffer.seek(0)
+
+@app.post("/api/case/download-documents")
+async def download_documents(case_state: CaseState, request: Request):
+    """
+    Generuje komplet dokumentów:
+    1. ZUS EWYP (PDF) - wypełniony danymi formularz
+    2. Wyjaśnienia (DOCX) - edytowalne
+    3. Wyjaśnienia (PDF) - załącznik
+    4. Wszystkie Dane z formularza
+    i zwraca je jako ZIP.
+
+    Paczka dla niezmienionego stanu sprawy jest serwowana z pamięci podręcznej;
+    nagłówek ETag pozwala klientowi dostać 304 przy `If-None-Match`. ETag dostaje
+    tylko kompletna paczka z pamięci – ZIP strumieniowany (może pominąć dokument,
+    którego nie udało się zbudować) idzie z `Cache-Control: no-store`.
+    """
+    
+    # Plan działań (LLM) liczy się w tle; klient pobiera go osobno po kluczu
+    # z nagłówka X-ZANT-Actions-Key, więc ZIP nie czeka na model.
+    plan = await asyncio.to_thread(schedule_action_plan, case_state)
 
     # Nazwa pliku wynikowego
     filename = f"dokumenty_wypadkowe_{case_state.last_name or 'draft'}.zip"
-    
-    headers = {"Content-Disposition": f"attachment; filename={filename}"}
 
-    serialized = json.dumps([action.model_dump() for action in actions], ensure_ascii=False)
-    headers["X-ZANT-Actions"] = base64.b64encode(serialized.encode("utf-8")).decode("ascii")
-    
+    key = bundle_key(plan.key, document_versions())
+    etag = etag_for(key)
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "X-ZANT-Actions-Key": plan.key,
+    }
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        BUNDLE_CACHE.inc(result="not_modified")
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    cached = await asyncio.to_thread(bundles.get, key)
+    if cached is not None:
+        BUNDLE_CACHE.inc(result="hit")
+        return Response(content=cached, media_type="application/zip", headers={**headers, "ETag": etag})
+    BUNDLE_CACHE.inc(result="miss")
+    headers["Cache-Control"] = "no-store"
+
+    jobs = build_document_jobs(case_state)
+    builds = {
+        asyncio.ensure_future(run_in_document_pool(build)): (filename, component)
+        for filename, component, build in jobs
+    }
+
+    complete = True
+
+    async def ready_documents():
+        nonlocal complete
+        # Wpisy trafiają do ZIP-a w kolejności ukończenia dokumentów.
+        pending = dict(builds)
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                filename, component = pending.pop(task)
+                try:
+                    content = task.result()
+                except Exception as e:
+                    # Błąd jednego dokumentu nie przerywa paczki – po prostu go pomijamy.
+                    print(f"Błąd generowania {filename}: {e}")
+                    FALLBACKS.inc(component=component)
+                    complete = False
+                    continue
+                yield filename, content
+
+    async def stream_and_cache():
+        # Wysyłamy ZIP na bieżąco, a kompletną paczkę (bez błędów) zapamiętujemy.
+        chunks: list[bytes] = []
+        async for chunk in stream_zip(ready_documents()):
+            chunks.append(chunk)
+            yield chunk
+        if complete:
+            await asyncio.to_thread(bundles.put, key, b"".join(chunks))
+
     return StreamingResponse(
-        zip_buffer,
+        stream_and_cache(),
         media_type="application/zip",
         headers=headers,
     )
 
+@app.post("/api/case/action-plan")
+async def request_action_plan(case_state: CaseState, response: Response) -> ActionPlanStatus:
+    """
+    Zleca obliczenie planu działań dla stanu sprawy (albo zwraca gotowy z pamięci).
+    Odpowiedź 202 oznacza, że plan jest jeszcze liczony – odpytuj GET po kluczu.
+    """
+    plan = await asyncio.to_thread(schedule_action_plan, case_state)
+    if plan.status == STATUS_PENDING:
+        response.status_code = 202
+    return ActionPlanStatus(key=plan.key, status=plan.status, actions=plan.actions)
+
+
+@app.get("/api/case/action-plan/{key}")
+async def get_action_plan(key: str, response: Response) -> ActionPlanStatus:
+    """Plan działań po kluczu stanu sprawy: 200 gotowy/nieudany, 202 w toku, 404 nieznany."""
+    plan = await asyncio.to_thread(action_plans.get, key)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Unknown action plan key")
+    if plan.status == STATUS_PENDING:
+        response.status_code = 202
+    return ActionPlanStatus(key=plan.key, status=plan.status, actions=plan.actions)
+
+
 @app.post("/api/ocr/summarize-accident-facts")
 async def summarize_accident_facts(files: List[UploadFile] = File(...)) -> dict:
     """
@@ -1860,6 +2371,7 @@ async def summarize_accident_facts(files: List[UploadFile] = File(...)) -> dict:
         pdf_base64 = base64.b64encode(pdf_buffer.getvalue()).decode("ascii")
     except Exception:
         # Jeśli PDF z jakiegoś powodu się nie wygeneruje, nie blokujemy całej odpowiedzi.
+        FALLBACKS.inc(component="create_pdf_from_markdown")
         pdf_base64 = None
 
     return {
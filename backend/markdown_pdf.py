@@ -0,0 +1,284 @@
+"""
+Renderowanie Markdown -> PDF dla kart wypadku (nagłówki, listy, kropki, akapity).
+
+Tekst jest dzielony jednym przejściem na bloki (nagłówek, linia pozioma,
+element listy, akapit), a bloki są układane po kolei: wiersze łamiemy sami
+(szerokości słów liczone raz), a stronę – przed każdym wierszem, który się
+nie mieści. Nie budujemy jednej ogromnej komórki z całą kartą, więc czas
+renderowania rośnie liniowo z długością dokumentu. Obsługiwany podzbiór Markdown:
+
+- `#`..`######` – nagłówki (nie zostają same na dole strony),
+- `---` / `***` / `___` – linia pozioma,
+- `1.`, `1)`, `-`, `*`, `+` – listy (z wcięciem i wiszącym akapitem),
+- `**pogrubienie**` / `__pogrubienie__`; `*kursywa*` jest pisana prosto
+  (nie mamy kroju pochyłego),
+- dwie spacje albo `\\` na końcu wiersza – twarde złamanie,
+- wiersz złożony z samych kropek – miejsce do wpisania, dociągane do prawego marginesu.
+"""
+
+from __future__ import annotations
+
+import io
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from pdf_render import PDF
+
+BODY_SIZE = 11
+LINE_HEIGHT = 5.5
+HEADING_SIZES = {1: 16, 2: 13, 3: 12}
+LIST_INDENT = 6.0
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_RULE = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_LIST_ITEM = re.compile(r"^(\s*)(\d{1,3}[.)]|[-*+])\s+(.*)$")
+_PLACEHOLDER = re.compile(r"^[.…\s]{4,}$")
+_WORD = re.compile(r"\s*\S+\s*")
+_INLINE = re.compile(r"\*\*(.+?)\*\*|__(.+?)__|(?<![*\w])\*(?![\s*])(.+?)(?<![\s*])\*(?![*\w])")
+
+
+@dataclass
+class Block:
+    kind: str  # "heading" | "rule" | "item" | "paragraph"
+    lines: list[str] = field(default_factory=list)
+    level: int = 0  # poziom nagłówka albo głębokość wcięcia elementu listy
+    marker: str = ""
+
+
+def _hard_break(line: str) -> bool:
+    return line.endswith("  ") or line.endswith("\\")
+
+
+def _append_line(block: Block, text: str, hard_break_before: bool) -> None:
+    text = text.strip().rstrip("\\").rstrip()
+    if block.lines and not hard_break_before:
+        block.lines[-1] = f"{block.lines[-1]} {text}" if block.lines[-1] else text
+    else:
+        block.lines.append(text)
+
+
+def parse_blocks(markdown_text: str) -> Iterator[Block]:
+    """Dzieli tekst na bloki w jednym przejściu (bez cofania się)."""
+    current: Optional[Block] = None
+    broken = False  # czy poprzedni wiersz kończył się twardym złamaniem
+    # Wcięcia list (w znakach) -> głębokość zagnieżdżenia.
+    indents: list[int] = []
+
+    for raw in markdown_text.splitlines():
+        line = raw.rstrip("\n")
+        stripped = line.strip()
+
+        if not stripped:
+            if current is not None:
+                yield current
+                current = None
+            continue
+
+        heading = _HEADING.match(stripped)
+        if heading:
+            if current is not None:
+                yield current
+            yield Block("heading", [heading.group(2)], level=len(heading.group(1)))
+            current = None
+            continue
+
+        if _RULE.match(line):
+            if current is not None:
+                yield current
+            yield Block("rule")
+            current = None
+            indents = []
+            continue
+
+        item = _LIST_ITEM.match(line)
+        if item and not _PLACEHOLDER.match(stripped):
+            if current is not None:
+                yield current
+            indent = len(item.group(1).expandtabs(4))
+            while indents and indents[-1] > indent:
+                indents.pop()
+            if not indents or indents[-1] < indent:
+                indents.append(indent)
+            current = Block("item", level=len(indents) - 1, marker=item.group(2))
+            _append_line(current, item.group(3), True)
+            broken = _hard_break(line)
+            continue
+
+        if current is None:
+            # Wcięty tekst bez listy nad nim to zwykły akapit.
+            if not line.startswith((" ", "\t")):
+                indents = []
+            current = Block("paragraph")
+            broken = True
+        _append_line(current, stripped, broken or _PLACEHOLDER.match(stripped) is not None)
+        broken = _hard_break(line) or _PLACEHOLDER.match(stripped) is not None
+
+    if current is not None:
+        yield current
+
+
+def inline_runs(text: str) -> Iterator[tuple[str, bool]]:
+    """Dzieli wiersz na fragmenty (tekst, pogrubienie)."""
+    pos = 0
+    for match in _INLINE.finditer(text):
+        if match.start() > pos:
+            yield text[pos:match.start()], False
+        if match.group(1) is not None or match.group(2) is not None:
+            yield match.group(1) or match.group(2), True
+        else:
+            yield match.group(3), False
+        pos = match.end()
+    if pos < len(text):
+        yield text[pos:], False
+
+
+class MarkdownRenderer:
+    """
+    Układa bloki na stronach. Wiersze łamiemy sami (szerokości słów liczone raz
+    i trzymane w słowniku), a gotowy wiersz wypisujemy przez `cell` – wbudowane
+    łamanie fpdf2 mierzy rosnący wiersz od nowa po każdym znaku.
+    """
+
+    def __init__(self, pdf: PDF) -> None:
+        self.pdf = pdf
+        self.family = pdf.font_family_name
+        self.bullet = "•" if pdf.unicode else "-"
+        self._widths: dict[tuple[str, str, float], float] = {}
+
+    def render(self, markdown_text: str) -> None:
+        c_margin = self.pdf.c_margin
+        # Segmenty wiersza stoją jeden przy drugim – bez wewnętrznych marginesów komórek.
+        self.pdf.c_margin = 0
+        try:
+            for block in parse_blocks(markdown_text):
+                getattr(self, f"_render_{block.kind}")(block)
+        finally:
+            self.pdf.c_margin = c_margin
+
+    def _ensure_space(self, height: float) -> None:
+        """Łamie stronę, jeśli blok o danej wysokości nie zmieści się w całości."""
+        if self.pdf.y + height > self.pdf.page_break_trigger:
+            self.pdf.add_page()
+
+    def _width(self, text: str, style: str, size: float) -> float:
+        key = (text, style, size)
+        width = self._widths.get(key)
+        if width is None:
+            self.pdf.set_font(self.family, style, size)
+            width = self._widths[key] = self.pdf.get_string_width(text)
+        return width
+
+    def _emit(self, segments: list[tuple[str, str, float]], size: float, height: float) -> None:
+        pdf = self.pdf
+        self._ensure_space(height)
+        for style, text, width in segments:
+            pdf.set_font(self.family, style, size)
+            pdf.cell(width, height, text)
+        pdf.ln(height)
+
+    def _flow(self, text: str, size: float, height: float, bold: bool = False) -> None:
+        """Łamie jeden wiersz źródła na wiersze strony, zaczynając od bieżącej pozycji x."""
+        pdf = self.pdf
+        right = pdf.w - pdf.r_margin
+        x = pdf.x
+        segments: list[tuple[str, str, float]] = []
+
+        if _PLACEHOLDER.match(text):
+            # Miejsce do wpisania: kropki do prawego marginesu.
+            count = max(4, int((right - x) / self._width(".", "", size)) - 1)
+            dots = "." * count
+            self._emit([("", dots, self._width(dots, "", size))], size, height)
+            return
+
+        for run, run_bold in inline_runs(pdf.txt(text)):
+            style = "B" if bold or run_bold else ""
+            for word in _WORD.findall(run):
+                if not segments:
+                    word = word.lstrip()
+                if segments and x + self._width(word.rstrip(), style, size) > right:
+                    self._emit(segments, size, height)
+                    segments, x = [], pdf.l_margin
+                    word = word.lstrip()
+                # Słowo dłuższe niż cały wiersz dzielimy na znaki.
+                while word and x + self._width(word.rstrip(), style, size) > right:
+                    cut = 1
+                    while cut < len(word) and x + self._width(word[: cut + 1], style, size) <= right:
+                        cut += 1
+                    self._emit(segments + [(style, word[:cut], self._width(word[:cut], style, size))], size, height)
+                    segments, x, word = [], pdf.l_margin, word[cut:]
+                if not word:
+                    continue
+                width = self._width(word, style, size)
+                if segments and segments[-1][0] == style:
+                    _, prev, prev_width = segments[-1]
+                    segments[-1] = (style, prev + word, prev_width + width)
+                else:
+                    segments.append((style, word, width))
+                x += width
+        self._emit(segments, size, height)
+
+    def _render_heading(self, block: Block) -> None:
+        pdf = self.pdf
+        size = HEADING_SIZES.get(block.level, BODY_SIZE)
+        height = size * 0.5
+        # Nagłówek razem z pierwszym wierszem treści pod nim.
+        self._ensure_space(2 + height + LINE_HEIGHT)
+        pdf.ln(2)
+        pdf.set_x(pdf.l_margin)
+        self._flow(block.lines[0], size, height, bold=True)
+        pdf.ln(1)
+
+    def _render_rule(self, block: Block) -> None:
+        pdf = self.pdf
+        if pdf.y + 4 > pdf.page_break_trigger:
+            pdf.add_page()
+            return
+        pdf.ln(2)
+        pdf.line(pdf.l_margin, pdf.y, pdf.w - pdf.r_margin, pdf.y)
+        pdf.ln(2)
+
+    def _render_paragraph(self, block: Block) -> None:
+        pdf = self.pdf
+        pdf.set_x(pdf.l_margin)
+        for line in block.lines:
+            self._flow(line, BODY_SIZE, LINE_HEIGHT)
+        pdf.ln(1.5)
+
+    def _render_item(self, block: Block) -> None:
+        pdf = self.pdf
+        left = pdf.l_margin
+        marker = self.bullet if block.marker in "-*+" else block.marker
+        indent = left + LIST_INDENT * block.level
+        text_x = max(indent + LIST_INDENT, indent + self._width(marker, "", BODY_SIZE) + 1.5)
+
+        self._ensure_space(LINE_HEIGHT)
+        pdf.set_font(self.family, "", BODY_SIZE)
+        pdf.set_x(indent)
+        pdf.cell(text_x - indent, LINE_HEIGHT, marker)
+        # Wiszący akapit: kolejne wiersze elementu zaczynają się pod tekstem, nie pod znacznikiem.
+        pdf.set_left_margin(text_x)
+        try:
+            for line in block.lines:
+                self._flow(line, BODY_SIZE, LINE_HEIGHT)
+        finally:
+            pdf.set_left_margin(left)
+        pdf.ln(1.5)
+
+
+def render_markdown_pdf(markdown_text: str, title: Optional[str] = None, unicode: Optional[bool] = None) -> io.BytesIO:
+    pdf = PDF(unicode=unicode)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    if title:
+        pdf.set_font(pdf.font_family_name, "B", 14)
+        pdf.cell(0, 10, pdf.txt(title), new_x="LMARGIN", new_y="NEXT", align="C")
+        pdf.ln(5)
+
+    MarkdownRenderer(pdf).render(markdown_text)
+
+    output = io.BytesIO()
+    output.write(pdf.output())
+    output.seek(0)
+    return output
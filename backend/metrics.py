@@ -0,0 +1,346 @@
+"""
+Minimalny podsystem metryk w formacie tekstowym Prometheusa (endpoint `/metrics`).
+
+Udostępnia liczniki, wskaźniki (gauge) i histogramy z etykietami oraz
+gotowe metryki backendu: czasy endpointów, czasy etapów (OCR, łańcuchy LLM,
+generowanie dokumentów, pakowanie ZIP), liczniki fallbacków i błędów
+parsowania oraz liczbę wywołań LLM w toku i głębokość kolejek.
+
+Przy kilku workerach (`serve.py`) rejestr każdego procesu daje migawkę
+(`MetricsRegistry.snapshot`), a `render` łączy ją z migawkami pozostałych
+(`worker_metrics.py`): liczniki i histogramy są sumowane, wskaźniki –
+sumowane albo brane jako maksimum (`Gauge(..., multiprocess="max")`).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def values(self) -> dict[tuple[str, ...], Any]:
+        """Kopia wartości per etykiety (do migawki i wypisania)."""
+        raise NotImplementedError
+
+    def merge(self, current: Any, other: Any) -> Any:
+        return current + other
+
+    def merged(self, others: Sequence[list]) -> dict[tuple[str, ...], Any]:
+        """Wartości tego procesu połączone z migawkami innych (lista par [etykiety, wartość])."""
+        values = self.values()
+        for rows in others:
+            for labels, value in rows:
+                key = tuple(labels)
+                values[key] = self.merge(values[key], value) if key in values else value
+        return values
+
+    def samples(self, others: Sequence[list] = ()) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def values(self) -> dict[tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self, others: Sequence[list] = ()) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(self.merged(others).items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, multiprocess: str = "sum", **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Łączenie wartości workerów: "sum" (np. wywołania w toku) albo "max" (np. czas rozgrzewki).
+        self.multiprocess = multiprocess
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Wartość liczona w momencie odczytu (np. długość kolejki puli wątków)."""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    @contextmanager
+    def track_in_progress(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def values(self) -> dict[tuple[str, ...], float]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue
+        return values
+
+    def merge(self, current: float, other: float) -> float:
+        return max(current, other) if self.multiprocess == "max" else current + other
+
+    def samples(self, others: Sequence[list] = ()) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(self.merged(others).items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # klucz etykiet -> [liczniki kubełków..., suma, liczba]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> float:
+        row = self._values.get(self._key(labels))
+        return row[-1] if row else 0.0
+
+    def values(self) -> dict[tuple[str, ...], list[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._values.items()}
+
+    def merge(self, current: list[float], other: list[float]) -> list[float]:
+        return [a + b for a, b in zip(current, other)]
+
+    def samples(self, others: Sequence[list] = ()) -> list[str]:
+        lines: list[str] = []
+        for key, row in sorted(self.merged(others).items()):
+            for bound, count in zip(self.buckets, row):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(count)}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(row[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess: str = "sum"
+    ) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames, multiprocess=multiprocess))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets=buckets))  # type: ignore[return-value]
+
+    def snapshot(self) -> dict[str, list]:
+        """Wartości wszystkich metryk jako JSON: {nazwa: [[etykiety, wartość], ...]}."""
+        return {
+            name: [[list(key), value] for key, value in metric.values().items()]
+            for name, metric in self._metrics.items()
+        }
+
+    def render(self, others: Sequence[dict] = (), live_others: Sequence[dict] = ()) -> str:
+        """
+        Tekst dla Prometheusa. `others` to migawki pozostałych workerów (liczniki
+        i histogramy, także workerów zakończonych), `live_others` – migawki workerów
+        działających (wskaźniki opisują bieżący stan, więc bez zakończonych).
+        """
+        lines: list[str] = []
+        for name, metric in self._metrics.items():
+            sources = live_others if metric.kind == "gauge" else others
+            lines.extend(metric.header())
+            lines.extend(metric.samples([snapshot[name] for snapshot in sources if name in snapshot]))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_DURATION = REGISTRY.histogram(
+    "zant_http_request_duration_seconds",
+    "Czas obsługi żądania HTTP (do wysłania nagłówków odpowiedzi).",
+    ["method", "endpoint", "status"],
+)
+STAGE_DURATION = REGISTRY.histogram(
+    "zant_stage_duration_seconds",
+    "Czas etapów przetwarzania (OCR, generowanie dokumentów, pakowanie ZIP).",
+    ["stage"],
+)
+LLM_CHAIN_DURATION = REGISTRY.histogram(
+    "zant_llm_chain_duration_seconds",
+    "Czas wywołania nazwanego łańcucha LLM (prompt + model + parser).",
+    ["chain"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+FALLBACKS = REGISTRY.counter(
+    "zant_fallbacks_total",
+    "Liczba przejść na ścieżkę zastępczą (brak LLM, błąd LLM, błąd generowania dokumentu).",
+    ["component"],
+)
+PARSE_FAILURES = REGISTRY.counter(
+    "zant_llm_parse_failures_total",
+    "Liczba odpowiedzi LLM, których nie udało się sparsować.",
+    ["chain"],
+)
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    "zant_llm_in_flight",
+    "Liczba wywołań LLM w toku.",
+)
+LOCAL_EXTRACTION = REGISTRY.counter(
+    "zant_case_state_extraction_total",
+    "Wiadomości w czacie wg ścieżki ekstrakcji pól: rules (reguły lokalne), routed (nawigacja/odmowa, bez ekstrakcji) / llm.",
+    ["path"],
+)
+SHARED_CACHE = REGISTRY.counter(
+    "zant_shared_cache_total",
+    "Odczyty współdzielonej pamięci podręcznej (SQLite) wg przestrzeni i wyniku (hit / miss).",
+    ["cache", "result"],
+)
+WARMUP_DURATION = REGISTRY.gauge(
+    "zant_warmup_step_seconds",
+    "Czas kroków rozgrzewki przy starcie procesu (łańcuchy LLM, szablony, czcionki, tesseract).",
+    ["step"],
+    multiprocess="max",
+)
+BUNDLE_CACHE = REGISTRY.counter(
+    "zant_bundle_cache_total",
+    "Pobrania paczki dokumentów wg wyniku pamięci podręcznej (hit / miss / not_modified).",
+    ["result"],
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "zant_queue_depth",
+    "Liczba zadań oczekujących lub przetwarzanych w kolejce.",
+    ["queue"],
+)
+
+
+def timed_stage(stage: str) -> Callable:
+    """Dekorator mierzący czas funkcji jako etap `stage` w STAGE_DURATION."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_DURATION.time(stage=stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render_latest(registry: Optional[MetricsRegistry] = None) -> str:
+    return (registry or REGISTRY).render()
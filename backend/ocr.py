@@ -1,16 +1,21 @@
 from __future__ import annotations
 
+import contextvars
+import hashlib
 import io
 import os
-from typing import Final, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Final, List, Optional
 
-import pytesseract
-from pdf2image import convert_from_bytes
-from PIL import Image
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
+
+from chains import ChainSpec, registry, str_parser
+from metrics import FALLBACKS, QUEUE_DEPTH, STAGE_DURATION
+from shared_cache import shared_cache
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
 
 
 SUPPORTED_IMAGE_FORMATS: Final[set[str]] = {
@@ -22,26 +27,54 @@ SUPPORTED_IMAGE_FORMATS: Final[set[str]] = {
 
 OCR_LANG: Final[str] = "pol"
 
+# Ile plików naraz przechodzi przez potok OCR -> streszczenie.
+OCR_PIPELINE_WORKERS: Final[int] = int(os.getenv("ZANT_OCR_WORKERS", "4"))
+
 
 def _is_pdf(data: bytes) -> bool:
     # Check PDF magic header
     return data.lstrip().startswith(b"%PDF")
 
 
+def _cached_ocr(data: bytes, run: Callable[[bytes], str]) -> str:
+    """
+    Tekst z OCR z pamięci współdzielonej procesów (`shared_cache.py`), kluczowany
+    skrótem bajtów dokumentu – ten sam plik nie przechodzi przez tesseract drugi raz.
+    """
+    store = shared_cache()
+    if store is None:
+        return run(data)
+    key = f"{OCR_LANG}:{hashlib.sha256(data).hexdigest()}"
+    text = store.get("ocr", key)
+    if text is None:
+        text = run(data)
+        store.set("ocr", key, text)
+    return text
+
+
 def _extract_text_from_pdf(data: bytes) -> str:
+    return _cached_ocr(data, _ocr_pdf)
+
+
+def _ocr_pdf(data: bytes) -> str:
     """
     Run OCR on a PDF document by converting pages to images first.
 
     Requires `pdf2image` and a Poppler installation available on the system.
     """
+    import pytesseract
+    from pdf2image import convert_from_bytes
+
     try:
-        pages = convert_from_bytes(data)
+        with STAGE_DURATION.time(stage="pdf_to_images"):
+            pages = convert_from_bytes(data)
     except Exception as exc:  # pragma: no cover - defensive
         raise ValueError("Unable to convert PDF to images") from exc
 
     texts: list[str] = []
     for page in pages:
-        page_text = pytesseract.image_to_string(page, lang=OCR_LANG)
+        with STAGE_DURATION.time(stage="ocr_page"):
+            page_text = pytesseract.image_to_string(page, lang=OCR_LANG)
         texts.append(page_text.strip())
     return "\n\n".join(t for t in texts if t)
 
@@ -59,6 +92,12 @@ def extract_text_from_image(data: bytes) -> str:
 
     if _is_pdf(data):
         return _extract_text_from_pdf(data)
+    return _cached_ocr(data, _ocr_image)
+
+
+def _ocr_image(data: bytes) -> str:
+    import pytesseract
+    from PIL import Image
 
     try:
         image = Image.open(io.BytesIO(data))
@@ -68,10 +107,21 @@ def extract_text_from_image(data: bytes) -> str:
     if image.format and image.format.upper() not in SUPPORTED_IMAGE_FORMATS:
         raise ValueError(f"Unsupported image format: {image.format}")
 
-    text = pytesseract.image_to_string(image, lang=OCR_LANG)
+    with STAGE_DURATION.time(stage="ocr_page"):
+        text = pytesseract.image_to_string(image, lang=OCR_LANG)
     return text.strip()
 
 
+def tesseract_version() -> str:
+    """
+    Sprawdza binarkę tesseract (rozgrzewka przy starcie: import pytesseract
+    i pierwsze uruchomienie procesu). Rzuca wyjątek, jeśli jej nie ma.
+    """
+    import pytesseract
+
+    return str(pytesseract.get_tesseract_version())
+
+
 def extract_texts_from_pdfs(pdf_files: List[bytes]) -> List[str]:
     """
     Przyjmij wiele plików PDF (bytes) i zwróć listę tekstów po OCR.
@@ -120,42 +170,41 @@ Wynik zwróć w uporządkowanym formacie tekstowym z nagłówkami:
 """
 
 
-def _get_llm() -> Optional[ChatGoogleGenerativeAI]:
+def _get_llm() -> Optional[BaseChatModel]:
     """
     Prosty factory na LLM-a używanego do streszczania faktów.
     """
     load_dotenv()
     try:
-        return ChatGoogleGenerativeAI(
-            model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
-            temperature=0,
-        )
+        from llm_provider import create_chat_model
+
+        return create_chat_model()
     except Exception:
         # Jeśli nie uda się zainicjalizować LLM-a, zwracamy None;
         # wywołujący może użyć fallbacku.
         return None
 
 
-def summarize_accident_facts_from_pdfs(pdf_files: List[bytes]) -> str:
+@lru_cache(maxsize=1)
+def load_card_template() -> str:
     """
-    Przyjmij wiele plików PDF (kart wypadku), wykonaj OCR, a następnie
-    przygotuj podsumowanie faktów zgodnie z SYSTEM_PROMPT_FAKTY
-    i DEFINICJA_WYPADKU.
-
-    Zwraca uporządkowany tekst (nagłówki + streszczenie faktów).
+    Wczytuje (raz na proces) wzór karty wypadku z pliku Markdown `karta_wypadku.md`
+    z katalogu głównego projektu. Jeśli szablonu brakuje, zwraca pusty tekst.
     """
-    texts = extract_texts_from_pdfs(pdf_files)
-    joined_text = "\n\n---\n\n".join(t for t in texts if t.strip())
-    if not joined_text:
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    template_path = os.path.join(project_root, "karta_wypadku.md")
+    try:
+        with open(template_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
         return ""
 
-    llm = _get_llm()
-    if llm is None:
-        # Fallback: zwracamy sam tekst połączony bez przetwarzania LLM.
-        return joined_text
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
+registry.register(
+    ChainSpec(
+        name="facts_summary",
+        version="1",
+        messages=[
             (
                 "system",
                 SYSTEM_PROMPT_FAKTY
@@ -166,43 +215,47 @@ def summarize_accident_facts_from_pdfs(pdf_files: List[bytes]) -> str:
                 "Teksty kart wypadku (po OCR):\n{facts_docs}\n\n"
                 "Przygotuj podsumowanie faktów w wymaganym formacie.",
             ),
-        ]
+        ],
+        parser_factory=str_parser,
+        llm_factory=lambda: _get_llm(),
+        static={"definition": DEFINICJA_WYPADKU},
+        sample_inputs={"facts_docs": ""},
     )
+)
 
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke(
-        {
-            "definition": DEFINICJA_WYPADKU,
-            "facts_docs": joined_text,
-        }
-    )
 
+registry.register(
+    ChainSpec(
+        name="facts_summary_merge",
+        version="1",
+        messages=[
+            (
+                "system",
+                SYSTEM_PROMPT_FAKTY
+                + "\n\nDefinicja wypadku przy pracy:\n{definition}\n\n"
+                "Otrzymujesz streszczenia faktów przygotowane osobno dla każdego dokumentu "
+                "tej samej sprawy. Połącz je w jedno podsumowanie, nie powtarzaj tych samych "
+                "faktów i wyraźnie wskaż, jeśli dokumenty są ze sobą sprzeczne.",
+            ),
+            (
+                "human",
+                "Streszczenia poszczególnych dokumentów:\n{summaries}\n\n"
+                "Przygotuj jedno podsumowanie faktów w wymaganym formacie.",
+            ),
+        ],
+        parser_factory=str_parser,
+        llm_factory=lambda: _get_llm(),
+        static={"definition": DEFINICJA_WYPADKU},
+        sample_inputs={"summaries": ""},
+    )
+)
 
-def build_filled_card_text_from_summary(summary_text: str) -> str:
-    """
-    Wczytuje wzór karty wypadku z pliku Markdown `karta_wypadku.md`
-    z katalogu głównego projektu, przekazuje go wraz ze streszczeniem
-    faktów do LLM i prosi o uzupełnienie TYLKO kropek tam, gdzie
-    odpowiedź jednoznacznie wynika ze streszczenia.
-
-    Zwraca kompletny tekst karty w formacie Markdown.
-    """
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    template_path = os.path.join(project_root, "karta_wypadku.md")
-    try:
-        with open(template_path, "r", encoding="utf-8") as f:
-            template_text = f.read()
-    except Exception:
-        # Jeśli szablonu brakuje, nie próbujemy dalej przetwarzać.
-        template_text = ""
-
-    llm = _get_llm()
-    if llm is None or not summary_text.strip():
-        # Bez LLM – zwracamy sam szablon, nic nie zmieniamy.
-        return template_text
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
+registry.register(
+    ChainSpec(
+        name="accident_card_fill",
+        version="1",
+        messages=[
             (
                 "system",
                 (
@@ -227,19 +280,94 @@ def build_filled_card_text_from_summary(summary_text: str) -> str:
                     "Zwróć kompletny tekst po uzupełnieniu możliwych pól."
                 ),
             ),
-        ]
+        ],
+        parser_factory=str_parser,
+        llm_factory=lambda: _get_llm(),
+        # Szablon karty jest wklejany w prompt raz, przy kompilacji łańcucha.
+        static={"template": load_card_template},
+        sample_inputs={"summary": ""},
     )
+)
+
+
+def summarize_accident_facts_from_pdfs(pdf_files: List[bytes]) -> str:
+    """
+    Przyjmij wiele plików PDF (kart wypadku), wykonaj OCR, a następnie
+    przygotuj podsumowanie faktów zgodnie z SYSTEM_PROMPT_FAKTY
+    i DEFINICJA_WYPADKU.
+
+    Przetwarzanie jest potokowe: każdy plik jest streszczany zaraz po
+    zakończeniu jego OCR (równolegle z OCR pozostałych plików), a na końcu
+    streszczenia są łączone jednym wywołaniem LLM. Czas odpowiedzi to więc
+    w przybliżeniu najwolniejszy OCR + streszczenie oraz jeden krok łączenia.
+
+    Zwraca uporządkowany tekst (nagłówki + streszczenie faktów).
+    """
+    documents = [data for data in pdf_files if data]
+    for data in documents:
+        if not _is_pdf(data):
+            raise ValueError("Non‑PDF data passed to summarize_accident_facts_from_pdfs")
+    if not documents:
+        return ""
+
+    summarize = registry.get("facts_summary")
+
+    def ocr_then_summarize(data: bytes) -> tuple[str, str]:
+        try:
+            text = _extract_text_from_pdf(data)
+            if summarize is None or not text.strip():
+                return text, text
+            return text, summarize.invoke({"facts_docs": text})
+        finally:
+            QUEUE_DEPTH.dec(queue="ocr_pipeline")
+
+    QUEUE_DEPTH.inc(len(documents), queue="ocr_pipeline")
+    workers = min(len(documents), OCR_PIPELINE_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Każde zadanie dostaje kopię kontekstu (sprawa/endpoint do ewidencji tokenów).
+        futures = [
+            pool.submit(contextvars.copy_context().run, ocr_then_summarize, data)
+            for data in documents
+        ]
+        # Zachowujemy kolejność plików – wyniki zbieramy po kolei, choć liczą się równolegle.
+        results = [future.result() for future in futures]
+
+    texts = [text for text, _ in results if text.strip()]
+    summaries = [summary for text, summary in results if text.strip()]
+    if not texts:
+        return ""
+
+    if summarize is None:
+        # Fallback: zwracamy sam tekst połączony bez przetwarzania LLM.
+        FALLBACKS.inc(component="facts_summary")
+        return "\n\n---\n\n".join(texts)
+
+    if len(summaries) == 1:
+        return summaries[0]
+    merge = registry.get("facts_summary_merge")
+    return merge.invoke({"summaries": "\n\n---\n\n".join(summaries)})
+
+
+def build_filled_card_text_from_summary(summary_text: str) -> str:
+    """
+    Bierze wzór karty wypadku (`load_card_template`, wczytany raz na proces),
+    przekazuje go wraz ze streszczeniem faktów do LLM i prosi o uzupełnienie
+    TYLKO kropek tam, gdzie odpowiedź jednoznacznie wynika ze streszczenia.
+
+    Zwraca kompletny tekst karty w formacie Markdown.
+    """
+    template_text = load_card_template()
+
+    chain = registry.get("accident_card_fill")
+    if chain is None or not summary_text.strip():
+        # Bez LLM – zwracamy sam szablon, nic nie zmieniamy.
+        return template_text
 
-    chain = prompt | llm | StrOutputParser()
     try:
-        filled_text = chain.invoke(
-            {
-                "summary": summary_text,
-                "template": template_text,
-            }
-        )
+        filled_text = chain.invoke({"summary": summary_text})
     except Exception:
         # W razie problemów z LLM – oddaj niezmieniony szablon.
+        FALLBACKS.inc(component="accident_card_fill")
         return template_text
 
     return filled_text
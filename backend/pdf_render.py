@@ -0,0 +1,153 @@
+"""
+Warstwa renderowania PDF (fpdf2) z czcionką Unicode.
+
+Czcionka DejaVu Sans (regular + bold) jest parsowana raz na proces: najpierw
+przycinamy ją do używanych zakresów Unicode (łacina z polskimi znakami, greka,
+cyrylica, interpunkcja, strzałki, ramki), potem metryki, mapy znaków i deskryptor
+trzymamy w prototypie `TTFFont`. Każdy dokument dostaje lekką kopię prototypu
+z własnym stanem podzbioru i deskryptorem (fpdf2 osadza w PDF tylko użyte glify,
+a przy zapisie modyfikuje obiekt fontTools i nadaje deskryptorowi numer obiektu
+dokumentu, więc żadnego z nich nie można współdzielić między wątkami). Czcionka jest
+dołączana do dokumentu dopiero przy pierwszym `set_font`. Gdy plików czcionki
+nie ma, wracamy do wbudowanego Ariala i transliteracji polskich znaków.
+"""
+
+from __future__ import annotations
+
+import copy
+import io
+import os
+from functools import lru_cache
+from typing import Optional
+
+from fontTools import subset as ftsubset
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap, TTFFont
+
+FONT_DIR = os.getenv("ZANT_PDF_FONT_DIR", "/usr/share/fonts/truetype/dejavu")
+# ZANT_PDF_UNICODE=0 wymusza stary tryb (Arial + transliteracja).
+UNICODE_ENABLED = os.getenv("ZANT_PDF_UNICODE", "1") != "0"
+FONT_FILES: dict[str, str] = {
+    "": "DejaVuSans.ttf",
+    "B": "DejaVuSans-Bold.ttf",
+}
+UNICODE_FAMILY = "DejaVu"
+FALLBACK_FAMILY = "Arial"
+
+# Zakresy znaków zachowywane w czcionce (reszta glifów jest odrzucana przy wczytaniu).
+UNICODE_RANGES: tuple[tuple[int, int], ...] = (
+    (0x0020, 0x007E),  # ASCII
+    (0x00A0, 0x024F),  # Latin-1, Latin Extended-A/B (polskie znaki)
+    (0x0370, 0x04FF),  # greka, cyrylica
+    (0x2000, 0x206F),  # interpunkcja („”, –, …)
+    (0x20A0, 0x20CF),  # symbole walut
+    (0x2100, 0x214F),  # symbole literopodobne (№, ™)
+    (0x2190, 0x22FF),  # strzałki, operatory
+    (0x2500, 0x25FF),  # ramki, kształty (•, ■, □)
+    (0x2610, 0x2612),  # pola wyboru
+    (0x2713, 0x2714),  # znaczniki ✓
+)
+
+
+def remove_polish_chars(text: str) -> str:
+    """
+    Zamienia polskie znaki i inne znaki specjalne na odpowiedniki ASCII/Latin-1,
+    aby uniknąć błędów FPDF przy braku czcionki Unicode.
+    """
+    replacements = {
+        'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
+        'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z',
+        '„': '"', '”': '"', '–': '-', '—': '-', '’': "'", '…': '...'
+    }
+    # 1. Znane zamienniki
+    text = "".join(replacements.get(c, c) for c in text)
+
+    # 2. Usuń wszystko co nie jest latin-1 (zamień na ?)
+    # FPDF (standard fonts) obsługuje latin-1.
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+class _FontPrototype:
+    """Czcionka sparsowana raz; `instantiate` tworzy kopię dla jednego dokumentu."""
+
+    def __init__(self, path: str, style: str) -> None:
+        self.data = _subset_font_file(path)
+        self.font = TTFFont(FPDF(), io.BytesIO(self.data), f"{UNICODE_FAMILY.lower()}{style}", style)
+
+    def instantiate(self, pdf: FPDF) -> TTFFont:
+        font = copy.copy(self.font)
+        font.i = len(pdf.fonts) + 1
+        # Świeży (leniwy) obiekt fontTools – podzbiór przy zapisie go modyfikuje.
+        font.ttfont = ttLib.TTFont(io.BytesIO(self.data), recalcTimestamp=False, lazy=True)
+        font.cw = copy.copy(self.font.cw)
+        # output() zapisuje w deskryptorze numer obiektu i nazwę podzbioru tego dokumentu.
+        font.desc = copy.deepcopy(self.font.desc)
+        font.missing_glyphs = []
+        font.biggest_size_pt = 0
+        font._hbfont = None
+        font.subset = SubsetMap(font)
+        return font
+
+
+def _subset_font_file(path: str) -> bytes:
+    """Przycina czcionkę do UNICODE_RANGES – mniejsze tabele to szybszy podzbiór przy zapisie PDF."""
+    font = ttLib.TTFont(path, recalcTimestamp=False)
+    options = ftsubset.Options()
+    options.notdef_outline = True
+    options.glyph_names = True  # fpdf2 buduje podzbiór po nazwach glifów
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    options.drop_tables += ["FFTM"]
+    subsetter = ftsubset.Subsetter(options)
+    subsetter.populate(unicodes=[c for start, end in UNICODE_RANGES for c in range(start, end + 1)])
+    subsetter.subset(font)
+    out = io.BytesIO()
+    font.save(out)
+    return out.getvalue()
+
+
+@lru_cache(maxsize=None)
+def _font_prototype(path: str, style: str) -> _FontPrototype:
+    return _FontPrototype(path, style)
+
+
+def unicode_fonts_available() -> bool:
+    return UNICODE_ENABLED and all(os.path.isfile(os.path.join(FONT_DIR, name)) for name in FONT_FILES.values())
+
+
+def warm_up_fonts() -> bool:
+    """Parsuje czcionki przy starcie aplikacji; zwraca False, jeśli ich nie ma."""
+    if not unicode_fonts_available():
+        return False
+    for style, name in FONT_FILES.items():
+        _font_prototype(os.path.join(FONT_DIR, name), style)
+    return True
+
+
+class PDF(FPDF):
+    def __init__(self, *args, unicode: Optional[bool] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.unicode = unicode_fonts_available() if unicode is None else unicode
+        self.font_family_name = UNICODE_FAMILY if self.unicode else FALLBACK_FAMILY
+
+    def set_font(self, family=None, style="", size=0):
+        # Czcionkę Unicode dołączamy przy pierwszym użyciu danego stylu –
+        # każda dołączona czcionka jest potem podzbiorowana i osadzana.
+        if self.unicode and family and family.lower() == UNICODE_FAMILY.lower() and isinstance(style, str):
+            font_style = "".join(c for c in "BI" if c in style.upper())
+            fontkey = f"{UNICODE_FAMILY.lower()}{font_style}"
+            if fontkey not in self.fonts and font_style in FONT_FILES:
+                prototype = _font_prototype(os.path.join(FONT_DIR, FONT_FILES[font_style]), font_style)
+                self.fonts[fontkey] = prototype.instantiate(self)
+        super().set_font(family, style, size)
+
+    def txt(self, text: str) -> str:
+        """Tekst gotowy do wypisania aktualną czcionką (bez transliteracji przy Unicode)."""
+        return text if self.unicode else remove_polish_chars(text)
+
+    def header(self):
+        # Prosty nagłówek PDF
+        self.set_font(self.font_family_name, 'B', 12)
+        self.cell(0, 10, self.txt('Dokument wygenerowany przez asystenta ZANT'), 0, 1, 'C')
+        self.ln(10)
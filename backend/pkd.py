@@ -0,0 +1,304 @@
+"""
+Klasyfikacja PKD: słownik kodów i wyszukiwarka do podpowiedzi.
+
+Katalog (`data/pkd.json`, ta sama lista co we froncie: `[{"code", "desc"}]`)
+wczytujemy raz na proces do:
+
+- mapy kod -> pozycja (walidacja: kod w poprawnym formacie, ale spoza klasyfikacji),
+- posortowanej listy kodów bez kropek (zapytanie "620", "62.01" -> prefiks kodu + bisekcja),
+- posortowanej listy słów opisów z listami pozycji (prefiks słowa + bisekcja),
+- indeksu trigramów opisów (zapasowo: literówki, fragmenty ze środka słowa),
+- rankera BM25 po rdzeniach słów opisów (`suggest_pkd`: propozycje kodu
+  z wolnego opisu działalności, bez wywołania LLM).
+
+Opisy i zapytania porównujemy po zdjęciu polskich znaków i wielkości liter
+("łodz" == "Łódź"). Zapytanie to pojedyncze przejście po kilkuset pozycjach –
+poniżej milisekundy, więc endpoint nie potrzebuje osobnej puli wątków.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+PKD_CATALOG_PATH = os.getenv(
+    "ZANT_PKD_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pkd.json")
+)
+PKD_SEARCH_LIMIT = 10
+PKD_SEARCH_MAX_LIMIT = 50
+PKD_SUGGESTION_LIMIT = 3
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Propozycje słabsze niż ten ułamek najlepszej pomijamy (szum ze wspólnych słów).
+SUGGESTION_RELATIVE_CUTOFF = 0.5
+# Propozycje w ogóle tylko przy pewnym trafieniu: najlepszy wynik co najmniej taki
+# i wyraźnie (tyle razy) lepszy od drugiego. Poniżej tego BM25 trafia zwykle jednym
+# pobocznym słowem ("programowanie aplikacji" -> nadawanie programów), więc nie
+# podpowiadamy nic. Wartości dobrane na przykładowych opisach (`python bench.py pkd`).
+SUGGESTION_MIN_SCORE = 5.5
+SUGGESTION_MIN_MARGIN = 1.25
+
+_CODE_QUERY = re.compile(r"^\d{1,2}(?:\.?\d{1,2}(?:\.?[a-z])?)?\.?$")
+_WORD = re.compile(r"\w+")
+# Litery, których NFKD nie rozkłada na literę bazową + znak diakrytyczny.
+_FOLD_EXTRA = str.maketrans({"ł": "l", "Ł": "l"})
+
+# Lekki stemmer: odcinamy najdłuższą pasującą końcówkę fleksyjną/słowotwórczą
+# (po zdjęciu polskich znaków), zostawiając co najmniej MIN_STEM liter.
+# "instalacji", "instalacyjnych" -> "instalac"; "elektryczne" -> "elektryczn".
+MIN_STEM = 4
+_SUFFIXES = sorted(
+    (
+        "owaniami", "owaniem", "owania", "owanie", "yjnych", "yjnego", "yjnej", "yjne", "yjna", "yjny",
+        "stwami", "stwie", "stwem", "stwo", "stwa", "skich", "skie", "skiej", "ska", "ski",
+        "owymi", "owych", "owego", "owym", "iami", "owo", "ami", "ach", "ych", "ich", "ymi", "imi", "ego", "emu", "owi", "owy", "owa", "owe", "owej",
+        "cji", "cja", "cje", "cje", "cjom", "iem", "em", "om", "ow", "ie", "ia", "iu", "ej", "ym", "im",
+        "a", "e", "i", "o", "u", "y",
+    ),
+    key=len,
+    reverse=True,
+)
+# Słowa bez znaczenia dla rodzaju działalności (także typowe zwroty z opisów PKD).
+_STOPWORDS = frozenset({
+    "a", "ale", "albo", "co", "czy", "dla", "do", "i", "jak", "jako", "jest", "jestem", "lub", "ma", "mam",
+    "mnie", "moja", "moj", "moje", "na", "nie", "o", "od", "oraz", "po", "pod", "przez", "przy", "sie", "ta",
+    "tak", "to", "u", "w", "we", "z", "za", "ze", "zajmuje", "prowadze", "firma", "firme", "firmie", "firmy", "dzialalnosc",
+    "dzialalnosci", "gospodarcza", "zwiazana", "zwiazane", "pozostala", "pozostale", "pozostalych",
+    "gdzie", "indziej", "niesklasyfikowana", "wlaczajac", "wylaczeniem", "zakresie",
+})
+# Zawody z opisów użytkowników -> słowa z opisów PKD (rozszerzenie zapytania).
+_ALIASES: dict[str, str] = {
+    "programist": "oprogramowaniem",
+    "informatyk": "oprogramowaniem informatyki",
+    "elektryk": "instalacji elektrycznych",
+    "hydraulik": "instalacji wodno-kanalizacyjnych",
+    "kierowc": "transport drogowy",
+    "przewoz": "transport drogowy",
+    "taxi": "taksowek",
+    "taksowkarz": "taksowek",
+    "fryzjer": "fryzjerstwo",
+    "kosmetyczk": "kosmetyczne",
+    "ksiegow": "rachunkowo-ksiegowa",
+    "murarz": "murarskie",
+    "tynkarz": "tynkarskie",
+    "malarz": "malarskie",
+    "stolarz": "stolarki budowlanej",
+    "dekarz": "konstrukcji pokryc dachowych",
+    "mechanik": "konserwacja naprawa pojazdow samochodowych",
+    "warsztat": "konserwacja naprawa",
+    "remont": "robot budowlanych wykonczeniowych",
+    "internetow": "sprzedaz wysylkowej internet",
+    "sklep": "sprzedaz detaliczna",
+}
+
+
+def fold(text: str) -> str:
+    """Małe litery bez polskich znaków: "Łódź" -> "lodz"."""
+    decomposed = unicodedata.normalize("NFKD", text.translate(_FOLD_EXTRA))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _compact(code: str) -> str:
+    return code.replace(".", "").replace(" ", "").upper()
+
+
+def normalize_code(value: str) -> Optional[str]:
+    """"6201z", "62.01.Z", "62 01 Z" -> "62.01.Z" (None, jeśli to nie kod PKD)."""
+    compact = _compact(value.strip())
+    if len(compact) != 5 or not compact[:4].isdigit() or not compact[4].isalpha():
+        return None
+    return f"{compact[0:2]}.{compact[2:4]}.{compact[4]}"
+
+
+def stem(word: str) -> str:
+    """Rdzeń złożonego (fold) słowa."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text: str, expand: bool = False) -> list[str]:
+    """Rdzenie słów tekstu bez słów nieistotnych; `expand` dokłada słowa PKD dla nazw zawodów."""
+    result: list[str] = []
+    for word in _WORD.findall(fold(text)):
+        if word in _STOPWORDS or len(word) < 2 or word.isdigit():
+            continue
+        root = stem(word)
+        result.append(root)
+        if not expand:
+            continue
+        for alias, expansion in _ALIASES.items():
+            if root.startswith(alias):
+                result.extend(stem(w) for w in _WORD.findall(fold(expansion)))
+    return result
+
+
+def _trigrams(word: str) -> set[str]:
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+@dataclass(frozen=True)
+class PkdEntry:
+    code: str
+    desc: str
+
+    def as_dict(self) -> dict[str, str]:
+        return {"code": self.code, "desc": self.desc}
+
+
+class PkdIndex:
+    def __init__(self, entries: list[PkdEntry]) -> None:
+        self.entries = sorted({e.code: e for e in entries}.values(), key=lambda e: e.code)
+        self._by_code = {e.code: e for e in self.entries}
+        self._compact_codes = [_compact(e.code) for e in self.entries]
+        self._folded = [fold(e.desc) for e in self.entries]
+
+        postings: dict[str, list[int]] = {}
+        trigrams: dict[str, list[int]] = {}
+        for i, text in enumerate(self._folded):
+            words = set(_WORD.findall(text))
+            for word in words:
+                postings.setdefault(word, []).append(i)
+            for gram in set().union(*(_trigrams(w) for w in words)) if words else ():
+                trigrams.setdefault(gram, []).append(i)
+        self._words = sorted(postings)
+        self._postings = [tuple(postings[w]) for w in self._words]
+        self._trigrams = {gram: tuple(ids) for gram, ids in trigrams.items()}
+
+        # BM25: listy (pozycja, częstość) dla rdzeni i wstępnie policzone IDF.
+        term_postings: dict[str, list[tuple[int, int]]] = {}
+        self._doc_lengths: list[int] = []
+        for i, entry in enumerate(self.entries):
+            counts = Counter(terms(entry.desc))
+            self._doc_lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_postings.setdefault(term, []).append((i, count))
+        total = len(self.entries)
+        self._avg_length = (sum(self._doc_lengths) / total) if total else 0.0
+        self._term_postings = {t: tuple(p) for t, p in term_postings.items()}
+        self._idf = {
+            t: math.log(1 + (total - len(p) + 0.5) / (len(p) + 0.5)) for t, p in term_postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, code: str) -> Optional[PkdEntry]:
+        normalized = normalize_code(code)
+        return self._by_code.get(normalized) if normalized else None
+
+    def search(self, query: str, limit: int = PKD_SEARCH_LIMIT) -> list[PkdEntry]:
+        """
+        Podpowiedzi dla zapytania: prefiks kodu ("62.0") albo słowa opisu
+        ("oprogr kompu"); gdy prefiksy nic nie dają – podobieństwo trigramów.
+        """
+        folded = " ".join(fold(query).split())
+        if not folded or limit <= 0:
+            return []
+        if _CODE_QUERY.match(folded):
+            return self._search_code(_compact(folded), limit)
+
+        tokens = _WORD.findall(folded)
+        ids = self._prefix_matches(tokens)
+        if not ids:
+            return self._search_trigrams(tokens, limit)
+
+        def rank(i: int) -> tuple:
+            text = self._folded[i]
+            # Opis zaczynający się od zapytania, potem wcześniejsze trafienie, potem krótszy opis.
+            return (not text.startswith(folded), text.find(tokens[0]), len(text), i)
+
+        return [self.entries[i] for i in sorted(ids, key=rank)[:limit]]
+
+    def _search_code(self, prefix: str, limit: int) -> list[PkdEntry]:
+        start = bisect_left(self._compact_codes, prefix)
+        found: list[PkdEntry] = []
+        for i in range(start, len(self._compact_codes)):
+            if not self._compact_codes[i].startswith(prefix) or len(found) >= limit:
+                break
+            found.append(self.entries[i])
+        return found
+
+    def _prefix_matches(self, tokens: list[str]) -> set[int]:
+        result: Optional[set[int]] = None
+        for token in tokens:
+            ids: set[int] = set()
+            i = bisect_left(self._words, token)
+            while i < len(self._words) and self._words[i].startswith(token):
+                ids.update(self._postings[i])
+                i += 1
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def _search_trigrams(self, tokens: list[str], limit: int) -> list[PkdEntry]:
+        grams = set().union(*(_trigrams(t) for t in tokens)) if tokens else set()
+        if not grams:
+            return []
+        hits: dict[int, int] = {}
+        for gram in grams:
+            for i in self._trigrams.get(gram, ()):
+                hits[i] = hits.get(i, 0) + 1
+        # Co najmniej połowa trigramów zapytania, żeby nie podpowiadać szumu.
+        threshold = max(1, (len(grams) + 1) // 2)
+        ranked = sorted((i for i, n in hits.items() if n >= threshold), key=lambda i: (-hits[i], len(self._folded[i]), i))
+        return [self.entries[i] for i in ranked[:limit]]
+
+    def suggest(self, description: str, limit: int = PKD_SUGGESTION_LIMIT) -> list[tuple[PkdEntry, float]]:
+        """
+        Kody najlepiej pasujące do opisu działalności (BM25), z wynikiem; najlepszy pierwszy.
+        Pusta lista, gdy najlepszy wynik jest za słaby albo nie odstaje od drugiego.
+        """
+        scores: dict[int, float] = {}
+        for term in set(terms(description, expand=True)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, count in self._term_postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[i] / self._avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+        if not scores:
+            return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:max(limit, 2)]
+        best = ranked[0][1]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best < SUGGESTION_MIN_SCORE or best < runner_up * SUGGESTION_MIN_MARGIN:
+            return []
+        return [
+            (self.entries[i], round(score, 3)) for i, score in ranked[:limit] if score >= best * SUGGESTION_RELATIVE_CUTOFF
+        ]
+
+    @classmethod
+    def from_json(cls, text: str) -> "PkdIndex":
+        return cls([
+            PkdEntry(code, str(item.get("desc", "")).strip())
+            for item in json.loads(text)
+            if (code := normalize_code(str(item.get("code", ""))))
+        ])
+
+
+@lru_cache(maxsize=None)
+def pkd_index() -> PkdIndex:
+    """Indeks wczytywany raz na proces; brak pliku = pusty indeks (sprawdzamy wtedy tylko format)."""
+    try:
+        with open(PKD_CATALOG_PATH, "r", encoding="utf-8") as f:
+            return PkdIndex.from_json(f.read())
+    except OSError:
+        return PkdIndex([])
+
+
+@lru_cache(maxsize=256)
+def suggest_pkd(description: str, limit: int = PKD_SUGGESTION_LIMIT) -> tuple[tuple[PkdEntry, float], ...]:
+    """Propozycje kodu PKD dla opisu działalności (ten sam opis wraca w kolejnych turach rozmowy)."""
+    return tuple(pkd_index().suggest(description, limit))
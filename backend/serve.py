@@ -0,0 +1,162 @@
+"""
+Tryb wieloprocesowy: workery uvicorn tworzone przez fork() na wspólnym gnieździe.
+
+    python serve.py --host 0.0.0.0 --port 8000              # workerów tyle, ile rdzeni
+    python serve.py --workers 4 --cache-db /data/zant.sqlite3
+    ZANT_WORKERS=1 python serve.py                           # jeden proces (jak `uvicorn main:app`)
+
+Proces główny importuje aplikację i przed fork() ładuje zasoby tylko do odczytu:
+prompty łańcuchów (bez klientów LLM), szablony EWYP/DOCX, indeksy kodów
+pocztowych i PKD, czcionki PDF. Workery dostają je przez kopię przy zapisie
+(`gc.freeze()` – GC nie dotyka odziedziczonych obiektów, więc strony pamięci
+zostają wspólne). Klienci LLM i połączenia SQLite powstają już w workerach.
+
+Zmienne pamięci podręczne (odpowiedzi LLM, OCR, plany działań) trafiają do
+wspólnego pliku SQLite (`shared_cache.py`). Bez ZANT_CACHE_DB plik powstaje
+w prywatnym katalogu tymczasowym (0700, losowa nazwa) i jest usuwany razem
+z nim przy zamknięciu serwera – dane osobowe z promptów nie przeżywają procesu.
+Przez ten sam plik workery dzielą paczki ZIP, ewidencję tokenów i metryki
+(`worker_metrics.py`), więc `/metrics` i `/api/admin/usage` w dowolnym workerze
+pokazują sumy całego serwera. Worker, który padnie, jest uruchamiany ponownie.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+RESPAWN_DELAY_S = 1.0
+
+
+def default_workers() -> int:
+    """Liczba rdzeni dostępnych dla procesu (z uwzględnieniem cpuset kontenera)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backend ZANT w trybie wieloprocesowym (pre-fork)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("ZANT_WORKERS", "0")) or default_workers())
+    parser.add_argument("--cache-db", default=os.getenv("ZANT_CACHE_DB"),
+                        help="plik SQLite pamięci współdzielonej ('' = wyłączona)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, lifespan="on", log_level=log_level))
+    server.run(sockets=[sock])
+
+
+def preload(app_module) -> None:
+    """Zasoby tylko do odczytu ładowane raz, przed fork()."""
+    from warmup import WarmUp
+
+    prefork = WarmUp()
+    prefork.run(app_module.PREFORK_WARMUP_STEPS)
+    steps = ", ".join(f"{step.name} {step.seconds:.2f}s" for step in prefork.steps)
+    print(f"Zasoby załadowane przed fork(): {steps}")
+    gc.collect()
+    gc.freeze()
+
+
+def serve_forked(app, sock: socket.socket, workers: int, log_level: str) -> None:
+    children: dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(app, sock, log_level)
+            except BaseException as e:
+                print(f"Worker {index} zakończony błędem: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    print(f"Uruchomiono {workers} workerów (PID {', '.join(map(str, children))}).")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"Worker {pid} zakończył się (status {status}) – uruchamiam ponownie.")
+            time.sleep(RESPAWN_DELAY_S)
+            spawn(index)
+
+
+def main_cli() -> None:
+    args = parse_args()
+    cache_dir = None
+    if args.cache_db is None and args.workers > 1:
+        # mkdtemp: katalog 0700 o nieprzewidywalnej nazwie, dostępny tylko dla właściciela.
+        cache_dir = tempfile.mkdtemp(prefix="zant-cache-")
+        args.cache_db = os.path.join(cache_dir, "cache.sqlite3")
+    if args.cache_db is not None:
+        os.environ["ZANT_CACHE_DB"] = args.cache_db  # przed importem aplikacji (stałe modułów)
+    if args.workers > 1 and not args.cache_db:
+        print("Uwaga: pamięć współdzielona wyłączona – metryki, ewidencja tokenów i paczki ZIP "
+              "będą osobne w każdym workerze.")
+    # Migawki metryk workerów tego serwera (po restarcie nie doliczamy poprzedniego).
+    os.environ["ZANT_METRICS_GENERATION"] = f"{os.getpid()}-{time.time_ns()}"
+
+    try:
+        import main as app_module
+
+        sock = bind_socket(args.host, args.port, args.backlog)
+        if args.workers <= 1:
+            run_worker(app_module.app, sock, args.log_level)
+            return
+        preload(app_module)
+        serve_forked(app_module.app, sock, args.workers, args.log_level)
+    finally:
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,197 @@
+"""
+Pamięć podręczna współdzielona przez procesy robocze (plik SQLite).
+
+W trybie wieloprocesowym (`serve.py`) każdy worker ma własną pamięć – wyniki
+drogich operacji trzymane w słownikach procesu nie byłyby widoczne w pozostałych,
+a odsetek trafień dzieliłby się przez liczbę workerów. Tu trzymamy:
+
+- odpowiedzi LLM (`llm_provider.SharedLLMCache`, przestrzeń "llm"),
+- tekst z OCR dokumentu (przestrzeń "ocr", klucz = skrót bajtów pliku),
+- plany działań (przestrzeń "action_plan", także znacznik "liczony" – inny
+  worker nie uruchamia wtedy LLM drugi raz),
+- paczki ZIP (`bundle_cache.py`, przestrzeń "bundle", wartości binarne),
+- wywołania LLM z ewidencji tokenów (`usage.py`, przestrzeń "usage"),
+- migawki metryk workerów (`worker_metrics.py`, przestrzeń "metrics").
+
+Plik wskazuje ZANT_CACHE_DB (pusta wartość = wyłączone; `serve.py` bez tej
+zmiennej używa pliku w prywatnym katalogu tymczasowym, usuwanym przy zamknięciu).
+Baza działa w trybie WAL: odczyty nie blokują zapisu, a zapisy z wielu procesów
+są szeregowane przez SQLite. Błąd bazy nigdy nie przerywa żądania – traktujemy
+go jak brak wpisu.
+
+Wpisy zawierają dane osobowe z promptów i odpowiedzi (imiona, nazwiska, PESEL,
+adresy), dlatego plik jest tworzony z prawami 0600 (pliki -wal/-shm SQLite
+dziedziczą je po bazie). Wpis jest usuwany po ZANT_CACHE_TTL sekundach
+(domyślnie 7 dni) przy sprzątaniu co PRUNE_EVERY zapisów; powyżej
+ZANT_CACHE_MAX_ENTRIES usuwamy najstarsze. Wpis przeterminowany, ale jeszcze
+nieusunięty, nie jest już zwracany.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Optional
+
+from metrics import SHARED_CACHE
+
+CACHE_DB_PATH = os.getenv("ZANT_CACHE_DB", "")
+CACHE_TTL_S = float(os.getenv("ZANT_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("ZANT_CACHE_MAX_ENTRIES", "50000"))
+# Co ile zapisów (w danym procesie) sprzątamy wpisy przeterminowane i nadmiarowe.
+PRUNE_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at);
+"""
+
+
+class SharedCache:
+    def __init__(self, path: str, ttl: float = CACHE_TTL_S, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Połączenie na wątek i proces – połączenia SQLite nie mogą przejść przez fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            _create_private(self.path)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[str | bytes]:
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd odczytu ({namespace}): {e}")
+            row = None
+        SHARED_CACHE.inc(cache=namespace, result="hit" if row else "miss")
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: str | bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, now, now + (self.ttl if ttl is None else ttl)),
+            )
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd zapisu ({namespace}): {e}")
+            return
+        self._after_write()
+
+    def add(self, namespace: str, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Zapis tylko wtedy, gdy ważnego wpisu jeszcze nie ma (np. „ten worker liczy plan”)."""
+        now = time.time()
+        try:
+            cursor = self._connection().execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, "
+                "created_at = excluded.created_at, expires_at = excluded.expires_at "
+                "WHERE entries.expires_at <= ?",
+                (namespace, key, value, now, now + (self.ttl if ttl is None else ttl), now),
+            )
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd zapisu ({namespace}): {e}")
+            return False
+        self._after_write()
+        return cursor.rowcount > 0
+
+    def delete(self, namespace: str, key: str) -> None:
+        try:
+            self._connection().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd usuwania ({namespace}): {e}")
+
+    def items(self, namespace: str) -> list[tuple[str, str | bytes]]:
+        """Ważne wpisy przestrzeni (klucz, wartość) w kolejności zapisu."""
+        try:
+            return self._connection().execute(
+                "SELECT key, value FROM entries WHERE namespace = ? AND expires_at > ? ORDER BY created_at",
+                (namespace, time.time()),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd odczytu ({namespace}): {e}")
+            return []
+
+    def trim(self, namespace: str, max_entries: int) -> None:
+        """Zostawia w przestrzeni `max_entries` najnowszych wpisów (np. duże paczki ZIP)."""
+        try:
+            self._connection().execute(
+                "DELETE FROM entries WHERE namespace = ? AND created_at <= ("
+                "SELECT created_at FROM entries WHERE namespace = ? ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                (namespace, namespace, max_entries),
+            )
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd sprzątania ({namespace}): {e}")
+
+    def get_json(self, namespace: str, key: str) -> Any:
+        value = self.get(namespace, key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(namespace, key, json.dumps(value, ensure_ascii=False), ttl)
+
+    def _after_write(self) -> None:
+        with self._lock:
+            self._writes += 1
+            if self._writes % PRUNE_EVERY:
+                return
+        self.prune()
+
+    def prune(self) -> None:
+        """Usuwa wpisy przeterminowane i najstarsze ponad limit."""
+        try:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM entries WHERE created_at <= ("
+                "SELECT created_at FROM entries ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        except sqlite3.Error as e:
+            print(f"Pamięć współdzielona: błąd sprzątania: {e}")
+
+    def stats(self) -> dict[str, int]:
+        """Liczba ważnych wpisów per przestrzeń."""
+        rows = self._connection().execute(
+            "SELECT namespace, COUNT(*) FROM entries WHERE expires_at > ? GROUP BY namespace", (time.time(),)
+        ).fetchall()
+        return dict(rows)
+
+
+def _create_private(path: str) -> None:
+    """Tworzy pusty plik bazy z prawami 0600 (istniejący zostawia bez zmian)."""
+    try:
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600))
+    except FileExistsError:
+        pass
+
+
+@lru_cache(maxsize=None)
+def shared_cache() -> Optional[SharedCache]:
+    """Pamięć współdzielona procesu albo None, jeśli ZANT_CACHE_DB nie jest ustawione."""
+    return SharedCache(CACHE_DB_PATH) if CACHE_DB_PATH else None
@@ -0,0 +1,124 @@
+# templates/build_templates.py
+"""
+Generuje szablony DOCX używane przez `docx_templates.py`.
+
+Układ odpowiada dawnym builderom python-docx z main.py; zamiast danych
+w tekście są pola `{{nazwa}}`, a części opcjonalne i powtarzane są ujęte
+w akapity-znaczniki `{{#sekcja}}` ... `{{/sekcja}}`. Po zmianie układu:
+
+    python templates/build_templates.py
+
+i zatwierdź wygenerowane pliki .docx (wersja szablonu wchodzi do klucza
+pamięci podręcznej paczek, więc stare paczki same się unieważnią).
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable
+
+from docx import Document as DocxDocument
+from docx.document import Document
+from docx.oxml.ns import qn
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _preserve_placeholders(doc: Document) -> None:
+    """Pola mogą dostać wartości ze spacjami na brzegach – ustawiamy xml:space="preserve"."""
+    for t in doc.element.body.iter(qn("w:t")):
+        if t.text and "{{" in t.text:
+            t.set(qn("xml:space"), "preserve")
+
+
+def notification_template() -> Document:
+    doc = DocxDocument()
+
+    doc.add_heading('ZAWIADOMIENIE O WYPADKU', 0)
+    doc.add_heading('przy prowadzeniu działalności gospodarczej', 1)
+
+    # Sekcja 1: Poszkodowany
+    doc.add_heading('1. Dane poszkodowanego (Zgłaszającego)', level=2)
+    p = doc.add_paragraph()
+    p.add_run("Imię i nazwisko: ").bold = True
+    p.add_run("{{first_name}} {{last_name}}\n")
+    p.add_run("PESEL: ").bold = True
+    p.add_run("{{pesel}}\n")
+    p.add_run("Adres zamieszkania: ").bold = True
+    p.add_run("{{address_home}}")
+
+    # Sekcja 2: Płatnik składek
+    doc.add_heading('2. Dane płatnika składek (Działalność)', level=2)
+    p = doc.add_paragraph()
+    p.add_run("Nazwa/Opis: ").bold = True
+    p.add_run("{{business_description}}\n")
+    p.add_run("NIP: ").bold = True
+    p.add_run("{{nip}}   ")
+    p.add_run("REGON: ").bold = True
+    p.add_run("{{regon}}\n")
+    p.add_run("Adres działalności: ").bold = True
+    p.add_run("{{business_address}}")
+
+    # Sekcja 3: Informacje o wypadku
+    doc.add_heading('3. Informacje o wypadku', level=2)
+    p = doc.add_paragraph()
+    p.add_run("Data i godzina: ").bold = True
+    p.add_run("{{accident_date}}, godz. {{accident_time}}\n")
+    p.add_run("Miejsce wypadku: ").bold = True
+    p.add_run("{{accident_place}}\n")
+    p.add_run("Rodzaj urazu: ").bold = True
+    p.add_run("{{injury_type}}")
+
+    doc.add_heading('Okoliczności i przyczyny wypadku:', level=3)
+    doc.add_paragraph("{{accident_description}}")
+
+    # Sekcja 4: Świadkowie
+    doc.add_paragraph("{{#has_witnesses}}")
+    doc.add_heading('4. Świadkowie', level=2)
+    doc.add_paragraph("{{/has_witnesses}}")
+    doc.add_paragraph("{{#witnesses}}")
+    doc.add_paragraph("{{index}}. {{first_name}} {{last_name}}, adres: {{address}}")
+    doc.add_paragraph("{{/witnesses}}")
+
+    doc.add_paragraph("\n\n......................................................\n(podpis zgłaszającego)")
+    return doc
+
+
+def explanation_template() -> Document:
+    doc = DocxDocument()
+    doc.add_heading('ZAPIS WYJAŚNIEŃ POSZKODOWANEGO', 0)
+
+    p = doc.add_paragraph()
+    p.add_run("Ja, niżej podpisany/a: ").bold = True
+    p.add_run("{{first_name}} {{last_name}}\n")
+
+    doc.add_heading('Treść wyjaśnień:', level=2)
+    doc.add_paragraph("{{accident_description}}")
+
+    doc.add_paragraph("{{#equipment_info}}")
+    doc.add_heading('Informacje dodatkowe (maszyny, BHP):', level=3)
+    doc.add_paragraph("{{equipment_info}}")
+    doc.add_paragraph("{{/equipment_info}}")
+
+    doc.add_paragraph("\n\nOświadczam, że powyższe wyjaśnienia są zgodne z prawdą.")
+    doc.add_paragraph("\n......................................................\n(data i podpis)")
+    return doc
+
+
+TEMPLATES: dict[str, Callable[[], Document]] = {
+    "zawiadomienie.docx": notification_template,
+    "wyjasnienia.docx": explanation_template,
+}
+
+
+def main() -> None:
+    for name, build in TEMPLATES.items():
+        doc = build()
+        _preserve_placeholders(doc)
+        path = os.path.join(TEMPLATE_DIR, name)
+        doc.save(path)
+        print(f"Zapisano {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Magazyn planów działań: błędy LLM, ponowienie i publikacja w pamięci współdzielonej."""
+
+import pytest
+
+import action_plans
+from action_plans import STATUS_FAILED, STATUS_READY, ActionPlanStore
+from shared_cache import SharedCache
+
+
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    cache = SharedCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(action_plans, "shared_cache", lambda: cache)
+    return cache
+
+
+def test_failed_plan_is_retried_and_not_published(shared):
+    store = ActionPlanStore(workers=1)
+
+    def outage():
+        raise RuntimeError("503 UNAVAILABLE")
+
+    assert _wait_submit(store, "k", outage).status == STATUS_FAILED
+    assert shared.get(action_plans.SHARED_NAMESPACE, "k") is None
+
+    entry = _wait_submit(store, "k", lambda: [{"step": "zgłoś wypadek"}])
+    assert entry.status == STATUS_READY
+    assert shared.get_json(action_plans.SHARED_NAMESPACE, "k")["status"] == STATUS_READY
+
+
+def test_empty_plan_is_not_published(shared):
+    store = ActionPlanStore(workers=1)
+    assert _wait_submit(store, "pusty", lambda: []).status == STATUS_READY
+    assert shared.get(action_plans.SHARED_NAMESPACE, "pusty") is None
+
+
+def _wait_submit(store: ActionPlanStore, key: str, compute):
+    store.submit(key, compute)
+    # Pula ma jeden wątek: kolejne zadanie kończy się po obliczeniu i publikacji planu.
+    store._pool.submit(lambda: None).result()
+    return store.get(key)
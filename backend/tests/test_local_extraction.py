@@ -0,0 +1,50 @@
+"""Regułowa ekstrakcja odpowiedzi z danymi: co przypisujemy, a co zostawiamy LLM-owi."""
+
+from datetime import date
+
+import pytest
+
+from local_extraction import extract_answer
+
+TODAY = date(2024, 6, 1)
+
+
+@pytest.mark.parametrize(
+    ("message", "expected", "updates"),
+    [
+        ("80010112340", ["pesel"], {"pesel": "80010112340"}),
+        ("mój PESEL to 44051401359", ["first_name"], {"pesel": "44051401359"}),
+        ("123-456-32-18", ["nip"], {"nip": "1234563218"}),
+        ("12 marca 2024", ["accident_date"], {"accident_date": "2024-03-12"}),
+        ("wypadek 12.03.24 o 10:30", [], {"accident_date": "2024-03-12", "accident_time": "10:30"}),
+        (
+            "od 8:00 do 16:00",
+            ["planned_work_start", "planned_work_end"],
+            {"planned_work_start": "08:00", "planned_work_end": "16:00"},
+        ),
+        (
+            "ul. Długa 5/10, 00-950 Warszawa",
+            ["address_home"],
+            {"address_home": "ul. Długa 5/10, 00-950 Warszawa"},
+        ),
+        ("sam", ["reporter_type"], {"reporter_type": "victim"}),
+        ("jako pełnomocnik", ["reporter_type"], {"reporter_type": "proxy"}),
+    ],
+)
+def test_data_only_answers(message, expected, updates):
+    assert extract_answer(message, expected, TODAY) == updates
+
+
+@pytest.mark.parametrize(
+    ("message", "expected"),
+    [
+        ("samochodem", ["reporter_type"]),  # "sam" tylko jako całe słowo
+        ("Spadłem z drabiny 12 marca", ["accident_date"]),  # opis, nie same dane
+        ("nie podam", ["pesel"]),
+        ("12.03.2024 i 13.03.2024", ["accident_date"]),  # dwie daty – niejednoznaczne
+        ("31.02.2024", ["accident_date"]),  # nieistniejąca data
+        ("80010112340", ["nip"]),  # 11 cyfr to nie NIP, a o PESEL nikt nie pytał
+    ],
+)
+def test_everything_else_goes_to_llm(message, expected):
+    assert extract_answer(message, expected, TODAY) is None
@@ -0,0 +1,37 @@
+"""Stan łączony między workerami: migawki metryk i ewidencja tokenów w pamięci współdzielonej."""
+
+import json
+
+from metrics import MetricsRegistry
+from shared_cache import SharedCache
+from usage import UsageLedger, UsageRecord
+
+
+def _worker(requests: int, warmup: float) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "", ["endpoint"]).inc(requests, endpoint="/api/case/action-plan/{key}")
+    registry.gauge("in_flight", "").set(1)
+    registry.gauge("warmup_seconds", "", multiprocess="max").set(warmup)
+    return registry
+
+
+def test_render_merges_other_workers():
+    local = _worker(2, 0.5)
+    other = json.loads(json.dumps(_worker(3, 1.5).snapshot()))
+    text = local.render([other], [other])
+    assert 'requests_total{endpoint="/api/case/action-plan/{key}"} 5' in text
+    assert "in_flight 2" in text
+    assert "warmup_seconds 1.5" in text
+    # Zakończony worker: liczniki zostają, wskaźniki nie.
+    assert "in_flight 1" in local.render([other], [])
+
+
+def test_usage_summary_counts_all_workers(tmp_path):
+    shared = SharedCache(str(tmp_path / "cache.sqlite3"))
+    workers = [UsageLedger(shared=shared), UsageLedger(shared=shared)]
+    for i, ledger in enumerate(workers * 2):
+        ledger.record(UsageRecord(0.0, f"case-{i % 2}", "/api/assistant/message", "extraction", 10, 5))
+    summary = workers[0].summary()
+    assert summary["totals"]["calls"] == 4
+    assert summary["by_case"]["case-0"]["total_tokens"] == 30
+    assert workers[1].summary("case-1")["totals"]["calls"] == 2
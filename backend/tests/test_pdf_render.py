@@ -0,0 +1,33 @@
+"""Renderowanie PDF: prototyp czcionki współdzielony przez dokumenty z wielu wątków."""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pypdf import PdfReader
+
+import pdf_render
+from pdf_render import PDF
+
+
+def _render(index: int) -> bytes:
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font(pdf.font_family_name, "", 11)
+    # Różna liczba obiektów w dokumentach – numery obiektów czcionki się różnią.
+    for line in range(index % 7 + 1):
+        pdf.multi_cell(0, 6, pdf.txt(f"Zażółć gęślą jaźń {index}.{line}"), new_x="LMARGIN", new_y="NEXT")
+        if line % 2:
+            pdf.add_page()
+    pdf.set_font(pdf.font_family_name, "B", 11)
+    pdf.cell(0, 6, pdf.txt(f"Łódź {index}"))
+    return bytes(pdf.output())
+
+
+@pytest.mark.skipif(not pdf_render.unicode_fonts_available(), reason="brak czcionek DejaVu")
+def test_concurrent_renders_share_font_prototype():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outputs = list(pool.map(_render, range(64)))
+    for index, data in enumerate(outputs):
+        text = "".join(page.extract_text() for page in PdfReader(io.BytesIO(data)).pages)
+        assert f"Łódź {index}" in text
@@ -0,0 +1,34 @@
+"""Propozycje PKD z opisu działalności: tylko wyraźne trafienia."""
+
+import pytest
+
+from pkd import pkd_index
+
+pytestmark = pytest.mark.skipif(not len(pkd_index()), reason="brak katalogu data/pkd.json")
+
+
+@pytest.mark.parametrize(
+    ("description", "code"),
+    [
+        ("Prowadzę jednoosobową firmę, wykonuję instalacje elektryczne w domach i biurach.", "43.21.Z"),
+        ("transport drogowy towarów", "49.41.Z"),
+        ("doradztwo podatkowe", "69.20.Z"),
+        ("hydraulik", "43.22.Z"),
+    ],
+)
+def test_clear_match_is_suggested(description, code):
+    suggestions = pkd_index().suggest(description)
+    assert suggestions[0][0].code == code
+
+
+@pytest.mark.parametrize(
+    "description",
+    [
+        "programowanie aplikacji",  # trafia tylko "programów" z nadawania radiowego
+        "prowadzę firmę",
+        "sklep internetowy",  # kilka rodzajów sprzedaży detalicznej o podobnym wyniku
+        "handel",
+    ],
+)
+def test_weak_or_ambiguous_match_suggests_nothing(description):
+    assert pkd_index().suggest(description) == []
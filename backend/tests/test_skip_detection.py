@@ -0,0 +1,49 @@
+"""Wykrywanie odmowy w bieżącej turze: najwyżej jedno wywołanie LLM."""
+
+import os
+
+import pytest
+
+os.environ.setdefault("ZANT_LLM_PROVIDER", "fake")
+
+import main  # noqa: E402
+from main import CATEGORY_DEFS, ChatTurn, Mode  # noqa: E402
+
+_, CATEGORY_LABEL, CATEGORY_FIELDS = next(cat for cat in CATEGORY_DEFS if cat[0] == "business")
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    def fake_detect(label, answer):
+        calls.append((label, answer))
+        return False
+
+    monkeypatch.setattr(main, "detect_skip_with_llm", fake_detect)
+    return calls
+
+
+def _answer(question: str, message: str):
+    history = [ChatTurn(role="assistant", content=question)]
+    return main.run_assistant_pipeline("case", message, Mode.NOTIFICATION, conversation_history=history)
+
+
+def test_category_answer_is_checked_once(llm_calls):
+    question = (
+        f"Teraz kategoria: {CATEGORY_LABEL}. Napisz po prostu, co uważasz za ważne. "
+        "Możesz wspomnieć o rzeczach typu: PESEL poszkodowanego: jeśli go znasz."
+    )
+    _answer(question, "Było zimno i padał deszcz.")
+    assert llm_calls == [(CATEGORY_LABEL, "Było zimno i padał deszcz.")]
+
+
+def test_refusal_phrase_needs_no_llm(llm_calls):
+    response = _answer(f"Teraz kategoria: {CATEGORY_LABEL}.", "wolę nie mówić o tym za dużo, raczej tyle")
+    assert llm_calls == []
+    assert set(CATEGORY_FIELDS) <= set(response.memory.skipped_fields)
+
+
+def test_field_answer_is_checked_once(llm_calls):
+    _answer("Podaj proszę dane.\nNIP działalności: ", "muszę sprawdzić w papierach")
+    assert llm_calls == [("NIP działalności", "muszę sprawdzić w papierach")]
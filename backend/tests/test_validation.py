@@ -0,0 +1,71 @@
+"""Cyfry kontrolne PESEL/NIP/REGON i alerty `validate_case`."""
+
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from validation import nip_checksum_ok, pesel_birth_date, pesel_checksum_ok, regon_checksum_ok, validate_case
+
+TODAY = date(2024, 6, 1)
+
+
+def _state(**fields):
+    names = (
+        "pesel", "nip", "regon", "pkd", "address_home", "address_correspondence", "business_address",
+        "date_of_birth", "accident_date", "accident_time", "planned_work_start", "planned_work_end",
+    )
+    return SimpleNamespace(**{name: fields.get(name) for name in names})
+
+
+@pytest.mark.parametrize(("pesel", "ok"), [("44051401359", True), ("44051401358", False), ("02270803624", True)])
+def test_pesel_checksum(pesel, ok):
+    assert pesel_checksum_ok(pesel) is ok
+
+
+def test_pesel_birth_date_centuries():
+    assert pesel_birth_date("44051401359") == date(1944, 5, 14)
+    assert pesel_birth_date("02270803624") == date(2002, 7, 8)  # miesiąc + 20 -> XXI wiek
+    assert pesel_birth_date("44023101359") is None  # 31 lutego
+
+
+@pytest.mark.parametrize(
+    ("nip", "ok"),
+    [
+        ("1234563218", True),
+        ("5260250274", True),
+        ("1234563219", False),
+        ("1000000160", False),  # suma kontrolna 10 – takiego NIP-u nie ma
+    ],
+)
+def test_nip_checksum(nip, ok):
+    assert nip_checksum_ok(nip) is ok
+
+
+@pytest.mark.parametrize(
+    ("regon", "ok"),
+    [
+        ("123456785", True),
+        ("123456786", False),
+        ("12345678512347", True),
+        ("12345678512348", False),
+        ("12345678612347", False),  # 14 cyfr: pierwsze 9 też muszą się zgadzać
+    ],
+)
+def test_regon_checksum(regon, ok):
+    assert regon_checksum_ok(regon) is ok
+
+
+def test_validate_case_reports_checksums_and_formats():
+    alerts = validate_case(_state(pesel="44051401358", nip="123-456-32-19", regon="12345"), today=TODAY)
+    assert {(a.field, a.code) for a in alerts} == {("pesel", "checksum"), ("nip", "checksum"), ("regon", "format")}
+
+
+def test_validate_case_accepts_valid_identifiers():
+    state = _state(pesel="44051401359", nip="123-456-32-18", regon="123456785", date_of_birth="1944-05-14")
+    assert validate_case(state, today=TODAY) == []
+
+
+def test_validate_case_birth_date_mismatch():
+    alerts = validate_case(_state(pesel="44051401359", date_of_birth="1944-05-15"), today=TODAY)
+    assert [(a.field, a.code) for a in alerts] == [("date_of_birth", "pesel_mismatch")]
@@ -0,0 +1,200 @@
+"""
+Ewidencja zużycia tokenów (i kosztu) przez wywołania LLM.
+
+Każde wywołanie łańcucha z rejestru (`chains.py`) zapisuje liczbę tokenów
+promptu i odpowiedzi wraz z identyfikatorem sprawy (case_id), nazwą łańcucha
+i endpointem, z którego przyszło żądanie. Identyfikator sprawy i endpoint są
+przekazywane przez zmienne kontekstowe ustawiane w warstwie HTTP.
+Dane można odpytać zagregowane (per sprawa / łańcuch / endpoint) albo
+wyeksportować jako JSONL. Endpoint to szablon ścieżki (`/api/case/action-plan/{key}`),
+więc liczba endpointów i łańcuchów jest stała; sumy per sprawa trzymamy dla
+ZANT_USAGE_MAX_CASES ostatnio aktywnych spraw (starsze wypadają z agregatów).
+
+Przy pamięci współdzielonej (`shared_cache.py`, tryb wieloprocesowy) wpisy
+trafiają do niej zamiast do pamięci procesu, a sumy liczymy przy odpytaniu –
+każdy worker widzi wywołania wszystkich. Wpisy wygasają wtedy po ZANT_CACHE_TTL.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from shared_cache import SharedCache, shared_cache
+
+if TYPE_CHECKING:
+    from langchain_core.outputs import LLMResult
+
+UNKNOWN = "-"
+
+current_case_id: ContextVar[str] = ContextVar("zant_case_id", default=UNKNOWN)
+current_endpoint: ContextVar[str] = ContextVar("zant_endpoint", default=UNKNOWN)
+
+# Ile pojedynczych wpisów trzymamy w pamięci do eksportu.
+MAX_RECORDS = int(os.getenv("ZANT_USAGE_MAX_RECORDS", "100000"))
+# Dla ilu spraw (ostatnio aktywnych) trzymamy sumy per sprawa.
+MAX_CASES = int(os.getenv("ZANT_USAGE_MAX_CASES", "10000"))
+SHARED_NAMESPACE = "usage"
+
+
+def _price(env_name: str) -> float:
+    try:
+        return float(os.getenv(env_name, "0"))
+    except ValueError:
+        return 0.0
+
+
+# Ceny za milion tokenów (w dowolnej walucie); domyślnie 0 – liczymy same tokeny.
+PRICE_INPUT_PER_MTOK = _price("ZANT_LLM_PRICE_INPUT_PER_MTOK")
+PRICE_OUTPUT_PER_MTOK = _price("ZANT_LLM_PRICE_OUTPUT_PER_MTOK")
+
+
+@dataclass
+class UsageRecord:
+    timestamp: float
+    case_id: str
+    endpoint: str
+    chain: str
+    prompt_tokens: int
+    completion_tokens: int
+
+    @property
+    def cost(self) -> float:
+        return (
+            self.prompt_tokens * PRICE_INPUT_PER_MTOK
+            + self.completion_tokens * PRICE_OUTPUT_PER_MTOK
+        ) / 1_000_000
+
+
+def _empty_totals() -> dict[str, float]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+
+
+def _add(totals: dict[str, float], record: UsageRecord) -> None:
+    totals["calls"] += 1
+    totals["prompt_tokens"] += record.prompt_tokens
+    totals["completion_tokens"] += record.completion_tokens
+    totals["total_tokens"] += record.prompt_tokens + record.completion_tokens
+    totals["cost"] += record.cost
+
+
+class UsageLedger:
+    def __init__(
+        self, max_records: int = MAX_RECORDS, max_cases: int = MAX_CASES, shared: Optional[SharedCache] = None
+    ) -> None:
+        self._records: deque[UsageRecord] = deque(maxlen=max_records)
+        self._max_cases = max_cases
+        self._shared = shared
+        self._sequence = itertools.count()
+        self._by_case: OrderedDict[str, dict[str, float]] = OrderedDict()
+        self._by_case_chain: dict[str, dict[str, dict[str, float]]] = {}
+        self._by_chain: dict[str, dict[str, float]] = {}
+        self._by_endpoint: dict[str, dict[str, float]] = {}
+        self._totals = _empty_totals()
+        self._lock = threading.Lock()
+
+    def record(self, record: UsageRecord) -> None:
+        if self._shared is not None:
+            key = f"{os.getpid()}-{time.time_ns()}-{next(self._sequence)}"
+            self._shared.set_json(SHARED_NAMESPACE, key, asdict(record))
+            return
+        with self._lock:
+            self._records.append(record)
+            _add(self._totals, record)
+            _add(self._by_chain.setdefault(record.chain, _empty_totals()), record)
+            _add(self._by_endpoint.setdefault(record.endpoint, _empty_totals()), record)
+            _add(self._by_case.setdefault(record.case_id, _empty_totals()), record)
+            self._by_case.move_to_end(record.case_id)
+            per_case = self._by_case_chain.setdefault(record.case_id, {})
+            _add(per_case.setdefault(record.chain, _empty_totals()), record)
+            while len(self._by_case) > self._max_cases:
+                evicted, _ = self._by_case.popitem(last=False)
+                self._by_case_chain.pop(evicted, None)
+
+    def _shared_records(self) -> list[UsageRecord]:
+        return [UsageRecord(**json.loads(value)) for _, value in self._shared.items(SHARED_NAMESPACE)]
+
+    def summary(self, case_id: Optional[str] = None) -> dict[str, Any]:
+        if self._shared is not None:
+            # Sumy z wpisów wszystkich workerów – te same reguły agregacji co w pamięci.
+            ledger = UsageLedger(self._records.maxlen, self._max_cases)
+            for record in self._shared_records():
+                ledger.record(record)
+            return ledger.summary(case_id)
+        with self._lock:
+            if case_id is not None:
+                return {
+                    "case_id": case_id,
+                    "totals": dict(self._by_case.get(case_id, _empty_totals())),
+                    "by_chain": {
+                        k: dict(v) for k, v in self._by_case_chain.get(case_id, {}).items()
+                    },
+                }
+            return {
+                "totals": dict(self._totals),
+                "by_case": {k: dict(v) for k, v in self._by_case.items()},
+                "by_chain": {k: dict(v) for k, v in self._by_chain.items()},
+                "by_endpoint": {k: dict(v) for k, v in self._by_endpoint.items()},
+            }
+
+    def export_jsonl(self, case_id: Optional[str] = None) -> Iterator[str]:
+        if self._shared is not None:
+            records = self._shared_records()
+        else:
+            with self._lock:
+                records = list(self._records)
+        for record in records:
+            if case_id is not None and record.case_id != case_id:
+                continue
+            row = asdict(record)
+            row["cost"] = record.cost
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+LEDGER = UsageLedger(shared=shared_cache())
+
+
+def _token_counts(response: LLMResult) -> tuple[int, int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return int(token_usage.get("prompt_tokens", 0)), int(token_usage.get("completion_tokens", 0))
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Callback LangChain zapisujący zużycie tokenów jednego wywołania łańcucha.
+    Sprawę i endpoint odczytujemy przy tworzeniu handlera, czyli w wątku,
+    który wywołuje łańcuch (tam są ustawione zmienne kontekstowe).
+    """
+
+    def __init__(self, chain: str, ledger: UsageLedger = LEDGER) -> None:
+        self.chain = chain
+        self.ledger = ledger
+        self.case_id = current_case_id.get()
+        self.endpoint = current_endpoint.get()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = _token_counts(response)
+        self.ledger.record(
+            UsageRecord(
+                timestamp=time.time(),
+                case_id=self.case_id,
+                endpoint=self.endpoint,
+                chain=self.chain,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+            )
+        )
@@ -0,0 +1,273 @@
+"""
+Walidacja pól sprawy: formaty, cyfry kontrolne PESEL/NIP/REGON, kody PKD z klasyfikacji,
+data urodzenia zakodowana w PESEL-u, zakresy dat i zgodność kodu pocztowego z miejscowością.
+
+Działa bez LLM i bez I/O, w mikrosekundach na rekord – ten sam silnik obsługuje
+ostrzeżenia w rozmowie (`check_validation_of_fields`) i masową weryfikację
+rekordów (`POST /api/validation/bulk`).
+"""
+
+from __future__ import annotations
+
+import json
+import operator
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Collection, Iterator, Optional
+
+from addresses import expected_localities, parse_address
+from pkd import pkd_index
+
+# re.ASCII: cyfry spoza ASCII nie przechodzą (sumy kontrolne liczymy na bajtach).
+PESEL_REGEX = re.compile(r"^\d{11}$", re.ASCII)
+POSTAL_REGEX = re.compile(r"\d{2}-\d{3}")
+NIP_REGEX = re.compile(r"^\d{10}$", re.ASCII)
+REGON_REGEX = re.compile(r"^(\d{9}|\d{14})$", re.ASCII)
+PKD_REGEX = re.compile(r"^\d{2}\.\d{2}\.[A-Z]$", re.IGNORECASE)
+ISO_DATE_REGEX = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+PL_DATE_REGEX = re.compile(r"^(\d{1,2})[./-](\d{1,2})[./-](\d{4})$")
+TIME_REGEX = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+
+PESEL_WEIGHTS = (1, 3, 7, 9, 1, 3, 7, 9, 1, 3)
+NIP_WEIGHTS = (6, 5, 7, 2, 3, 4, 5, 6, 7)
+REGON9_WEIGHTS = (8, 9, 2, 3, 4, 5, 6, 7)
+REGON14_WEIGHTS = (2, 4, 8, 5, 0, 9, 7, 3, 6, 1, 2, 4, 8)
+# Przesunięcie miesiąca w PESEL-u -> stulecie urodzenia.
+PESEL_CENTURIES = {0: 1900, 20: 2000, 40: 2100, 60: 2200, 80: 1800}
+
+MIN_DATE = date(1900, 1, 1)
+
+
+@dataclass
+class ValidationAlert:
+    field: str
+    code: str
+    message: str
+
+    def as_dict(self) -> dict[str, str]:
+        return {"field": self.field, "code": self.code, "message": self.message}
+
+
+def _digits(value: str) -> str:
+    return value.replace(" ", "").replace("-", "")
+
+
+def _weighted_sum(digits: str, weights: tuple[int, ...]) -> int:
+    # Kody ASCII cyfr pomniejszone o 48 * suma wag – bez int() dla każdej cyfry.
+    return sum(map(operator.mul, digits.encode("ascii"), weights)) - 48 * sum(weights)
+
+
+def pesel_checksum_ok(pesel: str) -> bool:
+    return (10 - _weighted_sum(pesel, PESEL_WEIGHTS) % 10) % 10 == int(pesel[10])
+
+
+def pesel_birth_date(pesel: str) -> Optional[date]:
+    """Data urodzenia zakodowana w PESEL-u (None, jeśli taka data nie istnieje)."""
+    year, month, day = int(pesel[0:2]), int(pesel[2:4]), int(pesel[4:6])
+    offset = month - (month - 1) % 20 - 1 if month > 0 else -1
+    century = PESEL_CENTURIES.get(offset)
+    if century is None:
+        return None
+    try:
+        return date(century + year, month - offset, day)
+    except ValueError:
+        return None
+
+
+def nip_checksum_ok(nip: str) -> bool:
+    control = _weighted_sum(nip, NIP_WEIGHTS) % 11
+    return control != 10 and control == int(nip[9])
+
+
+def regon_checksum_ok(regon: str) -> bool:
+    weights = REGON9_WEIGHTS if len(regon) == 9 else REGON14_WEIGHTS
+    if len(regon) == 14 and not regon_checksum_ok(regon[:9]):
+        return False
+    return _weighted_sum(regon, weights) % 11 % 10 == int(regon[-1])
+
+
+def parse_date(value: str) -> Optional[date]:
+    """Data w formacie RRRR-MM-DD albo DD.MM.RRRR (także z / lub -)."""
+    value = value.strip()
+    match = ISO_DATE_REGEX.match(value)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = PL_DATE_REGEX.match(value)
+        if not match:
+            return None
+        day, month, year = match.groups()
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def _parse_time(value: str) -> Optional[int]:
+    """Godzina HH:MM (lub HH.MM) w minutach od północy."""
+    match = TIME_REGEX.match(value.strip())
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else None
+
+
+def _check_date(
+    alerts: list[ValidationAlert], field: str, label: str, value: Optional[str], today: date
+) -> Optional[date]:
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        alerts.append(ValidationAlert(field, "date_format", f"{label}: podaj datę w formacie RRRR-MM-DD."))
+    elif parsed > today:
+        alerts.append(ValidationAlert(field, "date_future", f"{label} nie może być z przyszłości."))
+    elif parsed < MIN_DATE:
+        alerts.append(ValidationAlert(field, "date_range", f"{label} jest wcześniejsza niż {MIN_DATE.year} r."))
+    else:
+        return parsed
+    return None
+
+
+def validate_case(state: Any, today: Optional[date] = None) -> list[ValidationAlert]:
+    """
+    Sprawdza pola stanu sprawy (obiekt z atrybutami jak `CaseState`).
+    Zwraca listę alertów; pusta lista oznacza brak zastrzeżeń.
+    """
+    today = today or date.today()
+    alerts: list[ValidationAlert] = []
+
+    pesel_date: Optional[date] = None
+    if state.pesel:
+        pesel = state.pesel.strip()
+        if not PESEL_REGEX.match(pesel):
+            alerts.append(ValidationAlert("pesel", "format", "PESEL musi mieć dokładnie 11 cyfr."))
+        elif not pesel_checksum_ok(pesel):
+            alerts.append(ValidationAlert("pesel", "checksum", "PESEL ma niepoprawną cyfrę kontrolną."))
+        else:
+            pesel_date = pesel_birth_date(pesel)
+            if pesel_date is None:
+                alerts.append(ValidationAlert("pesel", "birth_date", "PESEL koduje nieistniejącą datę urodzenia."))
+            elif pesel_date > today:
+                alerts.append(ValidationAlert("pesel", "birth_date", "PESEL koduje datę urodzenia z przyszłości."))
+
+    if state.nip:
+        nip = _digits(state.nip)
+        if not NIP_REGEX.match(nip):
+            alerts.append(ValidationAlert("nip", "format", "NIP powinien zawierać 10 cyfr (bez spacji i kresek)."))
+        elif not nip_checksum_ok(nip):
+            alerts.append(ValidationAlert("nip", "checksum", "NIP ma niepoprawną cyfrę kontrolną."))
+
+    if state.regon:
+        regon = _digits(state.regon)
+        if not REGON_REGEX.match(regon):
+            alerts.append(ValidationAlert("regon", "format", "REGON powinien mieć 9 lub 14 cyfr."))
+        elif not regon_checksum_ok(regon):
+            alerts.append(ValidationAlert("regon", "checksum", "REGON ma niepoprawną cyfrę kontrolną."))
+
+    if state.pkd:
+        pkd = state.pkd.strip().upper()
+        if not PKD_REGEX.match(pkd):
+            alerts.append(ValidationAlert("pkd", "format", "PKD wpisz w formacie 00.00.X (np. 62.01.Z)."))
+        elif len(index := pkd_index()) and index.get(pkd) is None:
+            alerts.append(ValidationAlert("pkd", "unknown", f"Kodu {pkd} nie ma w klasyfikacji PKD."))
+
+    if state.address_home and not POSTAL_REGEX.search(state.address_home):
+        alerts.append(ValidationAlert(
+            "address_home", "postal_code", "Adres zamieszkania powinien zawierać kod pocztowy w formacie 00-000."
+        ))
+
+    for field, label in (
+        ("address_home", "Adres zamieszkania"),
+        ("address_correspondence", "Adres do korespondencji"),
+        ("business_address", "Adres działalności"),
+    ):
+        value = getattr(state, field, None)
+        if not value:
+            continue
+        parsed = parse_address(value)
+        expected = expected_localities(parsed)
+        if expected:
+            alerts.append(ValidationAlert(
+                field, "postal_city",
+                f"{label}: kod {parsed.postal_code} nie pasuje do miejscowości {parsed.city} "
+                f"(oczekiwano: {', '.join(expected)}).",
+            ))
+
+    birth = _check_date(alerts, "date_of_birth", "Data urodzenia", state.date_of_birth, today)
+    if birth and pesel_date and birth != pesel_date:
+        alerts.append(ValidationAlert(
+            "date_of_birth", "pesel_mismatch",
+            f"Data urodzenia ({birth.isoformat()}) nie zgadza się z PESEL-em ({pesel_date.isoformat()}).",
+        ))
+
+    accident = _check_date(alerts, "accident_date", "Data wypadku", state.accident_date, today)
+    born = birth or pesel_date
+    if accident and born and accident < born:
+        alerts.append(ValidationAlert("accident_date", "date_range", "Data wypadku jest wcześniejsza niż data urodzenia."))
+
+    times: dict[str, Optional[int]] = {}
+    for field, label in (
+        ("accident_time", "Godzina wypadku"),
+        ("planned_work_start", "Planowana godzina rozpoczęcia pracy"),
+        ("planned_work_end", "Planowana godzina zakończenia pracy"),
+    ):
+        value = getattr(state, field)
+        if value:
+            times[field] = _parse_time(value)
+            if times[field] is None:
+                alerts.append(ValidationAlert(field, "time_format", f"{label}: podaj godzinę w formacie GG:MM."))
+    start, end = times.get("planned_work_start"), times.get("planned_work_end")
+    if start is not None and end is not None and start == end:
+        alerts.append(ValidationAlert(
+            "planned_work_end", "time_range", "Planowane godziny rozpoczęcia i zakończenia pracy są takie same."
+        ))
+
+    return alerts
+
+
+@dataclass
+class _LineError:
+    message: str
+
+
+def iter_records(
+    body: bytes, fields: Collection[str] = ()
+) -> Iterator[tuple[Optional[str], Optional[dict], Optional[str]]]:
+    """
+    Rekordy z treści żądania masowego: tablica JSON albo JSONL (rekord na wiersz).
+    Rekord to `CaseState` (opcjonalnie z polem `case_id`) albo
+    `{"case_id": ..., "case_state": {...}}`. Zwraca (case_id, dane, błąd rekordu);
+    niepoprawna tablica JSON to błąd całego żądania (ValueError).
+    `fields` to nazwy pól CaseState – rekord bez żadnego z nich (np. same literówki
+    w kluczach) jest błędny, zamiast przejść jako pusta, poprawna sprawa.
+    """
+    if body.lstrip().startswith(b"["):
+        try:
+            items = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Niepoprawna tablica JSON: {e}") from e
+    else:
+        items = _iter_jsonl(body)
+
+    for item in items:
+        if isinstance(item, _LineError):
+            yield None, None, item.message
+        elif not isinstance(item, dict):
+            yield None, None, "Rekord nie jest obiektem JSON."
+        elif "case_state" in item and not isinstance(item["case_state"], dict):
+            yield item.get("case_id"), None, "Pole case_state nie jest obiektem JSON."
+        else:
+            data = item["case_state"] if "case_state" in item else item
+            if fields and not any(name in data for name in fields):
+                yield item.get("case_id"), None, "Rekord nie zawiera żadnego pola CaseState."
+            else:
+                yield item.get("case_id"), data, None
+
+
+def _iter_jsonl(body: bytes) -> Iterator[Any]:
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield _LineError(f"Niepoprawny JSON: {e}")
@@ -0,0 +1,111 @@
+"""
+Rozgrzewka procesu przy starcie i stan gotowości (`GET /ready`).
+
+Ciężkie zależności (klient Gemini, fpdf/fontTools, pypdf, pytesseract) są
+importowane dopiero przy pierwszym użyciu, więc `import main` jest szybki.
+Rozgrzewka ładuje je z wyprzedzeniem razem z szablonami, czcionkami, indeksami
+i klientami LLM. Tryb wybiera ZANT_WARMUP:
+
+- "1" (domyślnie) – rozgrzewka przed przyjęciem pierwszego żądania,
+- "background" – serwer przyjmuje żądania od razu, rozgrzewka idzie w wątku
+  w tle, a `/ready` zwraca 503 do jej zakończenia (sonda gotowości kontenera),
+- "0" – bez rozgrzewki, wszystko ładowane przy pierwszym użyciu.
+
+Błąd pojedynczego kroku (np. brak binarki tesseract) nie blokuje gotowości –
+jest raportowany w `/ready`, a funkcja działa dalej w trybie zastępczym.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+from metrics import WARMUP_DURATION
+
+WARMUP_SYNC = "1"
+WARMUP_BACKGROUND = "background"
+WARMUP_OFF = "0"
+WARMUP_MODE = os.getenv("ZANT_WARMUP", WARMUP_SYNC).strip().lower()
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_READY = "ready"
+STATUS_SKIPPED = "skipped"
+
+WarmUpStep = tuple[str, Callable[[], object]]
+
+# Punkt odniesienia dla czasu zimnego startu (moduł importuje się na początku `main`).
+_PROCESS_T0 = time.perf_counter()
+
+
+@dataclass
+class StepResult:
+    name: str
+    seconds: float
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "seconds": round(self.seconds, 4), "error": self.error}
+
+
+class WarmUp:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.mode = WARMUP_MODE
+        self.status = STATUS_PENDING
+        self.steps: list[StepResult] = []
+        self.ready_after: Optional[float] = None  # sekundy od importu do gotowości
+
+    @property
+    def ready(self) -> bool:
+        return self.status in (STATUS_READY, STATUS_SKIPPED)
+
+    def _finish(self, status: str) -> None:
+        with self._lock:
+            self.status = status
+            self.ready_after = time.perf_counter() - _PROCESS_T0
+
+    def run(self, steps: Sequence[WarmUpStep]) -> None:
+        """Wykonuje kroki po kolei; wyjątek kroku jest zapisywany, a rozgrzewka idzie dalej."""
+        with self._lock:
+            self.status = STATUS_RUNNING
+        for name, func in steps:
+            start = time.perf_counter()
+            error = None
+            try:
+                func()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"Rozgrzewka: krok {name} nieudany: {error}")
+            result = StepResult(name, time.perf_counter() - start, error)
+            WARMUP_DURATION.set(result.seconds, step=name)
+            with self._lock:
+                self.steps.append(result)
+        self._finish(STATUS_READY)
+
+    def start(self, steps: Sequence[WarmUpStep]) -> Optional[threading.Thread]:
+        """Uruchamia rozgrzewkę zgodnie z ZANT_WARMUP; w trybie "background" zwraca wątek."""
+        if self.mode == WARMUP_OFF:
+            self._finish(STATUS_SKIPPED)
+            return None
+        if self.mode == WARMUP_BACKGROUND:
+            thread = threading.Thread(target=self.run, args=(list(steps),), name="zant-warmup", daemon=True)
+            thread.start()
+            return thread
+        self.run(steps)
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "status": self.status,
+                "mode": self.mode,
+                "ready_after_s": round(self.ready_after, 4) if self.ready_after is not None else None,
+                "steps": [step.as_dict() for step in self.steps],
+            }
+
+
+state = WarmUp()
@@ -0,0 +1,85 @@
+"""
+Metryki wszystkich workerów w każdym `/metrics`.
+
+Przy kilku procesach roboczych (`serve.py`) każde odpytanie Prometheusa trafia
+do losowego workera, a liczniki są w pamięci procesu. Dlatego każdy worker co
+ZANT_METRICS_SYNC_S sekund zapisuje migawkę swojego rejestru do pamięci
+współdzielonej (`shared_cache.py`, przestrzeń "metrics"), a `/metrics` łączy
+własne bieżące wartości z migawkami pozostałych (`MetricsRegistry.render`).
+
+Migawki są kluczowane generacją serwera (ZANT_METRICS_GENERATION, ustawiana
+przez proces główny `serve.py`) – po restarcie liczniki poprzedniego serwera
+nie są doliczane, a liczniki workera, który padł i został zastąpiony, tak.
+Wskaźniki (np. wywołania LLM w toku) bierzemy tylko z migawek nie starszych
+niż trzy okresy synchronizacji. Wartości innych workerów mogą się spóźniać
+o jeden okres.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from metrics import REGISTRY, MetricsRegistry
+from shared_cache import shared_cache
+
+NAMESPACE = "metrics"
+SYNC_INTERVAL_S = float(os.getenv("ZANT_METRICS_SYNC_S", "5"))
+# Bez serve.py (np. `uvicorn main:app`) generacja to sam proces.
+GENERATION = os.getenv("ZANT_METRICS_GENERATION") or f"{os.getpid()}-{time.time_ns()}"
+
+_started: Optional[str] = None
+_lock = threading.Lock()
+
+
+def _worker_key() -> str:
+    # PID może zostać użyty ponownie przez nowego workera – dokładamy czas startu.
+    return f"{GENERATION}:{os.getpid()}-{_started}"
+
+
+def publish(registry: MetricsRegistry = REGISTRY) -> None:
+    """Zapisuje migawkę rejestru tego procesu."""
+    shared = shared_cache()
+    if shared is None or _started is None:
+        return
+    shared.set_json(NAMESPACE, _worker_key(), {"at": time.time(), "metrics": registry.snapshot()})
+
+
+def _loop() -> None:
+    while True:
+        time.sleep(SYNC_INTERVAL_S)
+        publish()
+
+
+def start() -> None:
+    """Uruchamia okresowy zapis migawek (raz na proces, tylko z pamięcią współdzieloną)."""
+    global _started
+    if shared_cache() is None:
+        return
+    with _lock:
+        if _started is not None:
+            return
+        _started = str(time.time_ns())
+    publish()
+    threading.Thread(target=_loop, name="zant-metrics-sync", daemon=True).start()
+
+
+def render(registry: MetricsRegistry = REGISTRY) -> str:
+    """Tekst `/metrics`: ten proces + migawki pozostałych workerów tej generacji."""
+    shared = shared_cache()
+    if shared is None or _started is None:
+        return registry.render()
+    prefix, own = f"{GENERATION}:", _worker_key()
+    fresh_after = time.time() - 3 * SYNC_INTERVAL_S
+    others, live = [], []
+    for key, value in shared.items(NAMESPACE):
+        if not key.startswith(prefix) or key == own:
+            continue
+        snapshot = json.loads(value)
+        others.append(snapshot["metrics"])
+        if snapshot["at"] >= fresh_after:
+            live.append(snapshot["metrics"])
+    return registry.render(others, live)
@@ -0,0 +1,68 @@
+"""
+Strumieniowe pakowanie paczki dokumentów do ZIP.
+
+Każdy wpis jest dopisywany do archiwum i wysyłany do klienta, gdy tylko
+dokument jest gotowy – nie budujemy całego ZIP-a w pamięci. `zipfile` pisze
+do nieprzewijalnego ujścia (z deskryptorami danych), a my po każdym wpisie
+oddajemy zebrane bajty. Formaty już skompresowane (PDF, DOCX) zapisujemy
+bez ponownej kompresji (ZIP_STORED).
+"""
+
+from __future__ import annotations
+
+import io
+import time
+import zipfile
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from metrics import STAGE_DURATION
+
+STORED_SUFFIXES: tuple[str, ...] = (".pdf", ".docx", ".xlsx", ".zip", ".png", ".jpg", ".jpeg")
+
+
+def compression_for(filename: str) -> int:
+    return zipfile.ZIP_STORED if filename.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+
+
+class _ChunkSink(io.RawIOBase):
+    """Nieprzewijalne ujście zbierające bajty do oddania przy najbliższym `drain()`."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(
+    entries: AsyncIterable[tuple[str, io.BytesIO | bytes]],
+    stage: Optional[str] = "zip_packing",
+) -> AsyncIterator[bytes]:
+    """
+    Zamienia strumień (nazwa pliku, zawartość) na strumień bajtów archiwum ZIP.
+    Archiwum nie jest składane w pamięci – bufor ujścia mieści najwyżej bieżący wpis.
+    """
+    sink = _ChunkSink()
+    packing = 0.0
+    with zipfile.ZipFile(sink, "w") as archive:
+        async for filename, content in entries:
+            start = time.perf_counter()
+            data = content.getvalue() if isinstance(content, io.BytesIO) else content
+            archive.writestr(filename, data, compress_type=compression_for(filename))
+            packing += time.perf_counter() - start
+            yield sink.drain()
+    # Katalog centralny jest zapisywany przy zamknięciu archiwum.
+    tail = sink.drain()
+    if stage:
+        STAGE_DURATION.observe(packing, stage=stage)
+    if tail:
+        yield tail